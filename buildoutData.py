@@ -0,0 +1,161 @@
+'''
+Buildout Data
+
+Reads the Lyme Common Buildout Data text (Lyme Common Buildout Data-2020.txt,
+copied out of the buildout report PDF) into one typed row per parcel,
+keyed by Map and Lot, so it can be joined to the scraped MBLU.
+This replaces TweakBuildoutColumns.sh (a sed for each column name, run on every line).
+
+Each parcel in the text is four lines - a heading and values for the
+lot, then a heading and values for the ratings:
+
+    Map Lot Max Lot Coverag RoadFrontage Lot Coverage ParcelArea
+    201 109.1 6,000.00 460 7,232.00 80,360.00
+    Overall Rating  Septic GPD Rating  Max Lot Cov Rating ... New Units  Conversion Units
+    0 2 5 3 3 4 0 0
+
+with page footers ("Wednesday, February 12, 2020 Page 1 of 26") and blank
+lines in between, and tabs or spaces between the values. The column names
+lose their spaces (and "Max Lot Coverag" its missing "e"), as the shell script did.
+
+With --scrape ScrapeDataXX.tsv, each row also gets the PID of the parcel
+with that Map and Lot ("109.1" matches "109-1" and "109.1").
+
+Usage:
+    python buildoutData.py -i "Lyme Common Buildout Data-2020.txt" -o Buildout.tsv [--scrape ScrapeDataXX.tsv]
+'''
+
+import sys
+import argparse
+import re
+
+from parcelStore import readRun
+
+# The column names of the text, and what we call them (TweakBuildoutColumns.sh's seds)
+columnRenames = [
+    ["Max Lot Coverag", "MaxLotCoverage"],
+    ["Lot Coverage", "LotCoverage"],
+    ["Overall Rating", "OverallRating"],
+    ["Septic GPD Rating", "SepticGPDRating"],
+    ["Max Lot Cov Rating", "MaxLotCovRating"],
+    ["Road Frontage Rating", "RoadFrontageRating"],
+    ["Used Lot Cov Rating", "UsedLotCovRating"],
+    ["Parcel Area Rating", "ParcelAreaRating"],
+    ["New Units", "NewUnits"],
+    ["Conversion Units", "ConversionUnits"],
+]
+renamePattern = re.compile("|".join(re.escape(old) for old, new in columnRenames))
+renames = dict(columnRenames)
+textColumns = ["Map", "Lot"]
+lotHeading = "Map Lot"
+ratingHeading = "Overall Rating"
+
+
+def renameColumns(line):
+    return renamePattern.sub(lambda m: renames[m.group()], line)
+
+
+'''
+typedValue() - "6,000.00" -> 6000.0, "460" -> 460, "" -> None
+'''
+def typedValue(text):
+    text = text.replace(",", "")
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+'''
+lotKey() - Map and Lot as they'd match the scraped Map/Lot: "201", "109.1" -> "201/109-1"
+'''
+def lotKey(theMap, lot):
+    parts = []
+    for part in [theMap, lot]:
+        part = re.sub(r"[.\-\s]+", "-", str(part).strip().upper())
+        parts.append("-".join(p.lstrip("0") or "0" for p in part.split("-")))
+    return "/".join(parts)
+
+
+'''
+readBuildout() - yield a {column: value} dict for each parcel in the lines of the text
+A parcel is complete once its rating values have been read.
+'''
+def readBuildout(lines):
+    columns = None
+    row = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(lotHeading) or line.startswith(ratingHeading):
+            columns = renameColumns(line).split()
+            if line.startswith(lotHeading):
+                row = {}
+            continue
+        if columns is None or row is None:     # the title, or a page footer
+            continue
+        values = line.split()
+        if len(values) != len(columns):
+            continue
+        for name, value in zip(columns, values):
+            row[name] = value if name in textColumns else typedValue(value)
+        if columns[0] == renames["Overall Rating"]:
+            yield row
+            row = None
+        columns = None
+
+
+'''
+pidsByLot() - {lotKey: PID} from a ScrapeDataXX.tsv (with Map and Lot columns)
+'''
+def pidsByLot(fileName):
+    return {lotKey(values.get("Map", ""), values.get("Lot", "")): str(pid)
+            for pid, values in readRun(fileName).items()}
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-i", '--infile', nargs='?',
+                            type=argparse.FileType('rt', encoding='utf-8-sig'), default=sys.stdin)
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--scrape', metavar="TSV",
+                            help="ScrapeDataXX.tsv, to add each parcel's PID")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+    pids = pidsByLot(theArgs.scrape) if theArgs.scrape else None
+    heading = None
+    count = matched = 0
+    for row in readBuildout(theArgs.infile):
+        if pids is not None:
+            row["PID"] = pids.get(lotKey(row["Map"], row["Lot"]), "")
+            matched += row["PID"] != ""
+        if heading is None:
+            heading = list(row)
+            print("\t".join(heading), file=fo)
+        print("\t".join("" if row.get(name) is None else str(row.get(name)) for name in heading), file=fo)
+        count += 1
+    print("%d parcels%s" % (count, "" if pids is None else ", %d matched to a PID" % matched), file=fe)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+'''
+Deed Priority
+
+Decide which parcels to refresh first, from recent Registry of Deeds activity.
+
+Sales and transfers are what change the owner history (and often the
+assessment), so instead of sweeping all ~1,080 parcels in PID order,
+take the recent AVA transactions (the AVA_Records_*.tsv files that
+scrapeAVA.py writes) and find the parcels they touch, using the last
+scrape's OwnerHistory.tsv:
+
+- Book&Page - a transaction (or one of its associated documents)
+  whose book and page already appear in a parcel's owner history
+- Parties - a grantor/grantee whose name matches a parcel's current owner
+  (same surname plus at least one given name, ignoring TR, TRUST, ETA, ...)
+
+The output is a list of PIDs for "scrapevgsi.py --pids", one per line,
+with the reason as a comment. --mode chooses what follows the deed PIDs:
+
+- only  - nothing: just the parcels with recent deeds
+- first - then every other known parcel (a full sweep, deeds first)
+- cycle - then the next --rest parcels of the town, picking up where the
+  previous run left off (--state file), so the rest of the town is
+  refreshed on a slower cycle
+
+Usage:
+    python deedPriority.py -a AVA-GCRoD/AVA_Records_2023-08-09_08-21-42.tsv \\
+        --history OwnerHistory.tsv --since 2023-07-01 -o pids.txt
+    python scrapevgsi.py --pids pids.txt
+'''
+
+import sys
+import argparse
+import csv
+import os
+import re
+from datetime import datetime, date
+
+stopWords = {"AND", "&", "TR", "TRS", "TRUST", "TRUSTS", "TRUSTEE", "TRUSTEES", "TTE", "TTES",
+             "REVOCABLE", "REV", "IRREVOCABLE", "LIVING", "FAMILY", "EXEMPT", "ETA", "ETAL",
+             "ET", "AL", "ETUX", "UX", "LLC", "INC", "CO", "CORP", "THE", "OF", "ESTATE",
+             "EST", "JR", "SR", "II", "III", "IV", "MR", "MRS", "DR"}
+namePattern = re.compile(r"[A-Z][A-Z'\-]*")
+bookPagePattern = re.compile(r"B:\s*(\d+)\s+P:\s*(\d+)")
+defaultTypes = "DEED"
+
+'''
+nameTokens() - the significant words of a name, upper case
+"BROWN, RICHARD AND LIN TTE'S" -> ["BROWN", "RICHARD", "LIN"]
+'''
+def nameTokens(name):
+    result = []
+    for word in namePattern.findall(name.upper()):
+        if word.endswith("'S"):
+            word = word[:-2]
+        word = word.strip("'-")
+        if word and word not in stopWords and len(word) > 1:
+            result.append(word)
+    return result
+
+
+'''
+ownerKey() - split a Vision owner ("SURNAME, GIVEN NAMES") into
+[surname, set of given names]. Owners without a comma (the town, a company)
+give [first word, set of the remaining words].
+'''
+def ownerKey(owner):
+    if "," in owner:
+        surname, given = owner.split(",", 1)
+        surnameTokens = nameTokens(surname)
+        if surnameTokens:
+            return [surnameTokens[-1], set(nameTokens(given)) | set(surnameTokens[:-1])]
+    tokens = nameTokens(owner)
+    if not tokens:
+        return None
+    return [tokens[0], set(tokens[1:])]
+
+
+def toInt(val):
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def avaDate(text):
+    try:
+        return datetime.strptime(text.strip(), "%m/%d/%Y").date()
+    except (AttributeError, ValueError):
+        return None
+
+
+'''
+readTsv() - the rows of a tab-delimited file (with a heading line) as dictionaries
+'''
+def readTsv(fileName):
+    with open(fileName, "rt", encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE))
+
+
+'''
+readTransactions() - the AVA transactions of the given types, since a date
+Return a list of dictionaries (the AVA columns, plus "date")
+'''
+def readTransactions(fileNames, types=defaultTypes, since=None):
+    wanted = [t.strip().upper() for t in types.split(",") if t.strip()]
+    result = []
+    for fileName in fileNames:
+        for row in readTsv(fileName):
+            kind = (row.get("Type") or "").upper()
+            if wanted and not any(t in kind for t in wanted):
+                continue
+            row["date"] = avaDate(row.get("Date") or "")
+            if since and (row["date"] is None or row["date"] < since):
+                continue
+            result.append(row)
+    return result
+
+
+'''
+OwnerIndex - look up parcels by Book&Page and by current owner,
+built from a scrape's OwnerHistory.tsv
+'''
+
+
+class OwnerIndex:
+    def __init__(self, historyRows):
+        self.byBookPage = {}
+        self.bySurname = {}
+        self.pids = []
+        current = {}
+        for row in historyRows:
+            pid = row.get("PID", "")
+            if not pid:
+                continue
+            if pid not in current:
+                self.pids.append(pid)
+            key = (toInt(row.get("Book")), toInt(row.get("Page")))
+            if None not in key:
+                self.byBookPage.setdefault(key, set()).add(pid)
+            saleDate = row.get("Sale Date") or ""
+            if pid not in current or saleDate > current[pid][0]:
+                current[pid] = [saleDate, row.get("Owner") or ""]
+        for pid, [saleDate, owner] in current.items():
+            key = ownerKey(owner)
+            if key:
+                self.bySurname.setdefault(key[0], []).append([pid, key[1], owner])
+
+    def matchBookPage(self, book, page):
+        return self.byBookPage.get((toInt(book), toInt(page)), set())
+
+    '''
+    matchParty() - the [PID, owner] pairs whose current owner is named in "party"
+    '''
+    def matchParty(self, party):
+        tokens = set(nameTokens(party))
+        result = []
+        for surname in tokens:
+            for pid, given, owner in self.bySurname.get(surname, []):
+                if not given or given & tokens:
+                    result.append([pid, owner])
+        return result
+
+
+'''
+priorityPIDs() - the PIDs touched by the transactions, most recent first
+Return a list of [PID, reason]
+'''
+def priorityPIDs(transactions, index):
+    transactions = sorted(transactions, key=lambda t: t["date"] or date.min, reverse=True)
+    result = []
+    seen = set()
+
+    def add(pid, reason):
+        if pid not in seen:
+            seen.add(pid)
+            result.append([pid, reason])
+
+    for t in transactions:
+        what = "%s %s %s" % (t.get("Date", ""), t.get("Type", ""), t.get("Book&Page", ""))
+        books = [[t.get("Book"), t.get("Page")]]
+        books.extend(bookPagePattern.findall(t.get("Assoc. Docs") or ""))
+        for book, page in books:
+            for pid in sorted(index.matchBookPage(book, page), key=toInt):
+                add(pid, "%s: Book&Page %s/%s" % (what, book, page))
+        for column in ["Party1", "Party2"]:
+            for pid, owner in index.matchParty(t.get(column) or ""):
+                add(pid, "%s: %s matches %s" % (what, column, owner))
+    return result
+
+
+'''
+restOfTown() - the known PIDs that aren't already in the list, in PID order
+With "count", only the next "count" of them after the cursor saved in
+"stateFile" (and the cursor moves on, wrapping around at the end)
+'''
+def restOfTown(index, exclude, count=None, stateFile=None):
+    rest = sorted([p for p in index.pids if p not in exclude], key=toInt)
+    if count is None or not rest:
+        return rest
+    cursor = 0
+    if stateFile and os.path.exists(stateFile):
+        with open(stateFile, "rt") as f:
+            cursor = toInt(f.read().strip()) or 0
+    after = [p for p in rest if toInt(p) > cursor]
+    chosen = (after + [p for p in rest if toInt(p) <= cursor])[:count]
+    if stateFile and chosen:
+        with open(stateFile, "wt") as f:
+            print(chosen[-1], file=f)
+    return chosen
+
+
+'''
+Main Function
+
+Parse arguments
+Read the transactions and the owner history
+Print the PIDs to refresh, deeds first
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-a", '--ava', nargs='+', required=True, metavar="TSV",
+                            help="AVA_Records_*.tsv file(s) from scrapeAVA.py")
+        parser.add_argument('--history', default="OwnerHistory.tsv",
+                            help="OwnerHistory.tsv from the last scrape")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--since', type=date.fromisoformat, metavar="YYYY-MM-DD",
+                            help="Only transactions recorded on or after this date")
+        parser.add_argument('--types', default=defaultTypes,
+                            help="Transaction types to use, comma-separated (default: anything with DEED)")
+        parser.add_argument('--mode', choices=["only", "first", "cycle"], default="only")
+        parser.add_argument('--rest', type=int, default=100, metavar="N",
+                            help="With --mode cycle, how many other parcels to add each run")
+        parser.add_argument('--state', default="DeedPriorityState.txt",
+                            help="With --mode cycle, where to remember the last parcel refreshed")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+    index = OwnerIndex(readTsv(theArgs.history))
+    transactions = readTransactions(theArgs.ava, theArgs.types, theArgs.since)
+    priority = priorityPIDs(transactions, index)
+    print("%d transactions touch %d parcels" % (len(transactions), len(priority)), file=fe)
+
+    print("# PID\tReason", file=fo)
+    for pid, reason in priority:
+        print("%s\t# %s" % (pid, reason), file=fo)
+    if theArgs.mode == "only":
+        return
+    exclude = set(pid for pid, reason in priority)
+    if theArgs.mode == "first":
+        rest = restOfTown(index, exclude)
+    else:
+        rest = restOfTown(index, exclude, theArgs.rest, theArgs.state)
+    for pid in rest:
+        print(pid, file=fo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
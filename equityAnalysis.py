@@ -0,0 +1,231 @@
+'''
+Equity Analysis
+
+Are comparable properties assessed alike? From a scrape's files, this
+compares each parcel's
+- assessed improvement value per square foot of living area
+  (Curr. Ass. Imp / the Living Area of all its buildings), and
+- assessed land value per acre (Curr. Ass. Land / Lot Size (acres))
+with the other parcels in its group, and lists the ones furthest out.
+
+Groups (--by-sqft, --by-acre) are columns of ScrapeDataXX.tsv, plus
+"Acre Band" (lot size: under 1, 1-2, 2-5, 5-10, 10-25, 25+ acres), since
+land value per acre falls as lots get bigger, and "Town" (the name of
+the directory the files came from, so several towns can be compared
+in one run, e.g. the Towns/* directories of townScraper.py).
+
+Each parcel's robust z-score is 0.6745 * (value - group median) / group MAD
+(median absolute deviation), which a few extreme parcels can't distort
+the way they distort a mean and standard deviation. Parcels with |z| over
+--z (default 3.5) in a group of at least --min-group parcels are outliers.
+
+Buildings___.tsv is summed per parcel (Living Area, Gross Floor Area,
+Replacement Cost); Year Built is that of the largest building.
+Everything is done with NumPy/pandas column operations, so several towns
+take a second or two.
+
+Usage:
+    python equityAnalysis.py [DIR ...] -o Outliers.tsv [--groups Groups.tsv]
+    python equityAnalysis.py Towns/* --by-sqft "Town,Neighborhood,Land Use Code"
+'''
+
+import sys
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from salesRatio import readTable, toNumbers
+from parcelStore import fillerPattern
+from vgsiRecords import outputFiles
+
+parcelFile = dict(outputFiles)["parcel"]
+buildingsFile = dict(outputFiles)["buildings"]
+acreBands = [0, 1, 2, 5, 10, 25, np.inf]
+acreLabels = ["<1", "1-2", "2-5", "5-10", "10-25", "25+"]
+measures = [
+    # [measure, value column, groups argument]
+    ["$/sqft", "Imp per Sqft", "by_sqft"],
+    ["$/acre", "Land per Acre", "by_acre"],
+]
+outlierColumns = ["Measure", "Town", "PID", "Group", "Value", "Group N", "Group Median", "z",
+                  "Assessment", "Living Area", "Lot Size (acres)", "Year Built"]
+groupSummaryColumns = ["Measure", "Group", "N", "P10", "P25", "Median", "P75", "P90", "MAD"]
+
+
+def column(df, names):
+    for name in names:
+        if name in df:
+            return toNumbers(df[name])
+    return pd.Series(np.nan, index=df.index)
+
+
+'''
+readParcels() - one row per parcel of a scrape directory, with its buildings summed
+'''
+def readParcels(directory):
+    scrape = readTable(os.path.join(directory, parcelFile))
+    scrape = scrape[~scrape.iloc[:, 1].str.contains(fillerPattern)]
+    parcels = pd.DataFrame({
+        "PID": toNumbers(scrape["PID"]),
+        "Assessment": column(scrape, ["Assessment"]),
+        "Land": column(scrape, ["Curr. Ass. Land", "LandAsmt"]),
+        "Improvements": column(scrape, ["Curr. Ass. Imp"]),
+        "Lot Size (acres)": column(scrape, ["Lot Size (acres)"]),
+    })
+    missing = parcels["Improvements"].isna()
+    parcels.loc[missing, "Improvements"] = parcels["Assessment"] - parcels["Land"]
+    for name in scrape.columns:
+        if name not in parcels and not name.startswith(("Curr.", "Prev.")):
+            parcels[name] = scrape[name].str.strip()
+    parcels["Town"] = os.path.basename(os.path.normpath(os.path.abspath(directory)))
+    parcels = parcels.dropna(subset=["PID"]).astype({"PID": np.int64})
+    parcels = parcels.drop_duplicates("PID", keep="last")
+
+    buildingsName = os.path.join(directory, buildingsFile)
+    if os.path.exists(buildingsName):
+        buildings = readTable(buildingsName)
+        b = pd.DataFrame({
+            "PID": toNumbers(buildings["PID"]),
+            "Building": buildings["Building #"].str.strip() if "Building #" in buildings else "",
+            "Living Area": column(buildings, ["Living Area"]),
+            "Gross Floor Area": column(buildings, ["Gross Floor Area"]),
+            "Replacement Cost": column(buildings, ["Replacement Cost"]),
+            "Year Built": column(buildings, ["Year Built"]),
+        }).dropna(subset=["PID"]).astype({"PID": np.int64})
+        b = b.drop_duplicates(["PID", "Building"], keep="last")
+        sums = b.groupby("PID")[["Living Area", "Gross Floor Area", "Replacement Cost"]].sum(min_count=1)
+        largest = b.sort_values("Living Area", ascending=False).drop_duplicates("PID")
+        sums["Year Built"] = largest.set_index("PID")["Year Built"]
+        parcels = parcels.merge(sums, left_on="PID", right_index=True, how="left")
+    else:
+        for name in ["Living Area", "Gross Floor Area", "Replacement Cost", "Year Built"]:
+            parcels[name] = np.nan
+    return parcels
+
+
+'''
+addMeasures() - the $/sqft and $/acre of each parcel (NaN where they don't apply)
+'''
+def addMeasures(parcels):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        area = parcels["Living Area"].to_numpy(dtype=float)
+        acres = parcels["Lot Size (acres)"].to_numpy(dtype=float)
+        imp = parcels["Improvements"].to_numpy(dtype=float)
+        land = parcels["Land"].to_numpy(dtype=float)
+        parcels["Imp per Sqft"] = np.where((area > 0) & (imp > 0), imp / area, np.nan)
+        parcels["Land per Acre"] = np.where((acres > 0) & (land > 0), land / acres, np.nan)
+    parcels["Acre Band"] = pd.cut(parcels["Lot Size (acres)"], acreBands, labels=acreLabels,
+                                  right=False).astype(str)
+    return parcels
+
+
+'''
+scoreGroups() - each parcel's group label, group N, median, MAD and robust z for one measure
+'''
+def scoreGroups(parcels, valueColumn, groupBy, minGroup=5):
+    df = parcels.dropna(subset=[valueColumn]).copy()
+    for name in groupBy:
+        if name not in df:
+            df[name] = ""
+    df["Group"] = "All"
+    if groupBy:
+        df["Group"] = df[groupBy[0]].astype(str)
+        for name in groupBy[1:]:
+            df["Group"] = df["Group"] + " / " + df[name].astype(str)
+    values = df[valueColumn]
+    groups = df.groupby("Group")[valueColumn]
+    df["Group N"] = groups.transform("size")
+    df["Group Median"] = groups.transform("median")
+    deviation = (values - df["Group Median"]).abs()
+    df["MAD"] = deviation.groupby(df["Group"]).transform("median")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = 0.6745 * (values - df["Group Median"]) / df["MAD"]
+    df["z"] = z.where((df["Group N"] >= minGroup) & (df["MAD"] > 0))
+    return df
+
+
+def groupSummary(scored, measure, valueColumn):
+    if scored.empty:                    # e.g. no Buildings___.tsv, so no $/sqft
+        return pd.DataFrame(columns=groupSummaryColumns)
+    q = scored.groupby("Group")[valueColumn].quantile([0.1, 0.25, 0.5, 0.75, 0.9]).unstack()
+    summary = pd.DataFrame({
+        "Measure": measure,
+        "Group": q.index,
+        "N": scored.groupby("Group").size().reindex(q.index).to_numpy(),
+        "P10": q[0.1].to_numpy(), "P25": q[0.25].to_numpy(), "Median": q[0.5].to_numpy(),
+        "P75": q[0.75].to_numpy(), "P90": q[0.9].to_numpy(),
+        "MAD": scored.groupby("Group")["MAD"].first().reindex(q.index).to_numpy(),
+    })
+    return summary.reindex(columns=groupSummaryColumns)
+
+
+'''
+equityAnalysis() - [outliers, group summaries], both DataFrames
+The outliers are ranked by |z|, largest first
+'''
+def equityAnalysis(parcels, groupings, zLimit=3.5, minGroup=5):
+    outliers = []
+    summaries = []
+    for measure, valueColumn, option in measures:
+        scored = scoreGroups(parcels, valueColumn, groupings[option], minGroup)
+        summaries.append(groupSummary(scored, measure, valueColumn))
+        flagged = scored[scored["z"].abs() > zLimit]
+        outliers.append(pd.DataFrame({
+            "Measure": measure, "Town": flagged["Town"], "PID": flagged["PID"],
+            "Group": flagged["Group"], "Value": flagged[valueColumn],
+            "Group N": flagged["Group N"], "Group Median": flagged["Group Median"], "z": flagged["z"],
+            "Assessment": flagged["Assessment"], "Living Area": flagged["Living Area"],
+            "Lot Size (acres)": flagged["Lot Size (acres)"], "Year Built": flagged["Year Built"],
+        }))
+    result = pd.concat(outliers, ignore_index=True).reindex(columns=outlierColumns)
+    result = result.iloc[np.argsort(-result["z"].abs().to_numpy(), kind="stable")]
+    return result.reset_index(drop=True), pd.concat(summaries, ignore_index=True)
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('directories', nargs='*', default=["."],
+                            help="Scrape output directories (with ScrapeDataXX.tsv and Buildings___.tsv)")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--groups', metavar="TSV", help="Also write each group's distribution to this file")
+        parser.add_argument('--by-sqft', default="Town,Neighborhood,Land Use Code",
+                            help="Columns grouping comparable parcels for $/sqft")
+        parser.add_argument('--by-acre', default="Town,Zoning District,Acre Band",
+                            help="Columns grouping comparable parcels for land $/acre")
+        parser.add_argument('--z', type=float, default=3.5, help="Smallest |robust z| that's an outlier")
+        parser.add_argument('--min-group', type=int, default=5, help="Smallest group to score")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    try:
+        parcels = pd.concat([readParcels(d) for d in theArgs.directories], ignore_index=True)
+    except (OSError, KeyError) as e:
+        return "Can't read the scrape files: %s" % e
+    parcels = addMeasures(parcels)
+    groupings = {option: [c.strip() for c in getattr(theArgs, option).split(",") if c.strip()]
+                 for measure, valueColumn, option in measures}
+    outliers, summaries = equityAnalysis(parcels, groupings, theArgs.z, theArgs.min_group)
+    print("%d parcels in %d town(s): %d with $/sqft, %d with $/acre; %d outliers" % (
+        len(parcels), parcels["Town"].nunique(), parcels["Imp per Sqft"].notna().sum(),
+        parcels["Land per Acre"].notna().sum(), len(outliers)), file=fe)
+    outliers.to_csv(theArgs.outfile, sep="\t", index=False, float_format="%.2f")
+    if theArgs.groups:
+        summaries.to_csv(theArgs.groups, sep="\t", index=False, float_format="%.2f")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+'''
+Label Grid
+
+Both Vision and AVA show much of their data as labels followed by values:
+- Vision's Building Attributes table has rows of <td>Label</td><td>Value</td>,
+  where the label sometimes ends in ":" ("Style:") and sometimes doesn't ("Model")
+- AVA's Parties and Additional columns are runs of <label>s: a heading
+  ("Party 1:", "Notes:") followed by the labels that belong to it
+
+Rather than searching the whole table again for every label we want,
+these walk the table (or the labels) once, into a dictionary keyed by
+the normalized label: surrounding whitespace and any trailing ":" removed,
+and runs of whitespace inside it collapsed to a single space.
+Looking up another label then costs one dictionary lookup.
+'''
+
+import re
+
+spacePattern = re.compile(r"\s+")
+
+'''
+normalizeLabel() - "  Total Bthrms: " -> "Total Bthrms"
+'''
+def normalizeLabel(text):
+    text = spacePattern.sub(" ", text or "").strip()
+    if text.endswith(":"):
+        text = text[:-1].rstrip()
+    return text
+
+
+'''
+labelValues() - {label: value} from a table of label/value cells
+Each row is read as pairs of cells (label, value, label, value...),
+so two-column and four-column grids both work. Values are the cell's
+text, untouched (plainValue() cleans them up); the first of any
+repeated labels wins. A missing table gives an empty dictionary.
+'''
+def labelValues(table, cell="td"):
+    result = {}
+    if table is None:
+        return result
+    for row in table.find_all("tr"):
+        cells = row.find_all(cell, recursive=False)
+        for i in range(0, len(cells) - 1, 2):
+            label = normalizeLabel(cells[i].get_text())
+            if label and label not in result:
+                result[label] = cells[i + 1].get_text()
+    return result
+
+
+'''
+labelSections() - {heading: [texts]} from a run of elements
+Each element whose normalized text is one of "headings" starts a section;
+the (stripped) text of the elements after it are added to that section.
+Elements before the first heading go under "". Those in "skip" are ignored.
+'''
+def labelSections(elements, headings, skip=()):
+    headings = set(headings)
+    skip = set(skip)
+    result = {"": []}
+    current = ""
+    for element in elements:
+        text = element.get_text()
+        label = normalizeLabel(text)
+        if label in headings:
+            current = label
+            result.setdefault(current, [])
+        elif label not in skip:
+            result.setdefault(current, []).append(text.strip())
+    return result
@@ -0,0 +1,353 @@
+'''
+Layout Canary
+
+Vision and AVA change their markup from time to time (AVA's Jan 2024
+switch to resultRowDetailContainer, say). When that happens scrapevgsi.py
+either crashes on a None.text hours into a run, or - worse - quietly
+writes "MISSING-" values, and scrapeAVA.py writes a file of headings.
+
+So before a run, check a small sample of pages against the layout the
+extractors expect, and stop within seconds with a report of exactly what
+moved. For a Vision parcel page:
+- each of the domIDs/saleDomIDs elements is there (and the MBLU and
+  Book&Page split the way parseParcel splits them)
+- each table is there, with the column headings and number of cells per row
+  its handler counts on (the sales, valuation history, outbuilding,
+  extra feature and special land tables, and each building's tables)
+- every extractor runs without an exception, its typed columns convert
+  (an Assessment of "$12x" is a problem), each record has one cell per
+  column (no more, no fewer), and there's a Building record
+  for each of the "# Buildings"
+A "MISSING-" value is only noted, not a failure: a commercial or vacant
+building really has no bedrooms or kitchens, and a table that has moved
+is caught by the table checks anyway.
+For an AVA search page:
+- there are resultRowDetailContainer transactions at all
+- print_transaction() lines up with the headings: ID, Date&Time, Date,
+  Type, Book, Page and Page Count are where print_firstcol's offsets put them
+
+scrapevgsi.py runs it on the first pages of every run (--canary N, the
+first 3 parcel pages by default; 0 turns it off). Those pages are then
+scraped as usual, so the check costs no extra requests. If none of the
+first pages is a parcel (a stretch of unused or suppressed PIDs - Lyme's
+numbering has big gaps), there's nothing to check and the run goes on.
+scrapeAVA.py checks the first few transactions of its page the same way.
+Either one stops before writing any output if the check fails.
+
+Usage:
+    python layoutCanary.py -r Archive                         # saved pages (as for scrapevgsi.py -r)
+    python layoutCanary.py -u https://gis.vgsi.com/lymenh/ -p pids.txt
+    python layoutCanary.py --ava AVA-GCRoD/HTML/2026-01-19.html
+'''
+
+import sys
+import argparse
+import itertools
+import io
+import os
+import re
+import traceback
+
+# [table ID, column headings, cells per row, must it be there?]
+visionTables = [
+    ["MainContent_grdSales",
+     ["Owner", "Sale Price", "Certificate", "Book & Page", "Instrument", "Sale Date"], [5, 6], True],
+    ["MainContent_grdHistoryValuesAsmt", ["Valuation Year", "Improvements", "Land", "Total"], [4], True],
+    ["MainContent_grdHistoryValuesAppr", ["Valuation Year", "Improvements", "Land", "Total"], [4], True],
+    ["MainContent_grdOb",
+     ["Code", "Description", "Sub Code", "Sub Description", "Size", "Value", "Bldg #"], [7], True],
+    ["MainContent_grdXf", ["Code", "Description", "Size", "Value", "Bldg #"], [5], False],
+    ["MainContent_grdSpclLand", ["Land Use Code", "Land Use Description", "Units", "Unit Type"], [4], False],
+]
+# The same, for each building ("**" is the building number)
+buildingTables = [
+    ["MainContent_ctl**_grdCns", ["Field", "Description"], [2], True],
+    ["MainContent_ctl**_grdSub", ["Code", "Description", "Gross Area", "Living Area"], [4], True],
+]
+missingPattern = re.compile(r"MISSING|Missing-")
+avaDateTimePattern = re.compile(r"\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d\d:\d\d [AP]M$")
+avaDatePattern = re.compile(r"\d{1,2}/\d{1,2}/\d{4}$")
+avaTypePattern = re.compile(r"[A-Z][A-Z0-9 &/.,'-]*$")
+avaBookAndPage = 3          # Book&Page, Book, Page - not there for a PLAN
+
+
+'''
+describeError() - "IndexError: list index out of range (scrapevgsi.py line 246, in handleOwnerHistory)"
+'''
+def describeError(e):
+    frames = traceback.extract_tb(e.__traceback__)
+    where = ""
+    if frames:
+        frame = frames[-1]
+        where = " (%s line %d, in %s)" % (os.path.basename(frame.filename), frame.lineno, frame.name)
+    return "%s: %s%s" % (type(e).__name__, e, where)
+
+
+'''
+tableProblems() - what's wrong with a table, compared with its headings and cells per row
+A table with a single one-cell row ("No Data for PID") has nothing to compare.
+'''
+def tableProblems(table, tableID, headings, cellCounts, required=True):
+    if table is None:
+        return ["%s: table not found" % tableID] if required else []
+    rows = [[c.get_text(" ", strip=True) for c in row.find_all("td")] for row in table.find_all("tr")]
+    rows = [r for r in rows if r]
+    if len(rows) <= 1 and all(len(r) <= 1 for r in rows):
+        return []
+    problems = []
+    found = [th.get_text(" ", strip=True) for th in table.find_all("th")]
+    if found != headings:
+        problems.append("%s: headings are %s, expected %s" % (tableID, found, headings))
+    counts = sorted(set(len(r) for r in rows if len(r) not in cellCounts))
+    if counts:
+        problems.append("%s: rows of %s cells, expected %s" % (
+            tableID, "/".join(str(c) for c in counts), "/".join(str(c) for c in cellCounts)))
+    return problems
+
+
+'''
+elementProblems() - the domIDs missing from the page, and MBLU/Book&Page that won't split
+'''
+def elementProblems(soup):
+    from scrapevgsi import domIDs, saleDomIDs
+    problems = []
+    for domID, label in domIDs + saleDomIDs:
+        element = soup.find(id=domID)
+        if element is None:
+            problems.append("%s (%s): element not found" % (domID, label))
+        elif domID == "MainContent_lblMblu" and element.text.count("/") < 3:
+            problems.append("%s (%s): %r doesn't split into Map/Block/Lot/Unit" % (domID, label, element.text))
+        elif domID == "MainContent_lblBp" and element.text.strip() and "/" not in element.text:
+            problems.append("%s (%s): %r isn't Book/Page" % (domID, label, element.text))
+    return problems
+
+
+'''
+wrongTypes() - "name is 'text'" for each of a record's typed fields that didn't convert
+(the converters leave the text as it was when it doesn't look like a number or date;
+Vision's "5,135" areas are left that way too, so they're fine)
+'''
+def wrongTypes(names, converters, values):
+    from vgsiRecords import toStr
+    return ["%s is %r" % (name, value) for name, conv, value in zip(names, converters, values)
+            if conv is not toStr and isinstance(value, str) and value.strip() and not missingPattern.search(value)
+            and isinstance(conv(value.replace(",", "")), str)]
+
+
+def missingValues(names, values):
+    return ["%s is %r" % (name, value) for name, value in zip(names, values)
+            if isinstance(value, str) and missingPattern.search(value)]
+
+
+'''
+extractorProblems() - run the parcel line and every handler over the page, as a "full" run would,
+and check what comes out
+Return [problems, notes] - the notes are the MISSING- values
+'''
+def extractorProblems(soup, pid):
+    import scrapevgsi
+    from vgsiRecords import toInt
+    schema = scrapevgsi.profileParts("full")[0]
+    problems = []
+    notes = []
+    try:
+        parcel = scrapevgsi.parseParcel(soup, pid, 1, schema)
+        vals = parcel.values()
+        problems.extend("parcel line: %s" % p for p in wrongTypes(schema.columns, schema.converters, vals))
+        notes.extend("parcel line: %s" % p for p in missingValues(schema.columns, vals))
+    except Exception as e:
+        problems.append("parseParcel: %s" % describeError(e))
+    for attr, handler in scrapevgsi.pageHandlers.items():
+        try:
+            records = handler[0](soup, handler[1], pid, *handler[2:])
+        except Exception as e:
+            problems.append("%s (%s): %s" % (handler[0].__name__, attr, describeError(e)))
+            continue
+        for n, rec in enumerate(records, 1):
+            vals = rec.values()
+            if attr in ["appraisals", "assessments"] and vals[1] == "No Data for PID":
+                continue
+            if rec.extra or rec.width < len(rec.fields):
+                problems.append("%s record %d: %d cells for %d columns" % (attr, n, len(vals), len(rec.fields)))
+            problems.extend("%s record %d: %s" % (attr, n, p) for p in wrongTypes(rec.fields, rec.converters, vals))
+            notes.extend("%s record %d: %s" % (attr, n, p) for p in missingValues(rec.fields, vals))
+        if attr == "buildings":
+            count = soup.find(id="MainContent_lblBldCount")
+            count = toInt(count.text.strip()) if count is not None else None
+            if isinstance(count, int) and count != len(records):
+                problems.append("buildings: %d Building records for # Buildings %d" % (len(records), count))
+    return [problems, notes]
+
+
+'''
+checkVisionPage() - [kind, problems, notes] for one page
+kind is "problem" (Vision couldn't load the parcel), "suppressed" (no PID on the page), or "parcel"
+'''
+def checkVisionPage(content, pid):
+    from bs4 import BeautifulSoup
+    from scrapevgsi import domIDs, subsBuilding
+    if content is None or content.find(b'There was an error loading the parcel') >= 0:
+        return ["problem", [], []]
+    soup = BeautifulSoup(content, "html.parser")
+    if soup.find(id=domIDs[0][0]) is None:
+        soup.decompose()
+        return ["suppressed", [], []]
+    problems = elementProblems(soup)
+    for tableID, headings, cellCounts, required in visionTables:
+        problems.extend(tableProblems(soup.find(id=tableID), tableID, headings, cellCounts, required))
+    buildings = 0
+    while soup.find(id=subsBuilding("MainContent_ctl**_lblYearBuilt", buildings + 1)) is not None:
+        buildings += 1
+    for number in range(1, buildings + 1):
+        for tableID, headings, cellCounts, required in buildingTables:
+            tableID = subsBuilding(tableID, number)
+            problems.extend(tableProblems(soup.find(id=tableID), tableID, headings, cellCounts, required))
+    found, notes = extractorProblems(soup, pid)
+    soup.decompose()
+    return ["parcel", problems + found, notes]
+
+
+'''
+canaryPages() - check the first pages of a run
+Reads (PID, content) pages until "sample" parcel pages have been checked
+(or 5 times that many pages, in case the first are suppressed or missing).
+Only parcel pages can fail: with none among them the check is skipped.
+The MISSING- values and a skipped check are noted on "fe".
+Return [problems, the pages - those read, then the rest]
+'''
+def canaryPages(pages, sample=3, fe=sys.stderr):
+    taken = []
+    problems = []
+    parcels = 0
+    for thePID, content in pages:
+        taken.append([thePID, content])
+        kind, found, notes = checkVisionPage(content, thePID)
+        if kind == "parcel":
+            parcels += 1
+            problems.extend("PID %s: %s" % (thePID, p) for p in found)
+            for note in notes:
+                print("Layout check: PID %s: %s" % (thePID, note), file=fe)
+        if parcels >= sample or len(taken) >= sample * 5:
+            break
+    if taken and not parcels:
+        print("Layout check skipped: none of the first %d pages is a parcel page "
+              "(all suppressed or failed to load)" % len(taken), file=fe)
+    return [problems, itertools.chain(taken, pages)]
+
+
+'''
+avaLineProblems() - what's wrong with one of scrapeAVA's lines, compared with its headings
+print_firstcol() finds the ID and the Date/Type/Book&Page/Page Count spans
+by their position, so a changed layout shifts (or drops) columns.
+'''
+def avaLineProblems(fields, headings):
+    index = {name: i for i, name in enumerate(headings)}
+    hasBook = any(f.startswith("B:") for f in fields[:index["Pages"] + 1])
+    expected = len(headings) if hasBook else len(headings) - avaBookAndPage
+    if len(fields) != expected:
+        return ["%d columns, expected %d (%s)" % (len(fields), expected, " | ".join(fields[:index["Pages"] + 1]))]
+    checks = [["ID", re.compile(r"\d+$")], ["Date&Time", avaDateTimePattern],
+              ["Date", avaDatePattern], ["Type", avaTypePattern]]
+    if hasBook:
+        checks += [["Book", re.compile(r"\d+$")], ["Page", re.compile(r"\d+$")]]
+    problems = ["%s is %r" % (name, fields[index[name]]) for name, pattern in checks
+                if not pattern.match(fields[index[name]])]
+    pages = fields[index["Pages"] - (0 if hasBook else avaBookAndPage)]
+    if "Page Count" not in pages:
+        problems.append("Pages is %r" % pages)
+    return problems
+
+
+'''
+checkAvaTransactions() - print_transaction() the first "sample" transactions
+(into a buffer, not the output file) and check the lines
+'''
+def checkAvaTransactions(transactions, headings, sample=5):
+    import scrapeAVA
+    if not transactions:
+        return ['no <div class="resultRowDetailContainer"> transactions on the page '
+                '(or the search found nothing)']
+    problems = []
+    saved = scrapeAVA.fo
+    try:
+        for n, transaction in enumerate(transactions[:sample], 1):
+            scrapeAVA.fo = io.StringIO()
+            try:
+                scrapeAVA.print_transaction(transaction)
+            except Exception as e:
+                problems.append("record %d: print_transaction: %s" % (n, describeError(e)))
+                continue
+            fields = scrapeAVA.fo.getvalue().rstrip("\n").split("\t")
+            problems.extend("record %d (%s): %s" % (n, fields[0], p) for p in avaLineProblems(fields, headings))
+    finally:
+        scrapeAVA.fo = saved
+    return problems
+
+
+'''
+canaryReport() - the report that stops the run
+'''
+def canaryReport(problems, site, limit=40):
+    lines = ["Layout check failed: the %s pages don't look the way the scraper expects "
+             "(--canary 0 to run anyway)" % site]
+    lines.extend("  " + p for p in problems[:limit])
+    if len(problems) > limit:
+        lines.append("  ... and %d more" % (len(problems) - limit))
+    return "\n".join(lines)
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-r", '--replay', metavar="PATH",
+                            help="Saved pages (directory, .tar/.zip, or concatenated .html)")
+        parser.add_argument("-u", '--baseurl', help="Vision site for the town")
+        parser.add_argument("-p", '--pids', type=argparse.FileType('rt', encoding='utf-8-sig'),
+                            help="The PIDs to fetch from the Vision site")
+        parser.add_argument('--ava', metavar="FILE", help="A saved AVA search page")
+        parser.add_argument("-n", '--sample', type=int,
+                            help="Number of parcel pages (default 3) or AVA transactions (default 5) to check")
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    if theArgs.ava:
+        from bs4 import BeautifulSoup
+        from scrapeAVA import headings
+        with open(theArgs.ava, "rt") as f:
+            soup = BeautifulSoup(f, "html.parser")
+        transactions = soup.find_all("div", class_="resultRowDetailContainer")
+        sample = theArgs.sample or 5
+        problems = checkAvaTransactions(transactions, headings, sample)
+        if problems:
+            return canaryReport(problems, "AVA")
+        print("AVA layout OK: %d transactions checked" % min(len(transactions), sample), file=fe)
+        return
+
+    import scrapevgsi
+    if theArgs.replay:
+        from savedPages import savedPages
+        pages = savedPages(theArgs.replay)
+    elif theArgs.pids:
+        if theArgs.baseurl:
+            scrapevgsi.baseURL = theArgs.baseurl if theArgs.baseurl.endswith("/") else theArgs.baseurl + "/"
+        pages = scrapevgsi.livePages(scrapevgsi.PIDListFile(theArgs.pids), fe, quiet=True)
+    else:
+        return "Give saved pages (-r), PIDs to fetch (-p), or an AVA page (--ava)"
+    problems, pages = canaryPages(pages, theArgs.sample or 3, fe)
+    if problems:
+        return canaryReport(problems, "Vision")
+    print("Vision layout OK", file=fe)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
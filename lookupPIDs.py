@@ -0,0 +1,319 @@
+'''
+Look up VGSI PIDs by Address
+
+Vision's search page fills its drop-down lists from small JSON
+"web methods" at async.asmx (see GetAddress.sh for the original curl lines).
+This script asks those web methods to resolve a list of search terms
+into PIDs, without fetching any of the (large) Parcel.aspx pages.
+
+Input is a text file with one search term per line, e.g. "28 ACORN HILL RD".
+Ignore lines that begin with # (they're comments)
+
+Output is a tab-delimited file with one line per matching parcel:
+Term, PID, Match (the text Vision displays), Source, CollectedOn
+A term with no matches gets a "NO MATCH" line; one that couldn't be
+looked up (network error, Vision not answering) gets an "ERROR" line.
+
+Results are remembered in a local cache file (LookupCache.json)
+so that asking the same question again within the TTL doesn't hit Vision.
+'''
+
+import sys
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+defaultBaseURL = "https://gis.vgsi.com/lymeNH/"
+defaultCacheFile = "LookupCache.json"
+
+# Map each kind of search onto its async.asmx web method and its "src" value.
+# Only GetDataAddress/i_address is known to work (GetAddress.sh's curl lines);
+# add the owner and account searches here once their names have been
+# checked against a captured Search.aspx.
+searchSources = {
+    "address": ["GetDataAddress", "i_address"],
+}
+
+'''
+LookupCache
+
+A dictionary of previous lookups, saved as JSON between runs.
+Each entry is keyed by "source|TERM" and holds the time it was
+retrieved plus the list of [PID, Match] pairs.
+Entries older than the TTL (seconds) are ignored (and eventually replaced).
+'''
+
+
+class LookupCache:
+    def __init__(self, fileName, ttl):
+        self.fileName = fileName
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        if fileName and os.path.exists(fileName):
+            try:
+                with open(fileName, "rt") as f:
+                    self.entries = json.load(f)
+            except ValueError:              # unreadable cache - start over
+                self.entries = {}
+
+    def key(self, source, term):
+        return "%s|%s" % (source, normalTerm(term))
+
+    def get(self, source, term):
+        with self.lock:
+            entry = self.entries.get(self.key(source, term))
+        if entry is None:
+            return None
+        if time.time() - entry["t"] > self.ttl:
+            return None
+        return entry["result"]
+
+    def put(self, source, term, result):
+        with self.lock:
+            self.entries[self.key(source, term)] = {"t": time.time(), "result": result}
+
+    def save(self):
+        if not self.fileName:
+            return
+        with self.lock:
+            now = time.time()
+            keep = {k: v for k, v in self.entries.items() if now - v["t"] <= self.ttl}
+        tmpName = self.fileName + ".tmp"
+        with open(tmpName, "wt") as f:
+            json.dump(keep, f)
+        os.replace(tmpName, self.fileName)     # never leave a half-written cache
+
+
+'''
+VisionLookup
+
+Keeps a session with the Vision server (Vision wants an ASP.NET_SessionId
+cookie before it will answer async.asmx requests) and issues lookups.
+Each worker thread gets its own requests.Session, primed with the cookies
+from a single visit to Search.aspx.
+'''
+
+
+class VisionLookup:
+    def __init__(self, baseURL=defaultBaseURL, timeout=30):
+        self.baseURL = baseURL if baseURL.endswith("/") else baseURL + "/"
+        self.timeout = timeout
+        self.cookies = None
+        self.cookieLock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self):
+        s = getattr(self.local, "session", None)
+        if s is None:
+            import requests
+            s = requests.Session()
+            s.verify = False
+            s.headers.update({
+                "Content-Type": "application/json; charset=utf-8",
+                "Referer": self.baseURL + "Search.aspx",
+            })
+            s.cookies.update(self.sessionCookies())
+            self.local.session = s
+        return s
+
+    '''
+    sessionCookies() - visit Search.aspx once to obtain the session cookie,
+    and share it with every thread
+    '''
+    def sessionCookies(self):
+        with self.cookieLock:
+            if self.cookies is None:
+                import requests
+                requests.packages.urllib3.disable_warnings()
+                page = requests.get(self.baseURL + "Search.aspx", verify=False, timeout=self.timeout)
+                self.cookies = page.cookies.get_dict()
+            return self.cookies
+
+    def resetSession(self):
+        with self.cookieLock:
+            self.cookies = None
+        self.local.session = None
+
+    '''
+    lookup() - ask Vision for all the parcels matching a term
+    Return a list of [PID, Match] pairs (may be empty)
+    Retry once with a fresh session if Vision has forgotten ours
+    '''
+    def lookup(self, source, term):
+        method, src = searchSources[source]
+        url = self.baseURL + "async.asmx/" + method
+        body = json.dumps({"inVal": term, "src": src})
+        for attempt in range(2):
+            page = self.session().post(url, data=body, timeout=self.timeout)
+            if page.status_code == 200:
+                return parseLookupResponse(page.text)
+            self.resetSession()
+        page.raise_for_status()
+        return []
+
+
+'''
+parseLookupResponse() - pull [PID, Match] pairs out of the JSON reply
+
+ASP.NET wraps the result in {"d": ...}. The payload is a list whose items
+are either objects (with some sort of id/pid and value/label)
+or "label|pid" style strings. Accept all of those.
+'''
+def parseLookupResponse(text):
+    try:
+        js = json.loads(text)
+    except ValueError:
+        return []
+    items = js.get("d", js) if isinstance(js, dict) else js
+    if isinstance(items, str):              # some web methods double-encode
+        try:
+            items = json.loads(items)
+        except ValueError:
+            items = [items]
+    if not isinstance(items, list):
+        return []
+    result = []
+    for item in items:
+        if isinstance(item, dict):
+            pid = ""
+            for k in ["pid", "Pid", "PID", "id", "Id", "ID", "key", "Key"]:
+                if item.get(k) not in (None, ""):
+                    pid = str(item[k])
+                    break
+            match = ""
+            for k in ["value", "Value", "label", "Label", "text", "Text", "name", "Name"]:
+                if item.get(k) not in (None, ""):
+                    match = str(item[k])
+                    break
+            result.append([pid, match])
+        elif isinstance(item, str):
+            ary = item.rsplit("|", 1)
+            if len(ary) == 2:
+                result.append([ary[1].strip(), ary[0].strip()])
+            else:
+                result.append(["", item.strip()])
+    return result
+
+
+'''
+normalTerm() - terms that differ only in case (or spaces) are the same search
+'''
+def normalTerm(term):
+    return " ".join(term.upper().split())
+
+
+'''
+resolveTerms() - batch-resolve a list of terms, at most "workers" at a time
+Return a dictionary term -> list of [PID, Match], or None if it couldn't be looked up
+Terms found in the cache are answered without touching the network,
+and "Acorn" and "ACORN" are only asked for once.
+'''
+def resolveTerms(terms, source, lookup, cache, workers=4, fe=sys.stderr):
+    import requests
+    results = {}
+    toFetch = {}                            # normalTerm -> the first term spelled that way
+    for term in terms:
+        cached = cache.get(source, term)
+        if cached is not None:
+            results[term] = cached
+        elif normalTerm(term) not in toFetch:
+            toFetch[normalTerm(term)] = term
+
+    def fetchOne(term):
+        try:
+            result = lookup.lookup(source, term)
+        except requests.exceptions.RequestException as e:
+            print("Exception looking up %s: %s" % (term, e), file=fe)
+            return term, None
+        cache.put(source, term, result)
+        return term, result
+
+    fetched = {}
+    if toFetch:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for term, result in pool.map(fetchOne, toFetch.values()):
+                fetched[normalTerm(term)] = result
+    for term in terms:
+        if term not in results:
+            results[term] = fetched.get(normalTerm(term))
+    cache.save()
+    return results
+
+
+'''
+readTerms() - read search terms, one per line, skipping comments/blanks
+'''
+def readTerms(f):
+    terms = []
+    for line in f:
+        line = line.strip()
+        if line == "" or line[0] == "#":
+            continue
+        terms.append(line)
+    return terms
+
+
+'''
+Main Function
+
+Parse arguments
+Read the search terms
+Resolve them (from cache or Vision) and print the PIDs
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-i", '--infile', nargs='?',
+                            type=argparse.FileType('r'), default=sys.stdin)
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument("-s", '--source', choices=sorted(searchSources.keys()),
+                            default="address", help="What kind of term is in the input file")
+        parser.add_argument("-w", '--workers', type=int, default=4,
+                            help="Maximum number of simultaneous requests to Vision")
+        parser.add_argument('--ttl', type=float, default=24 * 7,
+                            help="Hours a cached answer stays valid (default one week)")
+        parser.add_argument('--cache', default=defaultCacheFile,
+                            help="Cache file (use '' for no cache)")
+        parser.add_argument("-u", '--baseurl', default=defaultBaseURL,
+                            help="Base URL of the town's Vision site")
+        parser.add_argument('-d', '--debug', action="store_true",
+                            help="Enable the debug mode.")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fi = theArgs.infile
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+
+    terms = readTerms(fi)
+    cache = LookupCache(theArgs.cache, theArgs.ttl * 3600)
+    lookup = VisionLookup(theArgs.baseurl)
+    results = resolveTerms(terms, theArgs.source, lookup, cache, theArgs.workers, fe)
+
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    print("Term\tPID\tMatch\tSource\tCollectedOn", file=fo)
+    for term in terms:
+        matches = results.get(term)
+        if matches is None:
+            print("%s\t\tERROR\t%s\t%s" % (term, theArgs.source, current_date), file=fo)
+            continue
+        if not matches:
+            print("%s\t\tNO MATCH\t%s\t%s" % (term, theArgs.source, current_date), file=fo)
+        for pid, match in matches:
+            print("%s\t%s\t%s\t%s\t%s" % (term, pid, match, theArgs.source, current_date), file=fo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
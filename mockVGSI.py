@@ -0,0 +1,403 @@
+'''
+Mock VGSI server
+
+A local stand-in for gis.vgsi.com, for tuning concurrency, retries and
+throttling without hammering (or getting banned by) the real server.
+
+It serves:
+- /<town>/Parcel.aspx?pid=N - pages from TestData, a directory/.tgz/.zip of
+  saved pages, or a page archive run (anything "scrapevgsi.py -r" accepts)
+- /<town>/Search.aspx - sets an ASP.NET_SessionId cookie
+- /<town>/async.asmx/GetDataAddress - substring search of the served
+  pages' addresses, for lookupPIDs.py
+- /photos/... - a made-up image for any photo path (the same bytes for
+  every default.jpg), with an ETag, answering If-None-Match with 304;
+  --photo-version N changes the bytes of all but default.jpg, as if the
+  buildings had been photographed again (for photoMirror.py)
+
+PIDs listed with --error get Vision's "There was an error loading the parcel"
+page, and --suppressed PIDs get a page without any parcel data. Both are made
+from a captured parcel page (the first one served, else TestData's PID 837):
+its real head, form and hidden fields, with the message in MainContent_panParcel
+and the parcel's tabs left out - or, with --error-page/--suppressed-page,
+are a captured error or suppressed page, served as it is.
+Unknown PIDs get the error page too (that's what Vision does),
+or with --clone, a copy of the first page relabeled with the PID.
+
+Faults, all random but repeatable with --seed:
+- --latency DIST - delay before answering: fixed:S, uniform:A:B, exp:MEAN, lognormal:MU:SIGMA
+- --burst-rate P --burst-length N - start a run of N "503 Service Unavailable" with probability P
+- --reset-rate P - drop the connection (TCP reset) without answering
+- --slow-rate P --slow-bps N - send the body at N bytes/second
+
+Point the scrapers at it with their base URL option:
+    python mockVGSI.py --port 8080 --latency uniform:0.1:0.4 --burst-rate 0.01
+    python scrapevgsi.py -u http://localhost:8080/lymeNH/
+    python lookupPIDs.py -u http://localhost:8080/lymeNH/ -i addresses.txt
+'''
+
+import sys
+import argparse
+import hashlib
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from savedPages import savedPages
+from sectionCache import sectionSpan
+
+templatePage = "TestData/VGSI-PID837-30Dec2022.html"
+errorMessage = b"There was an error loading the parcel."
+suppressedMessage = b"Information suppressed due to the request of the taxpayer"
+labelPattern = r'id="%s"[^>]*>([^<]*)<'
+searchLabels = {
+    "GetDataAddress": "MainContent_lblLocation",
+}
+
+'''
+pidSet() - parse "13,20-30,100001" into a set of PID strings
+'''
+def pidSet(text):
+    result = set()
+    for part in (text or "").split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            result.update(str(n) for n in range(int(lo), int(hi) + 1))
+        elif part:
+            result.add(part)
+    return result
+
+
+'''
+latencyFunction() - turn "uniform:0.1:0.5" (etc.) into a function
+returning a random delay (seconds)
+'''
+def latencyFunction(spec, rng):
+    if not spec:
+        return lambda: 0.0
+    ary = spec.split(":")
+    kind, args = ary[0], [float(a) for a in ary[1:]]
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(args[0], args[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1.0 / args[0])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(args[0], args[1])
+    raise ValueError("Unknown latency distribution: %s" % spec)
+
+
+'''
+MockVGSI - the pages and the fault settings shared by all request handlers
+'''
+
+
+class MockVGSI:
+    def __init__(self, pages, errorPIDs=(), suppressedPIDs=(), clone=False,
+                 latency="", burstRate=0.0, burstLength=5, resetRate=0.0,
+                 slowRate=0.0, slowBPS=20000, seed=None, photoVersion=1,
+                 errorPage=None, suppressedPage=None):
+        self.pages = pages
+        self.errorPIDs = set(errorPIDs)
+        self.suppressedPIDs = set(suppressedPIDs)
+        self.clone = clone
+        self.template = next(iter(pages.items())) if pages else None
+        self.captured = {errorMessage: errorPage, suppressedMessage: suppressedPage}
+        self.base = self.template
+        self.rng = random.Random(seed)
+        self.latency = latencyFunction(latency, self.rng)
+        self.burstRate = burstRate
+        self.burstLength = burstLength
+        self.resetRate = resetRate
+        self.slowRate = slowRate
+        self.slowBPS = slowBPS
+        self.burstLeft = 0
+        self.photoVersion = photoVersion
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "pages": 0, "errors": 0, "suppressed": 0,
+                       "5xx": 0, "resets": 0, "slow": 0, "photos": 0, "304": 0}
+
+    def count(self, what):
+        with self.lock:
+            self.counts[what] += 1
+
+    '''
+    fault() - decide (under the lock, so --seed runs repeat) what goes wrong
+    with this request: [delay, "503"/"reset"/"slow"/None]
+    '''
+    def fault(self):
+        with self.lock:
+            self.counts["requests"] += 1
+            delay = self.latency()
+            if self.burstLeft > 0:
+                self.burstLeft -= 1
+                return [delay, "503"]
+            if self.rng.random() < self.burstRate:
+                self.burstLeft = self.burstLength - 1
+                return [delay, "503"]
+            if self.rng.random() < self.resetRate:
+                return [delay, "reset"]
+            if self.rng.random() < self.slowRate:
+                return [delay, "slow"]
+            return [delay, None]
+
+    '''
+    messagePage() - the error or suppressed page for a PID: the captured one,
+    else one made from a captured parcel page
+    '''
+    def messagePage(self, pid, message):
+        if self.captured[message] is not None:
+            return self.captured[message]
+        if self.base is None:
+            self.base = next(iter(loadPages(templatePage).items()))
+        basePID, page = self.base
+        return messagePage(page, basePID, pid, message)
+
+    def parcelPage(self, pid):
+        if pid in self.errorPIDs:
+            self.count("errors")
+            return self.messagePage(pid, errorMessage)
+        if pid in self.suppressedPIDs:
+            self.count("suppressed")
+            return self.messagePage(pid, suppressedMessage)
+        if pid in self.pages:
+            self.count("pages")
+            return self.pages[pid]
+        if self.clone and self.template:
+            self.count("pages")
+            templatePID, page = self.template
+            return relabel(page, templatePID, pid)
+        self.count("errors")
+        return self.messagePage(pid, errorMessage)
+
+    '''
+    photo() - [bytes, ETag] of the image at a /photos/ path
+    '''
+    def photo(self, path):
+        if path.lower().endswith("/default.jpg"):
+            seed = b"default"
+        else:
+            seed = b"%s v%d" % (path.encode(), self.photoVersion)
+        body = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + hashlib.sha256(seed).digest() * 64 + b"\xff\xd9"
+        return [body, '"%s"' % hashlib.sha256(body).hexdigest()[:16]]
+
+    def search(self, method, term):
+        label = searchLabels.get(method)
+        if label is None:
+            return None
+        pattern = re.compile(labelPattern % label)
+        term = term.upper()
+        result = []
+        for pid, page in self.pages.items():
+            m = pattern.search(page.decode("utf-8", "replace"))
+            if m and term in m.group(1).upper():
+                result.append({"id": pid, "value": m.group(1).strip()})
+        return result
+
+
+'''
+relabel() - a copy of a page that claims to be another PID
+'''
+def relabel(page, fromPID, toPID):
+    page = re.sub(rb"([Pp]id=)%s\b" % fromPID.encode(), rb"\g<1>%s" % toPID.encode(), page)
+    return re.sub(rb'(id="MainContent_lblPid"[^>]*>)\s*%s\s*<' % fromPID.encode(),
+                  rb"\g<1>%s<" % toPID.encode(), page)
+
+
+'''
+messagePage() - Vision's page with a message instead of a parcel, made from a
+captured parcel page: the parcel's tabs are cut out and the message goes in
+the (otherwise empty) MainContent_panParcel
+'''
+def messagePage(page, fromPID, toPID, message):
+    page = relabel(page, fromPID, toPID)
+    tabs = sectionSpan(page, "tabs")
+    if tabs:
+        page = page[:tabs[0]] + page[tabs[1]:]
+    panel = sectionSpan(page, "MainContent_panParcel")
+    if panel:
+        start = page.index(b">", panel[0]) + 1
+        end = page.rindex(b"<", panel[0], panel[1])
+        page = page[:start] + b"\n\t<h3>%s</h3>\n" % message + page[end:]
+    return page
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None                 # set by makeServer()
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.body = b""
+        self.answer()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.body = self.rfile.read(length) if length else b""
+        self.answer()
+
+    def answer(self):
+        delay, fault = self.mock.fault()
+        if delay > 0:
+            time.sleep(delay)
+        if fault == "reset":
+            self.mock.count("resets")
+            self.reset()
+            return
+        if fault == "503":
+            self.mock.count("5xx")
+            self.send(503, b"<html><body>Service Unavailable</body></html>")
+            return
+
+        url = urlparse(self.path)
+        method = url.path.rstrip("/").rsplit("/", 1)[-1]
+        page = method.lower()
+        if page == "parcel.aspx":
+            pid = parse_qs(url.query).get("pid", [""])[0]
+            self.send(200, self.mock.parcelPage(pid), slow=(fault == "slow"))
+        elif page == "search.aspx":
+            self.send(200, b"<html><body>Search</body></html>",
+                      headers=[["Set-Cookie", "ASP.NET_SessionId=mock%d; path=/" % self.mock.rng.randrange(10 ** 9)]])
+        elif "/photos/" in url.path:
+            body, etag = self.mock.photo(url.path)
+            if self.headers.get("If-None-Match") == etag:
+                self.mock.count("304")
+                self.send(304, b"", headers=[["ETag", etag]])
+            else:
+                self.mock.count("photos")
+                self.send(200, body, contentType="image/jpeg", headers=[["ETag", etag]])
+        elif "/async.asmx/" in url.path:
+            try:
+                term = json.loads(self.body or b"{}").get("inVal", "")
+            except ValueError:
+                term = ""
+            result = self.mock.search(method, term)
+            if result is None:
+                self.send(404, b"Unknown method")
+            else:
+                self.send(200, json.dumps({"d": result}).encode(), contentType="application/json; charset=utf-8")
+        else:
+            self.send(404, b"<html><body>Not found</body></html>")
+
+    def send(self, status, body, contentType="text/html; charset=utf-8", headers=(), slow=False):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if not slow:
+            self.wfile.write(body)
+            return
+        self.mock.count("slow")
+        chunk = max(1, self.mock.slowBPS // 10)
+        for i in range(0, len(body), chunk):
+            self.wfile.write(body[i:i + chunk])
+            self.wfile.flush()
+            time.sleep(0.1)
+
+    '''
+    reset() - close with SO_LINGER 0, so the client sees "connection reset by peer"
+    '''
+    def reset(self):
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        self.close_connection = True
+        self.connection.close()
+
+
+'''
+makeServer() - a ready-to-run server (call serve_forever(), or use
+startServer() to run it in a background thread, e.g. from a test harness)
+'''
+def makeServer(mock, host="127.0.0.1", port=0, verbose=False):
+    handler = type("Handler", (MockHandler,), {"mock": mock, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def startServer(mock, host="127.0.0.1", port=0):
+    server = makeServer(mock, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def loadPages(path):
+    pages = {}
+    for pid, page in savedPages(path):
+        if pid and pid not in pages:
+            pages[pid] = page
+    return pages
+
+
+'''
+Main Function - parse arguments, load the pages, serve until ^C
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-p", '--pages', default="TestData",
+                            help="Saved pages to serve (directory, .tgz/.zip, .html, or page archive)")
+        parser.add_argument('--host', default="127.0.0.1")
+        parser.add_argument('--port', type=int, default=8080)
+        parser.add_argument('--error', default="", metavar="PIDS",
+                            help="PIDs (e.g. 13,20-30) that get the 'error loading the parcel' page")
+        parser.add_argument('--suppressed', default="", metavar="PIDS",
+                            help="PIDs that get the suppressed-parcel page")
+        parser.add_argument('--error-page', type=argparse.FileType('rb'), metavar="FILE",
+                            help="A captured 'error loading the parcel' page to serve for --error PIDs")
+        parser.add_argument('--suppressed-page', type=argparse.FileType('rb'), metavar="FILE",
+                            help="A captured suppressed-parcel page to serve for --suppressed PIDs")
+        parser.add_argument('--clone', action="store_true",
+                            help="Answer unknown PIDs with a relabeled copy of a served page")
+        parser.add_argument('--latency', default="", metavar="DIST",
+                            help="fixed:S, uniform:A:B, exp:MEAN, or lognormal:MU:SIGMA (seconds)")
+        parser.add_argument('--burst-rate', type=float, default=0.0, metavar="P")
+        parser.add_argument('--burst-length', type=int, default=5, metavar="N")
+        parser.add_argument('--reset-rate', type=float, default=0.0, metavar="P")
+        parser.add_argument('--slow-rate', type=float, default=0.0, metavar="P")
+        parser.add_argument('--slow-bps', type=int, default=20000, metavar="N")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--photo-version', type=int, default=1, metavar="N",
+                            help="Change N to change every photo but default.jpg")
+        parser.add_argument('-v', '--verbose', action="store_true", help="Log every request")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    pages = loadPages(theArgs.pages)
+    mock = MockVGSI(pages, pidSet(theArgs.error), pidSet(theArgs.suppressed), theArgs.clone,
+                    theArgs.latency, theArgs.burst_rate, theArgs.burst_length,
+                    theArgs.reset_rate, theArgs.slow_rate, theArgs.slow_bps, theArgs.seed,
+                    theArgs.photo_version,
+                    theArgs.error_page.read() if theArgs.error_page else None,
+                    theArgs.suppressed_page.read() if theArgs.suppressed_page else None)
+    server = makeServer(mock, theArgs.host, theArgs.port, theArgs.verbose)
+    print("Serving %d pages at http://%s:%d/lymeNH/" % (len(pages), theArgs.host, server.server_port),
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print(" ".join("%s=%d" % (k, v) for k, v in mock.counts.items()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+'''
+Name Index
+
+Owner names are spelled and ordered differently from one file to the next:
+"SMITH JOHN A & MARY" in OwnerHistory.tsv, "SMITH, JOHN A" as Owner of
+Record, "JOHN A ETA SMITH" as an AVA party. This index holds every owner
+and party name from every snapshot and AVA export it has been given,
+and finds names that are close to a query, not just equal to it.
+
+Names are normalized (upper case, punctuation dropped), then each word is
+split into trigrams (" SMITH " -> " SM", "SMI", "MIT", "ITH", "TH "),
+so word order doesn't matter and a misspelling only spoils a few trigrams.
+A fuzzy search scores the names sharing trigrams with the query by
+shared / (query's + name's - shared), best first. A prefix search
+finds names with a word starting with each of the query's words.
+
+The index is an SQLite database, index.db in the index directory:
+- sources - the files added, with their size and mtime
+- names - each name, numbered, with its number of trigrams and references
+- grams, words - the names each trigram (or word) is in
+- refs - where each name appeared: name, source, PID (or AVA ID), column, date
+A query reads only the rows it needs, so it doesn't wait for the whole
+index to load.
+
+"add" only reads files that are new or have changed since they were added,
+and only writes their new names and references, so it can be run after
+every scrape or AVA export.
+
+Usage:
+    python nameIndex.py -s NameIndex add Output/*.tsv AVA-GCRoD/*.tsv ScrapedData-Oct2024/OwnerHistory.tsv
+    python nameIndex.py -s NameIndex search "smith john"
+    python nameIndex.py -s NameIndex prefix "SMITH J"
+    python nameIndex.py -s NameIndex refs "BROWN, LIN A"
+'''
+
+import sys
+import argparse
+import csv
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from parcelStore import runDate, fillerPattern
+
+# Columns that hold names, in scrapevgsi.py's and scrapeAVA.py's outputs
+nameColumns = ["Owner", "Owner of Record", "Co-owner", "Party1", "Party2"]
+# AVA's party columns list several parties, separated by ", "
+partyColumns = ["Party1", "Party2"]
+wordPattern = re.compile(r"[A-Z0-9&]+")
+
+dbName = "index.db"
+schema = """
+CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, file TEXT, stamp TEXT);
+CREATE TABLE IF NOT EXISTS names (id INTEGER PRIMARY KEY, name TEXT UNIQUE, grams INTEGER, refs INTEGER);
+CREATE TABLE IF NOT EXISTS grams (gram TEXT, name INTEGER, PRIMARY KEY (gram, name)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS words (word TEXT, name INTEGER, PRIMARY KEY (word, name)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS refs (name INTEGER, source INTEGER, key TEXT, col TEXT, date TEXT);
+CREATE INDEX IF NOT EXISTS refsByName ON refs (name);
+CREATE INDEX IF NOT EXISTS refsBySource ON refs (source);
+"""
+
+
+'''
+normalizeName() - "Smith,  John A." -> "SMITH JOHN A"
+'''
+def normalizeName(name):
+    return " ".join(wordPattern.findall(name.upper().replace("'", "")))
+
+
+'''
+trigrams() - the set of trigrams of each word of a normalized name
+'''
+def trigrams(name):
+    grams = set()
+    for word in name.split():
+        padded = " %s " % word
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def fileStamp(fileName):
+    st = os.stat(fileName)
+    return "%d:%d" % (st.st_size, st.st_mtime_ns)
+
+
+'''
+readNames() - (key, column, date, name) for each name in a .tsv/.csv file
+key is the PID (or the AVA record ID), date is the row's Date or Sale Date,
+else the run's date (from the file name), else ""
+'''
+def readNames(fileName):
+    delimiter = "," if fileName.lower().endswith(".csv") else "\t"
+    fileDate = runDate(fileName)
+    fileDate = fileDate.isoformat() if fileDate else ""
+    with open(fileName, "rt", encoding="utf-8-sig", errors="replace", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter,
+                            quoting=csv.QUOTE_MINIMAL if delimiter == "," else csv.QUOTE_NONE)
+        heading = [c.strip() for c in next(reader, [])]
+        columns = [[i, name] for i, name in enumerate(heading) if name in nameColumns]
+        dateColumn = next((i for i, name in enumerate(heading) if name in ["Date", "Sale Date"]), None)
+        for row in reader:
+            if not row or not row[0].strip().isdigit():
+                continue
+            if len(row) > 1 and fillerPattern.search(row[1]):
+                continue
+            when = row[dateColumn].strip() if dateColumn is not None and dateColumn < len(row) else fileDate
+            for i, column in columns:
+                if i >= len(row):
+                    continue
+                names = row[i].split(", ") if column in partyColumns else [row[i]]
+                for name in names:
+                    if name.strip() and name.strip() != "-":
+                        yield row[0].strip(), column, when, name.strip()
+
+
+'''
+NameIndex - an existing or new index directory
+The names, their trigrams and words, and the references are rows in
+index.db, so opening the index reads nothing but the list of sources,
+and a query only reads the postings for its own trigrams (or words).
+'''
+
+
+class NameIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path(dbName))
+        self.db.executescript(schema)
+        self.sources = [list(row) for row in
+                        self.db.execute("SELECT file, stamp FROM sources ORDER BY id")]     # [file, stamp]
+        self.loaded = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def writeTable(self, name, rows):
+        with open(self.path(name) + ".new", "wt", encoding="utf-8") as f:
+            for row in rows:
+                print("\t".join(str(c) for c in row), file=f)
+        os.replace(self.path(name) + ".new", self.path(name))
+
+    def addNames(self, rows):
+        self.db.executemany("INSERT INTO names VALUES (?, ?, ?, ?)",
+                            [[n, name, len(trigrams(name)), refs] for n, name, refs in rows])
+        self.db.executemany("INSERT OR IGNORE INTO grams VALUES (?, ?)",
+                            [[gram, n] for n, name, refs in rows for gram in trigrams(name)])
+        self.db.executemany("INSERT OR IGNORE INTO words VALUES (?, ?)",
+                            [[word, n] for n, name, refs in rows for word in name.split()])
+
+    '''
+    load() - every name, its number and its reference count, for whole-index
+    work like ownerEntities.py (a query doesn't need them)
+    '''
+    def load(self):
+        if self.loaded is None:
+            names = []
+            refCounts = []
+            for name, refs in self.db.execute("SELECT name, refs FROM names ORDER BY id"):
+                names.append(name)
+                refCounts.append(refs)
+            self.loaded = [names, {name: n for n, name in enumerate(names)}, refCounts]
+        return self.loaded
+
+    @property
+    def names(self):
+        return self.load()[0]
+
+    @property
+    def nameIDs(self):
+        return self.load()[1]
+
+    @property
+    def refCounts(self):
+        return self.load()[2]
+
+    def refTotal(self):
+        return self.db.execute("SELECT count(*) FROM refs").fetchone()[0]
+
+    '''
+    add() - add the files that are new or changed; return how many were read
+    A changed file's old references are replaced by its new ones; only the
+    new names and references are written.
+    '''
+    def add(self, fileNames):
+        sourceIDs = {row[0]: n for n, row in enumerate(self.sources)}
+        nameIDs = dict(self.db.execute("SELECT name, id FROM names"))
+        newNames = []
+        counts = {}
+        changed = 0
+        for fileName in fileNames:
+            stamp = fileStamp(fileName)
+            source = sourceIDs.get(fileName)
+            if source is not None and self.sources[source][1] == stamp:
+                continue
+            if source is None:
+                source = len(self.sources)
+                sourceIDs[fileName] = source
+                self.sources.append([fileName, stamp])
+                self.db.execute("INSERT INTO sources VALUES (?, ?, ?)", [source, fileName, stamp])
+            else:
+                self.sources[source][1] = stamp
+                self.db.execute("UPDATE sources SET stamp = ? WHERE id = ?", [stamp, source])
+                for n, count in self.db.execute("SELECT name, count(*) FROM refs WHERE source = ? GROUP BY name",
+                                                [source]).fetchall():
+                    counts[n] = counts.get(n, 0) - count
+                self.db.execute("DELETE FROM refs WHERE source = ?", [source])
+            refs = []
+            for key, column, when, name in readNames(fileName):
+                name = normalizeName(name)
+                if not name:
+                    continue
+                n = nameIDs.get(name)
+                if n is None:
+                    n = nameIDs[name] = len(nameIDs)
+                    newNames.append([n, name, 0])
+                counts[n] = counts.get(n, 0) + 1
+                refs.append([n, source, key, column, when])
+            self.db.executemany("INSERT INTO refs VALUES (?, ?, ?, ?, ?)", refs)
+            changed += 1
+        if changed:
+            self.addNames(newNames)
+            self.db.executemany("UPDATE names SET refs = refs + ? WHERE id = ?",
+                                [[count, n] for n, count in counts.items() if count])
+            self.db.commit()
+            self.loaded = None
+        return changed
+
+    '''
+    search() - [[score, name], ...] of the names most like "query", best first
+    '''
+    def search(self, query, limit=20, threshold=0.3):
+        grams = trigrams(normalizeName(query))
+        if not grams:
+            return []
+        result = []
+        for name, count, nameGrams, refs in self.db.execute(
+                "SELECT n.name, count(*), n.grams, n.refs FROM grams g JOIN names n ON n.id = g.name "
+                "WHERE g.gram IN (%s) GROUP BY g.name" % ", ".join("?" * len(grams)), sorted(grams)):
+            score = count / (len(grams) + nameGrams - count)
+            if score >= threshold:
+                result.append([score, refs, name])
+        result.sort(key=lambda r: (-r[0], -r[1], r[2]))
+        return [[score, name] for score, refs, name in result[:limit]]
+
+    '''
+    prefix() - names with a word starting with each word of "query",
+    the most often seen first
+    '''
+    def prefix(self, query, limit=20):
+        words = normalizeName(query).split()
+        if not words:
+            return []
+        found = " INTERSECT ".join(["SELECT name FROM words WHERE word >= ? AND word < ?"] * len(words))
+        bounds = [bound for word in words for bound in [word, word + "\uffff"]]
+        return [row[0] for row in self.db.execute(
+            "SELECT name FROM names WHERE id IN (%s) ORDER BY refs DESC, name LIMIT ?" % found,
+            bounds + [limit])]
+
+    '''
+    references() - [[file, key, column, date], ...] where a name was seen
+    '''
+    def references(self, name):
+        return [list(row) for row in self.db.execute(
+            "SELECT s.file, r.key, r.col, r.date FROM refs r JOIN sources s ON s.id = r.source "
+            "WHERE r.name = (SELECT id FROM names WHERE name = ?) ORDER BY r.rowid",
+            [normalizeName(name)])]
+
+    def keys(self, name):
+        return sorted(set(ref[1] for ref in self.references(name)), key=lambda k: int(k))
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-s", '--store', default="NameIndex", help="Index directory")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument("-n", '--limit', type=int, default=20, help="Most names to show")
+        parser.add_argument('--threshold', type=float, default=0.3,
+                            help="Lowest fuzzy score (0-1) to show")
+        parser.add_argument('command', choices=["add", "search", "prefix", "refs"])
+        parser.add_argument('args', nargs='+')
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+    index = NameIndex(theArgs.store)
+    if theArgs.command == "add":
+        start = datetime.now()
+        changed = index.add(theArgs.args)
+        print("%d of %d files added; %d names, %d references (%s)" % (
+            changed, len(theArgs.args), len(index.names), index.refTotal(),
+            datetime.now() - start), file=fe)
+        return
+    query = " ".join(theArgs.args)
+    if theArgs.command == "search":
+        for score, name in index.search(query, theArgs.limit, theArgs.threshold):
+            print("%.2f\t%s\t%s" % (score, name, ",".join(index.keys(name))), file=fo)
+    elif theArgs.command == "prefix":
+        for name in index.prefix(query, theArgs.limit):
+            print("%s\t%s" % (name, ",".join(index.keys(name))), file=fo)
+    elif theArgs.command == "refs":
+        for ref in index.references(query):
+            print("\t".join(ref), file=fo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
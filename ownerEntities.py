@@ -0,0 +1,356 @@
+'''
+Owner Entities
+
+Groups the spellings of one owner - "ABC REALTY TRUST", "ABC RLTY TR",
+"SMITH, JOHN A" and AVA's "JOHN A ETA SMITH" - into one entity, with an
+entity number that stays the same from run to run, so we can see who owns
+several parcels (and check their assessments against everyone else's).
+
+It works on the names in the name index (nameIndex.py "add" the runs and
+AVA exports first). Comparing every name with every other is too slow,
+so names are only compared within "blocks" that share a key:
+- the same set of words, once abbreviations are spelled out (RLTY -> REALTY)
+  and the words that don't identify anyone are dropped (TRUST, LLC, ETA, AND...)
+- the same sounds (Soundex) for two of those words, e.g. SMITH + JOHN
+- the same mailing address (LabelAddress, in the newer snapshots)
+Blocks with more than --max-block names (very common names) are skipped.
+
+Two names in a block are the same entity if their words' trigrams are
+close enough (--threshold), or one's words are all in the other's, there
+are at least two of them, and the other has at most one more
+(BROWN LIN / BROWN RICHARD LIN),
+or they have the same mailing address and share a surname-sized word.
+The matches are joined into entities (so matching is transitive).
+
+Entity numbers are kept in entities.tsv in the name index directory.
+A "resolve" starts from the entities found last time and only compares
+the names that are new since then (--full compares everything again).
+Either way, an entity keeps the lowest number among its names' old
+numbers; new entities get new numbers.
+
+It writes, in --outdir:
+- Entities.tsv - each entity: number, name (its most common spelling),
+  how many spellings and parcels, the PIDs, the spellings
+- ParcelEntities.tsv - PID, entity, name, column, file and date for each owner name seen
+- DeedEntities.tsv - the same for AVA parties, by AVA record ID
+
+Usage:
+    python ownerEntities.py -s NameIndex resolve [--full] [--outdir .]
+    python ownerEntities.py -s NameIndex show "ABC RLTY TR"
+    python ownerEntities.py -s NameIndex portfolios [--min 3]
+'''
+
+import sys
+import argparse
+import csv
+import os
+from datetime import datetime
+from itertools import combinations
+
+from nameIndex import NameIndex, normalizeName, trigrams, partyColumns
+from parcelStore import fillerPattern
+
+# Spelled-out forms of the abbreviations in owner names
+abbreviations = {
+    "RLTY": "REALTY", "TR": "TRUST", "TRST": "TRUST", "TRS": "TRUST", "TRU": "TRUST",
+    "TTE": "TRUSTEE", "TTES": "TRUSTEE", "TRUSTEES": "TRUSTEE", "CO": "COMPANY",
+    "CORP": "CORPORATION", "INC": "INCORPORATED", "ASSOC": "ASSOCIATION", "ASSN": "ASSOCIATION",
+    "PROP": "PROPERTIES", "PROPS": "PROPERTIES", "REV": "REVOCABLE", "RVOC": "REVOCABLE",
+    "LIV": "LIVING", "FAM": "FAMILY", "MGMT": "MANAGEMENT", "DEV": "DEVELOPMENT",
+    "HLDGS": "HOLDINGS", "INVEST": "INVESTMENTS", "INVS": "INVESTMENTS", "PTNRS": "PARTNERS",
+}
+# Words that don't tell one owner from another
+noiseWords = {
+    "AND", "&", "ETA", "ET", "AL", "ETAL", "ETUX", "ETVIR", "THE", "OF", "TRUST", "TRUSTEE",
+    "REVOCABLE", "IRREVOCABLE", "LIVING", "FAMILY", "NOMINEE", "LLC", "L", "C", "P", "LP", "LLP",
+    "INCORPORATED", "CORPORATION", "COMPANY", "JR", "SR", "II", "III", "IV", "ESTATE", "EST",
+    "DECLARATION", "DTD", "DATED", "U", "A", "AGREEMENT",
+}
+soundexCodes = {}
+for letters, code in [["BFPV", "1"], ["CGJKQSXZ", "2"], ["DT", "3"], ["L", "4"], ["MN", "5"], ["R", "6"]]:
+    for letter in letters:
+        soundexCodes[letter] = code
+
+
+def soundex(word):
+    if not word.isalpha():
+        return word
+    code = word[0]
+    last = soundexCodes.get(word[0], "")
+    for letter in word[1:]:
+        digit = soundexCodes.get(letter, "")
+        if digit and digit != last:
+            code += digit
+        if letter not in "HW":
+            last = digit
+    return (code + "000")[:4]
+
+
+'''
+coreWords() - the words that identify an owner, abbreviations spelled out
+"ABC RLTY TR" -> ["ABC", "REALTY"], "SMITH JOHN A & MARY" -> ["SMITH", "JOHN", "MARY"]
+'''
+def coreWords(name):
+    words = []
+    for word in name.split():
+        word = abbreviations.get(word, word)
+        if word not in noiseWords and len(word) > 1 and word not in words:
+            words.append(word)
+    return words
+
+
+def blockKeys(words, address=None):
+    keys = []
+    if words:
+        keys.append("T:" + " ".join(sorted(words)))
+    sounds = sorted(set(soundex(word) for word in words if len(word) > 2))
+    if len(sounds) == 1:
+        keys.append("P:" + sounds[0])
+    for first, second in combinations(sounds, 2):
+        keys.append("P:%s+%s" % (first, second))
+    if address:
+        keys.append("A:" + address)
+    return keys
+
+
+'''
+sameEntity() - do two names (their core words, trigrams and addresses) match?
+'''
+def sameEntity(a, b, threshold):
+    wordsA, gramsA, addressesA = a
+    wordsB, gramsB, addressesB = b
+    if not wordsA or not wordsB:
+        return False
+    shared = len(gramsA & gramsB)
+    if shared / (len(gramsA) + len(gramsB) - shared) >= threshold:
+        return True
+    setA, setB = set(wordsA), set(wordsB)
+    if min(len(setA), len(setB)) >= 2 and abs(len(setA) - len(setB)) <= 1 and (setA <= setB or setB <= setA):
+        return True
+    if addressesA & addressesB and any(len(word) > 2 for word in setA & setB):
+        return True
+    return False
+
+
+'''
+readAddresses() - {normalized owner name: set of mailing addresses} from the
+files in the index that have a LabelAddress column
+'''
+def readAddresses(fileNames):
+    result = {}
+    for fileName in fileNames:
+        if not os.path.exists(fileName):
+            continue
+        delimiter = "," if fileName.lower().endswith(".csv") else "\t"
+        with open(fileName, "rt", encoding="utf-8-sig", errors="replace", newline="") as f:
+            reader = csv.reader(f, delimiter=delimiter,
+                                quoting=csv.QUOTE_MINIMAL if delimiter == "," else csv.QUOTE_NONE)
+            heading = [c.strip() for c in next(reader, [])]
+            if "LabelAddress" not in heading:
+                continue
+            addressColumn = heading.index("LabelAddress")
+            ownerColumns = [i for i, name in enumerate(heading) if name in ["Owner", "Owner of Record", "Co-owner"]]
+            for row in reader:
+                if len(row) <= addressColumn or (len(row) > 1 and fillerPattern.search(row[1])):
+                    continue
+                address = normalizeName(row[addressColumn])
+                if not address:
+                    continue
+                for i in ownerColumns:
+                    name = normalizeName(row[i])
+                    if name:
+                        result.setdefault(name, set()).add(address)
+    return result
+
+
+'''
+resolve() - {name: entity number}, starting from "previous" ({name: number})
+Only pairs with at least one name not in "previous" are compared,
+unless full is set.
+'''
+def resolve(names, addresses, previous, threshold=0.6, maxBlock=200, full=False):
+    features = []
+    blocks = {}
+    for n, name in enumerate(names):
+        words = coreWords(name)
+        nameAddresses = addresses.get(name, set())
+        features.append([words, trigrams(" ".join(words)), nameAddresses])
+        for key in blockKeys(words, None) + ["A:" + address for address in nameAddresses]:
+            blocks.setdefault(key, []).append(n)
+
+    parent = list(range(len(names)))
+
+    def find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    isNew = [name not in previous for name in names]
+    if not full:
+        firstOfEntity = {}
+        for n, name in enumerate(names):
+            if name in previous:
+                union(n, firstOfEntity.setdefault(previous[name], n))
+
+    compared = 0
+    for key, members in blocks.items():
+        if len(members) < 2 or len(members) > maxBlock:
+            continue
+        if not full and not any(isNew[n] for n in members):
+            continue
+        for a, b in combinations(members, 2):
+            if not full and not (isNew[a] or isNew[b]):
+                continue
+            if find(a) == find(b):
+                continue
+            compared += 1
+            if sameEntity(features[a], features[b], threshold):
+                union(a, b)
+
+    # Number the entities: the lowest old number among the names, else a new one
+    clusters = {}
+    for n in range(len(names)):
+        clusters.setdefault(find(n), []).append(n)
+    nextNumber = max(previous.values(), default=0) + 1
+    result = {}
+    for root, members in sorted(clusters.items()):
+        numbers = [previous[names[n]] for n in members if names[n] in previous]
+        if numbers:
+            number = min(numbers)
+        else:
+            number = nextNumber
+            nextNumber += 1
+        for n in members:
+            result[names[n]] = number
+    return result, compared
+
+
+'''
+OwnerEntities - the entities of the names in a name index
+'''
+
+
+class OwnerEntities:
+    def __init__(self, index):
+        self.index = index
+        self.entities = {}
+        fileName = index.path("entities.tsv")
+        if os.path.exists(fileName):
+            with open(fileName, "rt", encoding="utf-8") as f:
+                for line in f:
+                    name, number = line.rstrip("\n").split("\t")
+                    self.entities[name] = int(number)
+
+    def resolve(self, threshold=0.6, maxBlock=200, full=False):
+        addresses = readAddresses([source[0] for source in self.index.sources])
+        self.entities, compared = resolve(self.index.names, addresses, self.entities,
+                                          threshold, maxBlock, full)
+        self.index.writeTable("entities.tsv", sorted(self.entities.items(), key=lambda e: (e[1], e[0])))
+        return compared
+
+    '''
+    groups() - {entity: [names]}, most often seen name first
+    '''
+    def groups(self):
+        result = {}
+        for name, number in self.entities.items():
+            result.setdefault(number, []).append(name)
+        counts = {name: self.index.refCounts[n] for name, n in self.index.nameIDs.items()}
+        for names in result.values():
+            names.sort(key=lambda name: (-counts.get(name, 0), name))
+        return result
+
+    def parcels(self, names):
+        pids = set()
+        for name in names:
+            for fileName, key, column, when in self.index.references(name):
+                if column not in partyColumns:
+                    pids.add(key)
+        return sorted(pids, key=int)
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        groups = self.groups()
+        with open(os.path.join(directory, "Entities.tsv"), "wt") as f:
+            print("Entity\tName\tSpellings\tParcels\tPIDs\tAll Spellings", file=f)
+            for number, names in sorted(groups.items()):
+                pids = self.parcels(names)
+                print("%d\t%s\t%d\t%d\t%s\t%s" % (number, names[0], len(names), len(pids),
+                                                  ",".join(pids), " | ".join(names)), file=f)
+        with open(os.path.join(directory, "ParcelEntities.tsv"), "wt") as parcelFile, \
+                open(os.path.join(directory, "DeedEntities.tsv"), "wt") as deedFile:
+            print("PID\tEntity\tName\tColumn\tFile\tDate", file=parcelFile)
+            print("AVA ID\tEntity\tName\tColumn\tFile\tDate", file=deedFile)
+            for name in self.index.names:
+                number = self.entities.get(name)
+                for fileName, key, column, when in self.index.references(name):
+                    print("%s\t%s\t%s\t%s\t%s\t%s" % (key, number, name, column, fileName, when),
+                          file=deedFile if column in partyColumns else parcelFile)
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-s", '--store', default="NameIndex", help="Name index directory")
+        parser.add_argument('--outdir', default=".", help="Where to write the entity tables")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--full', action="store_true",
+                            help="Compare every name again, not just the new ones")
+        parser.add_argument('--threshold', type=float, default=0.6,
+                            help="Lowest trigram score (0-1) for two names to match")
+        parser.add_argument('--max-block', type=int, default=200,
+                            help="Skip blocks with more names than this")
+        parser.add_argument('--min', type=int, default=2, help="portfolios: fewest parcels to show")
+        parser.add_argument('command', choices=["resolve", "show", "portfolios"])
+        parser.add_argument('args', nargs='*')
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+    entities = OwnerEntities(NameIndex(theArgs.store))
+    if theArgs.command == "resolve":
+        start = datetime.now()
+        compared = entities.resolve(theArgs.threshold, theArgs.max_block, theArgs.full)
+        entities.write(theArgs.outdir)
+        print("%d names, %d entities, %d comparisons (%s)" % (
+            len(entities.entities), len(set(entities.entities.values())), compared,
+            datetime.now() - start), file=fe)
+    elif theArgs.command == "show":
+        if not entities.entities:
+            return "No entities yet - run resolve first"
+        number = entities.entities.get(normalizeName(" ".join(theArgs.args)))
+        if number is None:
+            return "Not in the index: %s" % " ".join(theArgs.args)
+        names = entities.groups()[number]
+        print("Entity %d: %s" % (number, ", ".join(entities.parcels(names))), file=fo)
+        for name in names:
+            print("    %s" % name, file=fo)
+    elif theArgs.command == "portfolios":
+        portfolios = []
+        for number, names in entities.groups().items():
+            pids = entities.parcels(names)
+            if len(pids) >= theArgs.min:
+                portfolios.append([len(pids), number, names[0], pids])
+        for count, number, name, pids in sorted(portfolios, key=lambda p: (-p[0], p[1])):
+            print("%d\t%d\t%s\t%s" % (number, count, name, ",".join(pids)), file=fo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,504 @@
+'''
+Page Archive
+
+Keep every raw Parcel.aspx response from every run, compactly,
+with random access to any (PID, run).
+
+Vision's parcel pages are nearly identical templates, so each page is
+compressed separately against a shared dictionary made from the template:
+- with the "zstandard" module installed, a trained zstd dictionary
+- otherwise, zlib with a preset dictionary (zdict) of the most common lines
+
+Almost half of each page is the base64 __VIEWSTATE, which hides its
+(very repetitive) contents from the compressor. packPage() stores those
+hidden fields as the decoded bytes instead, and unpackPage() puts the
+identical base64 back, so pages come out byte-for-byte as they went in.
+
+A run reuses the latest run's dictionary unless that dictionary was made
+from fewer than trainingPages pages (a first run of only a few pages), or
+this run's first pages compress worse with it than any later run's first
+pages did by more than ratioSlack (the template has changed): then it
+trains a new one from its own first pages.
+
+Layout of an archive directory:
+- runs.tsv - RunID, RunName, DictFile, Codec, Samples (the pages its
+  dictionary was made from), Ratio (compressed/packed size of its first
+  pages) - one line per run
+- dict-N.bin - the dictionaries (a run always uses the one it was written with)
+- run-N.pages - the compressed pages of run N, one after another
+- index.bin - fixed-size records (PID, RunID, offset, length) sorted by PID then RunID
+
+Reads memory-map index.bin and the .pages file, binary-search the index,
+and decompress just that one page.
+
+Usage:
+    python pageArchive.py -a Archive list
+    python pageArchive.py -a Archive get 837 [RunName]
+    python pageArchive.py -a Archive import property.html RunName
+'''
+
+import sys
+import argparse
+import os
+import mmap
+import struct
+import re
+import zlib
+import base64
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+indexRecord = struct.Struct("<IIQI")    # PID, RunID, offset, length
+zlibDictSize = 32 * 1024                # zlib only looks back 32KB
+zstdDictSize = 110 * 1024
+trainingPages = 25                      # pages to collect before making a dictionary
+ratioSlack = 0.10                       # how much worse a reused dictionary may compress
+runColumns = ["RunID", "RunName", "DictFile", "Codec", "Samples", "Ratio"]
+hiddenFieldPattern = re.compile(rb'<input type="hidden" name="__[A-Z]+" id="__[A-Z]+" value="([A-Za-z0-9+/=]{256,})"')
+packHeader = struct.Struct("<II")       # offset in the page, length of the decoded bytes
+
+'''
+packPage() - move the base64 hidden field values to the end of the page, decoded
+Layout: count (1 byte), a packHeader per field, the page without the values, the decoded values
+Fields that wouldn't re-encode to exactly the same text are left alone
+'''
+def packPage(page):
+    fields = []
+    for m in hiddenFieldPattern.finditer(page):
+        try:
+            decoded = base64.b64decode(m.group(1), validate=True)
+        except ValueError:
+            continue
+        if base64.b64encode(decoded) == m.group(1) and len(fields) < 255:
+            fields.append([m.start(1), m.end(1), decoded])
+    parts = []
+    headers = []
+    pos = 0
+    removed = 0
+    for start, end, decoded in fields:
+        parts.append(page[pos:start])
+        headers.append(packHeader.pack(start - removed, len(decoded)))
+        removed += end - start
+        pos = end
+    parts.append(page[pos:])
+    return bytes([len(fields)]) + b"".join(headers) + b"".join(parts) + b"".join(f[2] for f in fields)
+
+
+def unpackPage(packed):
+    count = packed[0]
+    headers = [packHeader.unpack_from(packed, 1 + i * packHeader.size) for i in range(count)]
+    body = packed[1 + count * packHeader.size:]
+    pageEnd = valuesStart = len(body) - sum(length for offset, length in headers)
+    parts = []
+    pos = 0
+    for offset, length in headers:
+        parts.append(body[pos:offset])
+        parts.append(base64.b64encode(body[valuesStart:valuesStart + length]))
+        valuesStart += length
+        pos = offset
+    parts.append(body[pos:pageEnd])
+    return b"".join(parts)
+
+
+'''
+makeLineDictionary() - a preset dictionary for zlib: the lines that appear
+in most of the sample pages, most common last (zlib favors nearby matches)
+'''
+def makeLineDictionary(samples, size=zlibDictSize):
+    counts = Counter()
+    for page in samples:
+        counts.update(set(page.splitlines(keepends=True)))
+    common = [line for line, n in counts.items() if n * 2 >= len(samples) and len(line) > 8]
+    common.sort(key=lambda line: (counts[line], len(line)))
+    result = b""
+    for line in reversed(common):       # most common first, until it's full...
+        if len(result) + len(line) > size:
+            continue
+        result = line + result          # ... but placed at the end
+    return result
+
+
+'''
+Codecs - compress/decompress one page with a given dictionary
+'''
+
+
+class ZlibCodec:
+    name = "zlib"
+
+    def __init__(self, dictData):
+        self.dictData = dictData
+
+    def compress(self, data):
+        c = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, self.dictData)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data):
+        d = zlib.decompressobj(-15, self.dictData)
+        return d.decompress(data) + d.flush()
+
+    @staticmethod
+    def train(samples):
+        return makeLineDictionary(samples)
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, dictData):
+        d = zstandard.ZstdCompressionDict(dictData)
+        self.compressor = zstandard.ZstdCompressor(level=19, dict_data=d)
+        self.decompressor = zstandard.ZstdDecompressor(dict_data=d)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data)
+
+    @staticmethod
+    def train(samples):
+        try:
+            return zstandard.train_dictionary(zstdDictSize, samples).as_bytes()
+        except zstandard.ZstdError:     # too few samples to train - use the common lines
+            return makeLineDictionary(samples, zstdDictSize)
+
+
+def codecFor(name, dictData):
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This run was archived with zstd; install the zstandard module to read it")
+        return ZstdCodec(dictData)
+    return ZlibCodec(dictData)
+
+
+def defaultCodec():
+    return ZstdCodec if zstandard is not None else ZlibCodec
+
+
+'''
+PageArchive - an archive directory (created if needed)
+'''
+
+
+class PageArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.runs = []              # [RunID, RunName, DictFile, Codec, Samples, Ratio]
+        self.codecs = {}
+        self.maps = {}
+        self.indexMap = None
+        self.readRuns()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def readRuns(self):
+        self.runs = []
+        if not os.path.exists(self.path("runs.tsv")):
+            return
+        with open(self.path("runs.tsv"), "rt") as f:
+            for line in f:
+                if line.startswith("RunID") or not line.strip():
+                    continue
+                ary = line.rstrip("\n").split("\t") + ["", ""]
+                # Runs archived before Samples/Ratio were kept count as 0 samples
+                self.runs.append([int(ary[0]), ary[1], ary[2], ary[3],
+                                  int(ary[4]) if ary[4] else 0, float(ary[5]) if ary[5] else None])
+
+    def runID(self, runName):
+        for run in self.runs:
+            if run[1] == runName:
+                return run[0]
+        return None
+
+    def runName(self, runID):
+        for run in self.runs:
+            if run[0] == runID:
+                return run[1]
+        return None
+
+    '''
+    startRun() - begin archiving a new run; returns a RunWriter
+    '''
+    def startRun(self, runName):
+        if self.runID(runName) is not None:
+            raise ValueError("Run %s is already in the archive" % runName)
+        return RunWriter(self, runName)
+
+    '''
+    latestDictionary() - [DictFile, Samples, best Ratio] of the most recent run
+    with the same codec (if any), so new runs can reuse the dictionary instead
+    of training another. The best Ratio leaves out the run that trained it
+    (pages compress better with a dictionary made from them); None if no
+    other run has used it yet.
+    '''
+    def latestDictionary(self):
+        codec = defaultCodec().name
+        for run in reversed(self.runs):
+            if run[3] == codec:
+                ratios = [r[5] for r in self.runs
+                          if r[2] == run[2] and r[3] == codec and r[5] is not None and r[2] != "dict-%d.bin" % r[0]]
+                return [run[2], run[4], min(ratios, default=None)]
+        return None
+
+    def codec(self, dictFile, codecName):
+        key = (dictFile, codecName)
+        if key not in self.codecs:
+            with open(self.path(dictFile), "rb") as f:
+                self.codecs[key] = codecFor(codecName, f.read())
+        return self.codecs[key]
+
+    def addRun(self, runID, runName, dictFile, codecName, samples, ratio, entries):
+        # Merge the new entries into the index (it's small: 20 bytes per page per run)
+        old = []
+        if os.path.exists(self.path("index.bin")):
+            with open(self.path("index.bin"), "rb") as f:
+                data = f.read()
+            old = [indexRecord.unpack_from(data, i) for i in range(0, len(data), indexRecord.size)]
+        allEntries = sorted(old + entries)
+        tmpName = self.path("index.bin.tmp")
+        with open(tmpName, "wb") as f:
+            for entry in allEntries:
+                f.write(indexRecord.pack(*entry))
+        self.closeMaps()
+        os.replace(tmpName, self.path("index.bin"))
+        tmpName = self.path("runs.tsv.tmp")
+        with open(tmpName, "wt") as f:
+            print("\t".join(runColumns), file=f)
+            for run in self.runs + [[runID, runName, dictFile, codecName, samples, ratio]]:
+                print("%d\t%s\t%s\t%s\t%d\t%s" % (tuple(run[:5]) + ("" if run[5] is None else "%.4f" % run[5],)), file=f)
+        os.replace(tmpName, self.path("runs.tsv"))
+        self.readRuns()
+
+    '''
+    Reading
+    '''
+    def closeMaps(self):
+        for m in self.maps.values():
+            m.close()
+        self.maps = {}
+        if self.indexMap is not None:
+            self.indexMap.close()
+            self.indexMap = None
+
+    def mapFile(self, name):
+        with open(self.path(name), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index(self):
+        if self.indexMap is None:
+            self.indexMap = self.mapFile("index.bin")
+        return self.indexMap
+
+    '''
+    findEntries() - binary search the index for all runs of a PID
+    Return a list of (RunID, offset, length), oldest run first
+    '''
+    def findEntries(self, pid):
+        idx = self.index()
+        n = len(idx) // indexRecord.size
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if indexRecord.unpack_from(idx, mid * indexRecord.size)[0] < pid:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = []
+        while lo < n:
+            entry = indexRecord.unpack_from(idx, lo * indexRecord.size)
+            if entry[0] != pid:
+                break
+            result.append(entry[1:])
+            lo += 1
+        return result
+
+    def readPage(self, runID, offset, length):
+        run = [r for r in self.runs if r[0] == runID][0]
+        if runID not in self.maps:
+            self.maps[runID] = self.mapFile("run-%d.pages" % runID)
+        data = self.maps[runID][offset:offset + length]
+        return unpackPage(self.codec(run[2], run[3]).decompress(data))
+
+    '''
+    get() - the raw page for a PID from a run (the latest run if runName is None)
+    (If a run fetched the PID more than once, the last copy.)
+    Return None if it isn't in the archive
+    '''
+    def get(self, pid, runName=None):
+        if not self.runs:
+            return None
+        entries = self.findEntries(int(pid))
+        if runName is not None:
+            wanted = self.runID(runName)
+            entries = [e for e in entries if e[0] == wanted]
+        if not entries:
+            return None
+        runID, offset, length = entries[-1]
+        return self.readPage(runID, offset, length)
+
+    '''
+    pages() - yield (PID, page) for every page of a run, in the order they were scraped
+    '''
+    def pages(self, runName=None):
+        if runName is None:
+            runName = self.runs[-1][1]
+        runID = self.runID(runName)
+        if runID is None:
+            raise ValueError("No run named %s in %s" % (runName, self.directory))
+        idx = self.index()
+        entries = []
+        for i in range(0, len(idx), indexRecord.size):
+            entry = indexRecord.unpack_from(idx, i)
+            if entry[1] == runID:
+                entries.append(entry)
+        entries.sort(key=lambda e: e[2])                # order within the .pages file
+        for pid, _, offset, length in entries:
+            yield str(pid), self.readPage(runID, offset, length)
+
+
+'''
+compressionRatio() - compressed / packed size of some pages with a codec
+'''
+def compressionRatio(codec, samples):
+    size = sum(len(sample) for sample in samples)
+    return sum(len(codec.compress(sample)) for sample in samples) / size if size else None
+
+
+'''
+RunWriter - append the pages of one run
+
+The first few pages are held back until there are enough of them
+to choose the dictionary: the latest run's (if it was made from at least
+as many pages, and still compresses these as well), or a new one.
+'''
+
+
+class RunWriter:
+    def __init__(self, archive, runName):
+        self.archive = archive
+        self.runName = runName
+        self.runID = max([r[0] for r in archive.runs], default=0) + 1
+        self.dictFile = None
+        self.samples = 0
+        self.ratio = None
+        self.codecClass = defaultCodec()
+        self.codec = None
+        self.pending = []
+        self.entries = []
+        self.f = open(archive.path("run-%d.pages" % self.runID), "wb")
+
+    def add(self, pid, content):
+        if self.codec is None:
+            self.pending.append([pid, packPage(content)])
+            if len(self.pending) >= trainingPages:
+                self.chooseDictionary()
+            return
+        self.write(pid, content)
+
+    def chooseDictionary(self):
+        samples = [content for pid, content in self.pending]
+        latest = self.archive.latestDictionary()
+        if latest is not None and latest[1] >= len(samples):
+            dictFile, dictSamples, bestRatio = latest
+            codec = self.archive.codec(dictFile, self.codecClass.name)
+            ratio = compressionRatio(codec, samples)
+            if bestRatio is None or ratio is None or ratio <= bestRatio * (1 + ratioSlack):
+                self.dictFile, self.samples, self.codec = dictFile, dictSamples, codec
+        if self.codec is None:
+            self.train(samples)
+        self.ratio = compressionRatio(self.codec, samples)
+        pending, self.pending = self.pending, []
+        for pid, packed in pending:
+            self.writePacked(pid, packed)
+
+    def train(self, samples):
+        dictData = self.codecClass.train(samples) if samples else b""
+        self.dictFile = "dict-%d.bin" % self.runID
+        with open(self.archive.path(self.dictFile), "wb") as f:
+            f.write(dictData)
+        self.samples = len(samples)
+        self.codec = self.archive.codec(self.dictFile, self.codecClass.name)
+
+    def write(self, pid, content):
+        self.writePacked(pid, packPage(content))
+
+    def writePacked(self, pid, packed):
+        data = self.codec.compress(packed)
+        offset = self.f.tell()
+        self.f.write(data)
+        self.entries.append((int(pid), self.runID, offset, len(data)))
+
+    def close(self):
+        if self.codec is None:
+            self.chooseDictionary()
+        self.f.close()
+        self.archive.addRun(self.runID, self.runName, self.dictFile, self.codecClass.name,
+                            self.samples, self.ratio, self.entries)
+
+
+'''
+archivePages() - pass (PID, content) pages through, saving each one in the run
+The run is closed (and its index entries saved) however the pages stop: at the
+end, on an exception, or when the generator is closed early.
+'''
+def archivePages(pages, writer):
+    try:
+        for thePID, content in pages:
+            if thePID != "" and content is not None:
+                writer.add(thePID, content)
+            yield thePID, content
+    finally:
+        writer.close()
+
+
+'''
+Main Function - list, get, or import pages
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-a", '--archive', default="Archive", help="Archive directory")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('wb'), default=sys.stdout.buffer)
+        parser.add_argument('command', choices=["list", "get", "import"])
+        parser.add_argument('args', nargs='*')
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    archive = PageArchive(theArgs.archive)
+    fo = theArgs.outfile
+    if theArgs.command == "list":
+        for runID, runName, dictFile, codec, samples, ratio in archive.runs:
+            size = os.path.getsize(archive.path("run-%d.pages" % runID))
+            fo.write(("%s\t%s\t%d bytes\t%s\n" % (runName, codec, size, dictFile)).encode())
+    elif theArgs.command == "get":
+        if not theArgs.args:
+            return "get needs a PID (and optionally a run name)"
+        page = archive.get(theArgs.args[0], theArgs.args[1] if len(theArgs.args) > 1 else None)
+        if page is None:
+            return "PID %s is not in the archive" % theArgs.args[0]
+        fo.write(page)
+    elif theArgs.command == "import":
+        if len(theArgs.args) != 2:
+            return "import needs a path of saved pages and a run name"
+        from savedPages import savedPages
+        writer = archive.startRun(theArgs.args[1])
+        for thePID, content in archivePages(savedPages(theArgs.args[0]), writer):
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
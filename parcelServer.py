@@ -0,0 +1,357 @@
+'''
+Parcel Server
+
+A small local, read-only HTTP/JSON service for the questions we get asked
+("Map 408 lots 10-40", "everything owned by Smith", "what's at 28 Acorn
+Hill Rd", "which parcel is Book 5123 Page 12") without grepping the .tsv files.
+
+It loads a scrape's output directory (ScrapeDataXX.tsv, and OwnerHistory.tsv
+for the older deeds) into memory and indexes it by:
+- PID
+- Map and Lot (the MBLU split into Map/Lot/Unit/Sub by scrapevgsi.py)
+- street name and number (as parse_street_name() splits them)
+- owner (Owner, Owner of Record, Co-owner, and past owners), by prefix
+- Book and Page (the latest deed, and the deeds in the ownership history)
+
+Every parcel's JSON is made once, at load time, so an answer is a few
+dictionary lookups and a join. When a new run lands in the directory
+(scrapevgsi.py writes RunComplete.txt once its files are closed), a new
+set of indexes is built in the background and swapped in whole: a request sees either the old
+run or the new one, never a mixture.
+
+    GET /pid/837
+    GET /map/408?lots=10-40             (or /map/408 for the whole map)
+    GET /address?q=28 Acorn Hill Rd     (or just the street: ?q=Acorn Hill Rd)
+    GET /owner?q=BROWN, RICHARD         (every owner name that starts with it)
+    GET /bookpage/4394/498
+    GET /status
+
+Each answer is a JSON list of parcels (the ScrapeDataXX.tsv columns).
+
+Usage:
+    python parcelServer.py -d ScrapedData-Oct2024 [--port 8081] [--poll 10]
+'''
+
+import sys
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+from vgsiRecords import outputFiles, runMarker
+
+parcelFile = dict(outputFiles)["parcel"]
+ownersFile = dict(outputFiles)["owners"]
+fillerPattern = re.compile(r"Problem loading|Can't reach the server|Information suppressed")
+streetPattern = re.compile(r"([-+\ \d]+)(\s+[a-zA-Z].*)")
+numberPattern = re.compile(r"\d+")
+# Spelled-out street types, as Vision abbreviates them
+streetTypes = {"ROAD": "RD", "STREET": "ST", "LANE": "LN", "DRIVE": "DR", "AVENUE": "AVE",
+               "HIGHWAY": "HWY", "TURNPIKE": "TPKE", "CIRCLE": "CIR", "COURT": "CT",
+               "PLACE": "PL", "TERRACE": "TER", "EXTENSION": "EXT", "MOUNTAIN": "MTN"}
+
+
+'''
+streetKey() - "Acorn Hill Road" and "ACORN HILL RD" -> "ACORN HILL RD"
+'''
+def streetKey(name):
+    words = re.sub(r"[^A-Z0-9 ]", " ", name.upper()).split()
+    return " ".join(streetTypes.get(word, word) for word in words)
+
+
+'''
+splitAddress() - "28 Acorn Hill Rd" -> "28", "ACORN HILL RD"
+(the same split as scrapevgsi.parse_street_name())
+'''
+def splitAddress(text):
+    match = streetPattern.match(text)
+    if match:
+        return match.group(1).strip(), streetKey(match.group(2))
+    return "", streetKey(text)
+
+
+def nameKey(name):
+    return " ".join(re.sub(r"[^A-Z0-9&' ]", " ", name.upper()).split())
+
+
+def bookPageKey(book, page):
+    return "%s/%s" % (book.strip().lstrip("0") or "0", page.strip().lstrip("0") or "0")
+
+
+'''
+lotNumber() - the number a lot sorts by, for ranges: "10" -> 10, "10-1" -> 10
+Lots without a number (rare) sort first
+'''
+def lotNumber(lot):
+    match = numberPattern.search(lot)
+    return int(match.group()) if match else -1
+
+
+'''
+sourceStamp() - what changes when a new run lands: the end-of-run marker's mtime
+None while a run is being written (the marker is removed when it starts)
+'''
+def sourceStamp(directory):
+    try:
+        st = os.stat(os.path.join(directory, runMarker))
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def readTsv(fileName):
+    with open(fileName, "rt", encoding="utf-8-sig") as f:
+        heading = f.readline().rstrip("\r\n").split("\t")
+        for line in f:
+            yield heading, line.rstrip("\r\n").split("\t")
+
+
+'''
+ParcelIndex - one run's parcels, and the indexes over them
+Never changed once built; a reload builds a new one
+'''
+
+
+class ParcelIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self.stamp = sourceStamp(directory)
+        self.loadedAt = datetime.now().isoformat(timespec="seconds")
+        self.parcels = {}           # PID -> the parcel's JSON (bytes)
+        self.maps = {}              # Map -> sorted [[lot number, Lot, PID]]
+        self.streets = {}           # street -> {number: [PIDs]}
+        self.owners = {}            # owner -> [PIDs]
+        self.bookPages = {}         # "book/page" -> [PIDs]
+
+        for heading, row in readTsv(os.path.join(directory, parcelFile)):
+            if not row[0].strip().isdigit() or (len(row) > 1 and fillerPattern.search(row[1])):
+                continue
+            parcel = dict(zip(heading, row))
+            pid = parcel["PID"].strip()
+            self.parcels[pid] = json.dumps(parcel).encode()
+            self.maps.setdefault(parcel.get("Map", "").strip(), []).append(
+                [lotNumber(parcel.get("Lot", "")), parcel.get("Lot", "").strip(), pid])
+            street = streetKey(parcel.get("StreetName", ""))
+            number = parcel.get("StreetNum", "").strip()
+            self.streets.setdefault(street, {}).setdefault(number, []).append(pid)
+            for column in ["Owner", "Owner of Record", "Co-owner"]:
+                self.addOwner(parcel.get(column, ""), pid)
+            if parcel.get("Book", "").strip():
+                self.addBookPage(parcel["Book"], parcel.get("Page", ""), pid)
+
+        if os.path.exists(os.path.join(directory, ownersFile)):
+            for heading, row in readTsv(os.path.join(directory, ownersFile)):
+                sale = dict(zip(heading, row))
+                pid = sale.get("PID", "").strip()
+                if pid not in self.parcels:
+                    continue
+                self.addOwner(sale.get("Owner", ""), pid)
+                if sale.get("Book", "").strip():
+                    self.addBookPage(sale["Book"], sale.get("Page", ""), pid)
+
+        for lots in self.maps.values():
+            lots.sort()
+        self.ownerNames = sorted(self.owners)
+
+    def addOwner(self, name, pid):
+        key = nameKey(name)
+        if key:
+            pids = self.owners.setdefault(key, [])
+            if pid not in pids:
+                pids.append(pid)
+
+    def addBookPage(self, book, page, pid):
+        pids = self.bookPages.setdefault(bookPageKey(book, page), [])
+        if pid not in pids:
+            pids.append(pid)
+
+    def byPID(self, pid):
+        return [pid] if pid in self.parcels else []
+
+    '''
+    byMap() - the PIDs on a map, optionally only lots first..last (inclusive)
+    '''
+    def byMap(self, theMap, first=None, last=None):
+        lots = self.maps.get(theMap.strip(), [])
+        lo = 0 if first is None else bisect_left(lots, [first])
+        hi = len(lots) if last is None else bisect_right(lots, [last + 1])
+        return [pid for number, lot, pid in lots[lo:hi]]
+
+    def byAddress(self, text):
+        number, street = splitAddress(text)
+        numbers = self.streets.get(street, {})
+        if number:
+            return list(numbers.get(number, []))
+        return [pid for pids in numbers.values() for pid in pids]
+
+    '''
+    byOwner() - the PIDs of every owner name that starts with "text"
+    '''
+    def byOwner(self, text, limit=500):
+        key = nameKey(text)
+        if not key:
+            return []
+        result = []
+        i = bisect_left(self.ownerNames, key)
+        while i < len(self.ownerNames) and self.ownerNames[i].startswith(key) and len(result) < limit:
+            for pid in self.owners[self.ownerNames[i]]:
+                if pid not in result:
+                    result.append(pid)
+            i += 1
+        return result
+
+    def byBookPage(self, book, page):
+        return list(self.bookPages.get(bookPageKey(book, page), []))
+
+    def answer(self, pids):
+        return b"[" + b",".join(self.parcels[pid] for pid in pids) + b"]"
+
+
+'''
+IndexHolder - the current ParcelIndex, and the thread that replaces it
+A new run is only loaded once its end-of-run marker appears (scrapevgsi.py
+writes its files as it goes, and the marker when they are closed). A load
+that overlaps the start of yet another run is thrown away, and a failed
+load keeps the old index.
+'''
+
+
+class IndexHolder:
+    def __init__(self, directory, poll=10.0, fe=sys.stderr):
+        self.directory = directory
+        self.poll = poll
+        self.fe = fe
+        self.current = ParcelIndex(directory)
+
+    def checkForNewRun(self):
+        stamp = sourceStamp(self.directory)
+        if stamp is None or stamp == self.current.stamp:
+            return
+        try:
+            index = ParcelIndex(self.directory)
+        except Exception as e:
+            print("Reload failed, keeping the old run: %s" % e, file=self.fe)
+            return
+        if sourceStamp(self.directory) != stamp:
+            return                          # another run started while loading; wait for it
+        self.current = index                # one assignment: atomic for the readers
+        print("%s: reloaded %d parcels" % (index.loadedAt, len(index.parcels)), file=self.fe)
+
+    def watch(self):
+        while True:
+            time.sleep(self.poll)
+            self.checkForNewRun()
+
+    def start(self):
+        if self.poll > 0:
+            threading.Thread(target=self.watch, daemon=True).start()
+
+
+'''
+lotRange() - "10-40" -> 10, 40; "12" -> 12, 12; "" -> None, None
+'''
+def lotRange(text):
+    if not text:
+        return None, None
+    first, _, last = text.replace("\u2013", "-").partition("-")
+    return int(first), int(last or first)
+
+
+class ParcelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True      # headers and body go out separately; don't wait for an ACK
+    holder = None               # set by makeServer()
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        index = self.holder.current         # the same run for the whole request
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        try:
+            if parts[0] == "pid" and len(parts) == 2:
+                body = index.answer(index.byPID(parts[1]))
+            elif parts[0] == "map" and len(parts) == 2:
+                body = index.answer(index.byMap(parts[1], *lotRange(query.get("lots"))))
+            elif parts[0] == "address":
+                body = index.answer(index.byAddress(query.get("q", "")))
+            elif parts[0] == "owner":
+                body = index.answer(index.byOwner(query.get("q", "")))
+            elif parts[0] == "bookpage" and len(parts) == 3:
+                body = index.answer(index.byBookPage(parts[1], parts[2]))
+            elif parts[0] == "status":
+                body = json.dumps({"directory": index.directory, "loadedAt": index.loadedAt,
+                                   "parcels": len(index.parcels)}).encode()
+            else:
+                self.send(404, json.dumps({"error": "Unknown request: %s" % url.path}).encode())
+                return
+        except ValueError as e:
+            self.send(400, json.dumps({"error": str(e)}).encode())
+            return
+        self.send(200, body)
+
+    def send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def makeServer(holder, host="127.0.0.1", port=0, verbose=False):
+    handler = type("Handler", (ParcelHandler,), {"holder": holder, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+'''
+Main Function - load the run, serve until ^C
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-d", '--directory', default=".",
+                            help="The scrape's output directory (with ScrapeDataXX.tsv)")
+        parser.add_argument('--host', default="127.0.0.1")
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--poll', type=float, default=10.0,
+                            help="Seconds between checks for a new run (0: never reload)")
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('-v', '--verbose', action="store_true", help="Log each request")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    try:
+        holder = IndexHolder(theArgs.directory, theArgs.poll, fe)
+    except OSError as e:
+        return "Can't load %s: %s" % (theArgs.directory, e)
+    holder.start()
+    server = makeServer(holder, theArgs.host, theArgs.port, theArgs.verbose)
+    print("Serving %d parcels from %s on http://%s:%d/" % (len(holder.current.parcels), theArgs.directory,
+                                                           theArgs.host, server.server_address[1]), file=fe)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+'''
+Parcel Store
+
+Every dated run of scrapevgsi.py (ScrapeDataXX.tsv, the Output/*.tsv files)
+repeats every field of every parcel, though only a few of them change
+from one run to the next. This store keeps just the changes, as
+"slowly changing dimension" (type 2) versions: each version of a field
+of a parcel has the value and the dates it was valid from/to.
+
+"What was PID 837's assessment on 2022-01-11?" or "how has PID 837's
+owner changed?" are then a binary search away.
+
+The versions are kept in columns, one file per column, sorted by
+PID, field, and valid-from date:
+- pid.u32, field.u16, from.i32, to.i32, value.u32
+- dates are day numbers (date.toordinal()); "to" is openEnd while current
+- values are numbers in a string table (strings.dat + strings.off),
+  so "RESIDENTIAL" is stored once, however many parcels have it
+- fields.tsv names the fields; runs.tsv lists the runs ingested
+
+Reads memory-map the column files (memoryview, no copying), so a lookup
+only touches the few pages holding that PID. Disk use grows with the
+number of changes, not the number of runs (the Version, CollectedOn and
+Record# columns, which differ every run, aren't kept).
+
+Usage:
+    python parcelStore.py -s ParcelStore ingest Output/11Oct2021.tsv Output/12Jan2022.tsv ...
+    python parcelStore.py -s ParcelStore asof 837 2022-01-11 [Assessment]
+    python parcelStore.py -s ParcelStore history 837 Assessment
+    python parcelStore.py -s ParcelStore runs
+'''
+
+import sys
+import argparse
+import csv
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+from vgsiRecords import ParcelSchema, toDate, toStr, formatValue
+
+openEnd = 2 ** 31 - 1
+columnFiles = [["pid", "I"], ["field", "H"], ["from", "i"], ["to", "i"], ["value", "I"]]
+monthDayYear = re.compile(r"(\d{1,2})([A-Za-z]{3})[a-z]*[-_ ]?(\d{4})")
+isoDate = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+fillerPattern = re.compile(r"Problem loading|Can't reach the server|Information suppressed")
+runColumns = {"Version", "CollectedOn", "Record#"}     # about the run, not the parcel: not versioned
+usDate = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})$")
+numberCleanup = re.compile(r'[$,\s"]')
+
+# The snapshots' headings have drifted over the years (see snapshotLoader.py).
+# Old heading -> current heading
+columnAliases = {
+    "Improvements": "Curr. App. Imp",
+    "Land": "Curr. App. Land",
+    "Total": "Curr. App. Tot",
+    "Prev. Assess.": "Prev. Ass. Tot",
+    "Prev. Apprais": "Prev. App. Tot",
+}
+
+# Old runs wrote the time and the record count in two columns with no heading
+unnamedColumns = ["CollectedOn", "Record#"]
+
+# Columns filled in from another column: [column, source column, function]
+derivedColumns = [
+    [["StreetNum", "StreetName"], "Street Address", lambda s: splitStreet(s)],
+    [["Map", "Lot", "Unit", "Sub"], "MBLU", lambda s: splitParts(s, 4)],
+    [["Book", "Page"], "Book&Page", lambda s: splitParts(s, 2)],
+]
+streetPattern = re.compile(r'([-+\ \d]+)(\s+[a-zA-Z].*)')
+
+'''
+runDate() - the date of a run from its file name ("12Jan2022.tsv", "2022-01-11.tsv")
+Return None if there isn't one
+'''
+def runDate(fileName):
+    name = os.path.basename(fileName)
+    m = isoDate.search(name)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = monthDayYear.search(name)
+    if m:
+        try:
+            return datetime.strptime("%s%s%s" % (m.group(1), m.group(2).capitalize(), m.group(3)),
+                                     "%d%b%Y").date()
+        except ValueError:
+            return None
+    return None
+
+
+'''
+currentColumns() - the current ScrapeDataXX.tsv heading, as a list
+'''
+def currentColumns():
+    from scrapevgsi import displayHeading
+    return displayHeading().split("\t")
+
+
+'''
+mapHeading() - where each column of a file goes in the current columns
+Return [{file column position: current column}, [columns with nowhere to go]]
+'''
+def mapHeading(heading, columns):
+    wanted = set(columns)
+    derivedFrom = set(source for targets, source, split in derivedColumns)
+    mapping = {}
+    unmapped = []
+    for i, name in enumerate(heading):
+        target = columnAliases.get(name, name)
+        if target in wanted and target not in mapping.values():
+            mapping[i] = target
+        elif name and name not in derivedFrom:
+            unmapped.append(name)
+    return [mapping, unmapped]
+
+
+def splitStreet(s):
+    m = streetPattern.match(s)
+    if m:
+        return [m.group(1).strip(), m.group(2).strip()]
+    return ["", s.strip()]
+
+
+def splitParts(s, count):
+    parts = [p.strip() for p in s.split("/")]
+    return (parts + [""] * count)[:count]
+
+
+'''
+readText() - the heading and the rows of a .tsv or .csv file
+(csv rather than pandas.read_csv: the rows are often longer than the heading)
+'''
+def readText(fileName):
+    delimiter = "," if fileName.lower().endswith(".csv") else "\t"
+    with open(fileName, "rt", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter,
+                            quoting=csv.QUOTE_MINIMAL if delimiter == "," else csv.QUOTE_NONE)
+        heading = [c.strip() for c in next(reader, [])]
+        rows = [row for row in reader if row]
+    while heading and not heading[-1]:
+        heading.pop()
+    width = max([len(heading)] + [len(row) for row in rows])
+    for n in range(width - len(heading)):
+        heading.append(unnamedColumns[n] if n < len(unnamedColumns) else "")
+    return [heading, rows]
+
+
+'''
+parseDate() - a date from "2018-06-29", "06/29/2018" or "6/29/18"; None if it isn't one
+'''
+def parseDate(text):
+    try:
+        if isoDate.fullmatch(text):
+            return date.fromisoformat(text)
+        m = usDate.match(text)
+        if m:
+            return datetime.strptime(text, "%m/%d/%Y" if len(m.group(3)) == 4 else "%m/%d/%y").date()
+    except ValueError:
+        pass
+    return None
+
+
+'''
+normalValue() - a value as the current runs write it, whatever the file's formatting:
+"$688,600 " and 688600 -> 688600, 10/12/18 -> 2018-10-12 (the column's converter says which)
+Text that won't convert is kept as it is (trimmed)
+'''
+def normalValue(value, converter):
+    text = value.strip().strip('"').strip()
+    if converter is toDate:
+        day = parseDate(text)
+        return day.isoformat() if day else text
+    if converter is not toStr:
+        typed = converter(numberCleanup.sub("", text))
+        if not isinstance(typed, str):
+            return formatValue(typed)
+    return text
+
+
+'''
+readRun() - {PID: {field: value}} from a run's .tsv (or .csv) file
+The file's columns are mapped onto the current ones (as snapshotLoader.py
+does; columns with nowhere to go keep their own names), and the values are
+normalized, so a change of formatting from one run to the next isn't a change.
+Filler lines ("Problem loading parcel PID", ...) tell us nothing, and are skipped
+'''
+def readRun(fileName):
+    columns = currentColumns()
+    converters = dict(zip(columns, ParcelSchema(columns).converters))
+    heading, rows = readText(fileName)
+    mapping, unmapped = mapHeading(heading, columns)
+    names = {i: name for i, name in enumerate(heading) if i > 0 and name in unmapped}
+    names.update({i: name for i, name in mapping.items() if i > 0})
+    derived = [[targets, heading.index(source), split] for targets, source, split in derivedColumns
+               if source in heading and not all(t in mapping.values() for t in targets)]
+    result = {}
+    for row in rows:
+        pid = row[0].strip().lstrip("\ufeff")
+        if not pid.isdigit() or any(fillerPattern.search(c) for c in row[1:3]):
+            continue
+        values = {}
+        for targets, i, split in derived:
+            if i < len(row):
+                values.update(zip(targets, split(row[i].strip().strip('"'))))
+        for i, name in names.items():
+            if i < len(row):
+                values[name] = row[i]
+        result[int(pid)] = {name: normalValue(value, converters.get(name, toStr))
+                            for name, value in values.items()}
+    return result
+
+
+'''
+ParcelStore - an existing or new store directory
+'''
+
+
+class ParcelStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.maps = []
+        self.load()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        self.close()
+        self.fields = []
+        if os.path.exists(self.path("fields.tsv")):
+            with open(self.path("fields.tsv"), "rt") as f:
+                self.fields = [line.rstrip("\n") for line in f]
+        self.fieldIDs = {name: i for i, name in enumerate(self.fields)}
+        self.runs = []
+        if os.path.exists(self.path("runs.tsv")):
+            with open(self.path("runs.tsv"), "rt") as f:
+                self.runs = [line.rstrip("\n").split("\t") for line in f]
+        self.cols = {}
+        for name, code in columnFiles + [["strings.off", "I"]]:
+            self.cols[name] = self.mapColumn(name if "." in name else name + "." + suffix(code), code)
+        self.strings = self.mapColumn("strings.dat", "B")
+
+    def mapColumn(self, fileName, code):
+        fullName = self.path(fileName)
+        if not os.path.exists(fullName) or os.path.getsize(fullName) == 0:
+            return memoryview(b"").cast(code)
+        with open(fullName, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(m)
+        return memoryview(m).cast(code)
+
+    def close(self):
+        for view in getattr(self, "cols", {}).values():
+            view.release()
+        if getattr(self, "strings", None) is not None:
+            self.strings.release()
+        for m in self.maps:
+            m.close()
+        self.maps = []
+        self.cols = {}
+        self.strings = None
+
+    def string(self, n):
+        offsets = self.cols["strings.off"]
+        return bytes(self.strings[offsets[n]:offsets[n + 1]]).decode("utf-8")
+
+    '''
+    pidRange() - [first, last+1) positions of a PID's versions
+    '''
+    def pidRange(self, pid):
+        pids = self.cols["pid"]
+        return bisect_left(pids, pid), bisect_right(pids, pid)
+
+    '''
+    asOf() - {field: value} for a PID on a date (only the fields known then)
+    '''
+    def asOf(self, pid, when, field=None):
+        day = when.toordinal()
+        lo, hi = self.pidRange(int(pid))
+        fieldCol, fromCol, toCol, valueCol = [self.cols[c] for c in ["field", "from", "to", "value"]]
+        wanted = self.fieldIDs.get(field) if field else None
+        result = {}
+        for i in range(lo, hi):
+            if wanted is not None and fieldCol[i] != wanted:
+                continue
+            if fromCol[i] <= day < toCol[i]:
+                result[self.fields[fieldCol[i]]] = self.string(valueCol[i])
+        return result
+
+    '''
+    history() - [[valid from, valid to (None if current), value], ...] of one field
+    '''
+    def history(self, pid, field):
+        fieldID = self.fieldIDs.get(field)
+        if fieldID is None:
+            return []
+        lo, hi = self.pidRange(int(pid))
+        fieldCol, fromCol, toCol, valueCol = [self.cols[c] for c in ["field", "from", "to", "value"]]
+        result = []
+        for i in range(lo, hi):
+            if fieldCol[i] == fieldID:
+                result.append([date.fromordinal(fromCol[i]),
+                               None if toCol[i] == openEnd else date.fromordinal(toCol[i]),
+                               self.string(valueCol[i])])
+        return result
+
+    '''
+    ingest() - add a run: close the versions whose value changed, open new ones
+    Runs must be added in date order. A field (or a whole parcel) missing from
+    a run is "no news": its current version stays open. A second run on the
+    same day (a re-scrape, the .csv of a .tsv) corrects that day's values;
+    a correction back to the value before that day drops the day's version
+    and reopens the one it closed.
+    The runColumns (when and in what order the run collected the parcel)
+    change every run, so they're left out.
+    '''
+    def ingest(self, rows, when, source=""):
+        day = when.toordinal()
+        if self.runs and day < date.fromisoformat(self.runs[-1][0]).toordinal():
+            raise ValueError("%s is before the latest run in the store (%s)" % (when, self.runs[-1][0]))
+
+        # Load everything into plain lists (the store is small: it only holds changes)
+        strings = [self.string(n) for n in range(max(0, len(self.cols["strings.off"]) - 1))]
+        stringIDs = {s: n for n, s in enumerate(strings)}
+        versions = list(zip(*[self.cols[c].tolist() for c, code in columnFiles]))
+        current = {}
+        closedToday = {}            # the version each of today's versions closed
+        for n, (pid, field, start, end, value) in enumerate(versions):
+            if end == openEnd:
+                current[(pid, field)] = n
+            elif end == day:
+                closedToday[(pid, field)] = n
+        versions = [list(v) for v in versions]
+        fields = list(self.fields)
+        fieldIDs = dict(self.fieldIDs)
+
+        changes = 0
+        for pid, values in rows.items():
+            for name, value in values.items():
+                if name in runColumns:
+                    continue
+                if name not in fieldIDs:
+                    fieldIDs[name] = len(fields)
+                    fields.append(name)
+                if value not in stringIDs:
+                    stringIDs[value] = len(strings)
+                    strings.append(value)
+                key = (pid, fieldIDs[name])
+                n = current.get(key)
+                if n is not None and versions[n][4] == stringIDs[value]:
+                    continue
+                changes += 1
+                if n is not None and versions[n][2] == day:
+                    previous = closedToday.get(key)
+                    if previous is not None and versions[previous][4] == stringIDs[value]:
+                        versions[n] = None              # today's value was wrong after all
+                        versions[previous][3] = openEnd
+                        current[key] = previous
+                        del closedToday[key]
+                    else:
+                        versions[n][4] = stringIDs[value]
+                    continue
+                if n is not None:
+                    versions[n][3] = day
+                    closedToday[key] = n
+                current[key] = len(versions)
+                versions.append([pid, fieldIDs[name], day, openEnd, stringIDs[value]])
+        versions = sorted(v for v in versions if v is not None)
+        self.close()
+        self.write(fields, strings, versions)
+        with open(self.path("runs.tsv"), "at") as f:
+            print("%s\t%s\t%d" % (when.isoformat(), source, changes), file=f)
+        self.load()
+        return changes
+
+    '''
+    write() - write each file as NAME.new, then os.replace() it, so a reader
+    that has the old file memory-mapped keeps its (complete) old copy
+    '''
+    def write(self, fields, strings, versions):
+        names = []
+        offsets = array("I", [0])
+        with open(self.path("strings.dat.new"), "wb") as f:
+            for s in strings:
+                data = s.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        names.append("strings.dat")
+        with open(self.path("strings.off.new"), "wb") as f:
+            offsets.tofile(f)
+        names.append("strings.off")
+        for col, (name, code) in enumerate(columnFiles):
+            with open(self.path(name + "." + suffix(code) + ".new"), "wb") as f:
+                array(code, [v[col] for v in versions]).tofile(f)
+            names.append(name + "." + suffix(code))
+        with open(self.path("fields.tsv.new"), "wt") as f:
+            for name in fields:
+                print(name, file=f)
+        names.append("fields.tsv")
+        for name in names:
+            os.replace(self.path(name + ".new"), self.path(name))
+
+
+def suffix(code):
+    return {"I": "u32", "H": "u16", "i": "i32"}[code]
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-s", '--store', default="ParcelStore", help="Store directory")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Date of the run being ingested (default: from its file name)")
+        parser.add_argument('command', choices=["ingest", "asof", "history", "runs"])
+        parser.add_argument('args', nargs='*')
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    store = ParcelStore(theArgs.store)
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+    if theArgs.command == "ingest":
+        runs = []
+        for fileName in theArgs.args:
+            when = theArgs.date or runDate(fileName)
+            if when is None:
+                return "Can't tell the date of %s - use --date" % fileName
+            runs.append([when, fileName])
+        for when, fileName in sorted(runs):
+            changes = store.ingest(readRun(fileName), when, fileName)
+            print("%s %s: %d changes" % (when, fileName, changes), file=fe)
+    elif theArgs.command == "asof":
+        if len(theArgs.args) < 2:
+            return "asof needs a PID and a date (and optionally a field)"
+        field = theArgs.args[2] if len(theArgs.args) > 2 else None
+        for name, value in store.asOf(theArgs.args[0], date.fromisoformat(theArgs.args[1]), field).items():
+            print("%s\t%s" % (name, value), file=fo)
+    elif theArgs.command == "history":
+        if len(theArgs.args) != 2:
+            return "history needs a PID and a field"
+        for start, end, value in store.history(theArgs.args[0], theArgs.args[1]):
+            print("%s\t%s\t%s" % (start, end or "", value), file=fo)
+    elif theArgs.command == "runs":
+        for run in store.runs:
+            print("\t".join(run), file=fo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
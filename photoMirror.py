@@ -0,0 +1,223 @@
+'''
+Photo Mirror
+
+Keep a local copy of the building photos the parcel pages point at
+(MainContent_ctlNN_imgPhoto -> images.vgsi.com/photos/LymeNHPhotos/...),
+for field review.
+
+scrapevgsi.py --photos DIR picks the photo URLs out of each page as it
+goes by (like --archive), and hands them to a small pool of download
+threads (--photo-workers, default 4), so fetching pages and parsing them
+never waits for a photo. At the end of the run it waits for the
+downloads and writes Photos.tsv (PID, Building #, URL, Image, Status)
+next to the other output files.
+
+The mirror directory holds:
+- objects/ab/abcd...jpg - each image, named by the SHA-256 of its bytes,
+  so the hundreds of pages showing the same default.jpg placeholder
+  (or the same photo under two URLs) share one file
+- urls.tsv - URL, ETag, Last-Modified, SHA-256 of each URL fetched so far
+
+A URL is fetched once per run, and a URL already in urls.tsv is asked for
+with If-None-Match/If-Modified-Since, so an unchanged image costs a
+"304 Not Modified" and no bytes.
+
+Vision's URLs sometimes have backslashes ("LymeNHPhotos//\\00\\00\\23\\73.jpg");
+they're turned into slashes, as a browser would.
+--photo-host sends the requests somewhere else (e.g. mockVGSI.py, which
+serves made-up images at /photos/...), keeping the original URLs in the index.
+
+Usage:
+    python scrapevgsi.py --pids pids.txt --photos Photos
+    python scrapevgsi.py -u http://localhost:8080/lymeNH/ --photos /tmp/photos --photo-host http://localhost:8080
+    python photoMirror.py -m Photos -i Photos.tsv          # check that every image in the index is there
+'''
+
+import sys
+import argparse
+import csv
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+photoPattern = re.compile(rb'<img\b[^>]*\bid="MainContent_ctl(\d\d)_imgPhoto"[^>]*>', re.I)
+srcPattern = re.compile(rb'\bsrc="([^"]*)"', re.I)
+hostPattern = re.compile(r"^[a-z]+://[^/]+", re.I)
+indexColumns = ["PID", "Building #", "URL", "Image", "Status"]
+
+
+'''
+pagePhotos() - [[building #, URL], ...] of the photos on a page
+'''
+def pagePhotos(content):
+    photos = []
+    for m in photoPattern.finditer(content):
+        src = srcPattern.search(m.group(0))
+        if src:
+            url = src.group(1).decode("utf-8", "replace").replace("&amp;", "&").replace("\\", "/")
+            photos.append([int(m.group(1)), url])
+    return photos
+
+
+'''
+PhotoMirror - the mirror directory, and the pool downloading into it
+'''
+
+
+class PhotoMirror:
+    def __init__(self, directory, workers=4, host=None, timeout=30, fe=sys.stderr):
+        self.directory = directory
+        self.host = host.rstrip("/") if host else None
+        self.timeout = timeout
+        self.fe = fe
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self.known = {}                 # URL -> [ETag, Last-Modified, SHA-256]
+        if os.path.exists(self.path("urls.tsv")):
+            with open(self.path("urls.tsv"), "rt", encoding="utf-8") as f:
+                for line in f:
+                    url, etag, modified, digest = line.rstrip("\n").split("\t")
+                    self.known[url] = [etag, modified, digest]
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo")
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending = {}               # URL -> future of [image, status]
+        self.photos = []                # [PID, building #, URL]
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    '''
+    add() - note a page's photos, and queue the URLs not seen yet this run
+    '''
+    def add(self, pid, content):
+        for building, url in pagePhotos(content):
+            self.photos.append([pid, building, url])
+            if url not in self.pending:
+                self.pending[url] = self.pool.submit(self.fetch, url)
+
+    def objectName(self, digest, url):
+        ext = os.path.splitext(url)[1].lower()
+        return os.path.join("objects", digest[:2], digest + (ext if len(ext) <= 5 else ""))
+
+    '''
+    fetch() - (in a pool thread) make sure the image at "url" is in the mirror
+    Return [image file, "new"/"unchanged"/"duplicate"/"error: ..."]
+    '''
+    def fetch(self, url):
+        import requests
+        session = getattr(self.local, "session", None)
+        if session is None:
+            requests.packages.urllib3.disable_warnings()
+            session = self.local.session = requests.Session()
+        with self.lock:
+            etag, modified, digest = self.known.get(url, ["", "", ""])
+        headers = {}
+        if digest and os.path.exists(self.path(self.objectName(digest, url))):
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+        target = hostPattern.sub(self.host, url) if self.host else url
+        try:
+            response = session.get(target, headers=headers, timeout=self.timeout, verify=False)
+        except requests.exceptions.RequestException as e:
+            return ["", "error: %s" % type(e).__name__]
+        if response.status_code == 304:
+            return [self.objectName(digest, url), "unchanged"]
+        if response.status_code != 200:
+            return ["", "error: HTTP %d" % response.status_code]
+        body = response.content
+        newDigest = hashlib.sha256(body).hexdigest()
+        name = self.objectName(newDigest, url)
+        if os.path.exists(self.path(name)):
+            status = "unchanged" if newDigest == digest else "duplicate"
+        else:
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+            with open(self.path(name) + ".%d.new" % threading.get_ident(), "wb") as f:
+                f.write(body)
+            os.replace(self.path(name) + ".%d.new" % threading.get_ident(), self.path(name))
+            status = "new"
+        with self.lock:
+            self.known[url] = [response.headers.get("ETag", ""),
+                               response.headers.get("Last-Modified", ""), newDigest]
+        return [name, status]
+
+    '''
+    finish() - wait for the downloads, write urls.tsv and the index (Photos.tsv)
+    Return {status: count} of the URLs
+    '''
+    def finish(self, indexFile):
+        self.pool.shutdown(wait=True)
+        results = {url: future.result() for url, future in self.pending.items()}
+        with open(self.path("urls.tsv.new"), "wt", encoding="utf-8") as f:
+            for url, values in sorted(self.known.items()):
+                print("\t".join([url] + values), file=f)
+        os.replace(self.path("urls.tsv.new"), self.path("urls.tsv"))
+        with open(indexFile, "wt") as f:
+            print("\t".join(indexColumns), file=f)
+            for pid, building, url in self.photos:
+                image, status = results[url]
+                print("%s\t%d\t%s\t%s\t%s" % (pid, building, url, image, status), file=f)
+        counts = {}
+        for image, status in results.values():
+            status = status.split(":")[0]
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def report(self, counts, fe=None):
+        print("Photos: %d on %d pages, %d URLs: %s" % (
+            len(self.photos), len(set(p[0] for p in self.photos)), len(self.pending),
+            ", ".join("%d %s" % (n, status) for status, n in sorted(counts.items())) or "none"),
+            file=fe or self.fe)
+
+
+'''
+photoPages() - pass the (PID, content) pages through, collecting their photos
+'''
+def photoPages(pages, mirror):
+    for thePID, content in pages:
+        if thePID != "" and content is not None:
+            mirror.add(thePID, content)
+        yield thePID, content
+
+
+'''
+Main Function - check an index against the mirror
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-m", '--mirror', default="Photos", help="Mirror directory")
+        parser.add_argument("-i", '--infile', nargs='?',
+                            type=argparse.FileType('rt', encoding='utf-8-sig'), default=sys.stdin,
+                            help="A run's Photos.tsv")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fo = theArgs.outfile
+    photos = images = missing = 0
+    seen = set()
+    for row in csv.DictReader(theArgs.infile, delimiter="\t", quoting=csv.QUOTE_NONE):
+        photos += 1
+        image = row["Image"]
+        if image and image not in seen:
+            seen.add(image)
+            images += 1
+        if not image or not os.path.exists(os.path.join(theArgs.mirror, image)):
+            missing += 1
+            print("%s\t%s\t%s\t%s" % (row["PID"], row["Building #"], row["URL"], row["Status"]), file=fo)
+    print("%d photos, %d distinct images, %d missing" % (photos, images, missing), file=theArgs.errfile)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
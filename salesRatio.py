@@ -0,0 +1,276 @@
+'''
+Sales Ratio Study
+
+The IAAO sales-ratio statistics for the town, from the scraped files,
+so the study can be rerun after every scrape instead of by hand in a spreadsheet.
+
+- Sales come from OwnerHistory.tsv. A sale is "qualified" if its price
+  is at least --min-price, its instrument is one of --instruments (if given),
+  and its Book&Page isn't shared with another parcel (multi-parcel sales
+  can't be split into per-parcel prices).
+- Each sale is matched to the parcel's assessment for the year of the sale
+  (AssmtHistory.tsv), or with --nearest, the latest assessment year before it.
+- Zoning District, Neighborhood and Land Use Code come from ScrapeDataXX.tsv.
+
+For the whole town, and for each Zoning District, Neighborhood,
+Land Use Code and sale-price decile, it reports:
+- N, median ratio, mean ratio, weighted mean ratio (total assessed / total price)
+- COD - coefficient of dispersion (average % deviation from the median)
+- PRD - price-related differential (mean / weighted mean)
+- PRB - price-related bias (% change in ratio when value doubles)
+- bootstrap confidence intervals for the median, COD, PRD and PRB
+
+All the statistics, including the bootstrap resamples, are computed
+with NumPy arrays - one resample per row - so a full run takes a fraction
+of a second.
+
+Usage:
+    python salesRatio.py -s ScrapeDataXX.tsv --owners OwnerHistory.tsv \\
+        --assessments AssmtHistory.tsv --since 2019 -o SalesRatio.tsv
+'''
+
+import sys
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+groupColumns = ["Zoning District", "Neighborhood", "Land Use Code"]
+resultColumns = ["Group", "Value", "N", "Median", "Median Lo", "Median Hi",
+                 "Mean", "Wtd Mean", "COD", "COD Lo", "COD Hi",
+                 "PRD", "PRD Lo", "PRD Hi", "PRB", "PRB Lo", "PRB Hi"]
+
+'''
+readTable() - a .tsv or .csv file (with a heading line) as a DataFrame of strings
+"Problem loading parcel PID" filler lines are dropped later, when the
+numbers don't convert.  Rows with more fields than the heading (wide
+historical scrapes) have their extra fields dropped instead of turning the
+first column into the index.
+'''
+def readTable(fileName):
+    sep = "," if fileName.lower().endswith(".csv") else "\t"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", pd.errors.ParserWarning)
+        df = pd.read_csv(fileName, sep=sep, dtype=str, keep_default_na=False,
+                         index_col=False, encoding="utf-8-sig", quoting=3 if sep == "\t" else 0)
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+
+def toNumbers(series):
+    return pd.to_numeric(series.str.replace(r"[$,]", "", regex=True).str.strip(), errors="coerce")
+
+
+'''
+qualifiedSales() - one row per qualified sale: PID, Price, Year, Book&Page
+'''
+def qualifiedSales(owners, minPrice=1000, instruments=None, since=None):
+    sales = pd.DataFrame({
+        "PID": toNumbers(owners["PID"]),
+        "Price": toNumbers(owners["Sale Price"]),
+        "Date": pd.to_datetime(owners["Sale Date"], errors="coerce"),
+        "Book&Page": owners["Book&Page"].str.strip(),
+        "Instrument": owners["Instrument"].str.strip() if "Instrument" in owners else "",
+    }).dropna(subset=["PID", "Price", "Date"])
+    sales = sales.drop_duplicates(subset=["PID", "Book&Page", "Date", "Price"])   # merged histories repeat
+    sales = sales[sales["Price"] >= minPrice]
+    if instruments:
+        sales = sales[sales["Instrument"].isin(instruments)]
+    if since:
+        sales = sales[sales["Date"].dt.year >= since]
+    parcelsPerDeed = sales.groupby("Book&Page")["PID"].transform("nunique")
+    sales = sales[(parcelsPerDeed == 1) | (sales["Book&Page"] == "")]
+    sales = sales.assign(Year=sales["Date"].dt.year, PID=sales["PID"].astype(np.int64))
+    return sales
+
+
+'''
+assessmentsByYear() - PID, Year, Assessed (the latest collection of each PID/year)
+'''
+def assessmentsByYear(history):
+    yearColumn = [c for c in history.columns if c.endswith("Year")][0]
+    df = pd.DataFrame({
+        "PID": toNumbers(history["PID"]),
+        "Year": toNumbers(history[yearColumn]),
+        "Assessed": toNumbers(history["Total"]),
+        "CollectedOn": history["CollectedOn"] if "CollectedOn" in history else "",
+    }).dropna(subset=["PID", "Year", "Assessed"])
+    df = df.sort_values("CollectedOn").drop_duplicates(subset=["PID", "Year"], keep="last")
+    return df.astype({"PID": np.int64, "Year": np.int64})[["PID", "Year", "Assessed"]]
+
+
+'''
+studySales() - the qualified sales with their assessment and the parcel's groups
+'''
+def studySales(sales, assessments, parcels, nearest=False):
+    if nearest:
+        joined = pd.merge_asof(sales.sort_values("Year"), assessments.sort_values("Year"),
+                               on="Year", by="PID", direction="backward")
+    else:
+        joined = sales.merge(assessments, on=["PID", "Year"], how="left")
+    joined = joined.dropna(subset=["Assessed"])
+    joined = joined[joined["Assessed"] > 0]
+    attrs = pd.DataFrame({"PID": toNumbers(parcels["PID"])})
+    for c in groupColumns:
+        attrs[c] = parcels[c].str.strip() if c in parcels else ""
+    attrs = attrs.dropna(subset=["PID"]).astype({"PID": np.int64}).drop_duplicates("PID", keep="last")
+    joined = joined.merge(attrs, on="PID", how="left").fillna({c: "" for c in groupColumns})
+    joined["Ratio"] = joined["Assessed"] / joined["Price"]
+    return joined.reset_index(drop=True)
+
+
+'''
+bootstrapCounts() - "resamples" bootstrap resamples of n sales, as counts:
+row i says how many times each sale was drawn in resample i
+'''
+def bootstrapCounts(rng, n, resamples):
+    idx = rng.integers(0, n, size=(resamples, n))
+    idx += n * np.arange(resamples)[:, None]
+    return np.bincount(idx.ravel(), minlength=resamples * n).reshape(resamples, n).astype(float)
+
+
+'''
+ratioStatistics() - the statistics for each row of "counts"
+(how many times each sale is in that sample: row 0 is all ones - the
+actual sales - and the rest are bootstrap resamples).
+The sales must be sorted by ratio. logPrices is log2(prices).
+Returns a dict of 1-D arrays, one value per row.
+
+This is the hot spot of the study (a thousand resamples for every group).
+Working from counts over the sorted ratios avoids sorting or copying
+the resamples at all:
+- the median is where the running count passes n/2
+- sums are matrix-vector products, e.g. the weighted mean is
+  (counts @ (ratio * price)) / (counts @ price)
+- the absolute deviations from the median come from running sums
+  below and above the median's position
+- PRB's value proxy, (price + assessed / median) / 2, has
+  log2(proxy) = log2(price) + log2(1 + ratio / median) - 1;
+  the constant doesn't change the slope, and the slope of
+  (ratio - median) / median on x is
+  (sum(x * ratio) - n * mean(x) * mean(ratio)) / median / (sum(x * x) - n * mean(x)^2)
+'''
+def ratioStatistics(counts, ratios, prices, logPrices):
+    rows, n = counts.shape
+    running = np.cumsum(counts, axis=1)
+    lower = (running <= (n - 1) // 2).sum(axis=1)
+    upper = (running <= n // 2).sum(axis=1)
+    med = (ratios[lower] + ratios[upper]) / 2
+    total = counts @ ratios
+    mean = total / n
+    weighted = (counts @ (ratios * prices)) / (counts @ prices)
+    rowIndex = np.arange(rows)
+    countBelow = running[rowIndex, lower]
+    sumBelow = np.cumsum(counts * ratios, axis=1)[rowIndex, lower]
+    absDev = med * countBelow - sumBelow + (total - sumBelow) - med * (n - countBelow)
+    cod = 100.0 * absDev / n / med
+    prd = mean / weighted
+    g = ratios / med[:, None]
+    g += 1.0
+    np.log2(g, out=g)
+    cg = counts * g
+    xMean = (counts @ logPrices + cg.sum(axis=1)) / n
+    xr = counts @ (logPrices * ratios) + cg @ ratios
+    xx = counts @ (logPrices * logPrices) + 2 * (cg @ logPrices) + np.einsum("ij,ij->i", cg, g)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prb = (xr - n * xMean * mean) / med / (xx - n * xMean * xMean)
+    return {"Median": med, "Mean": mean, "Wtd Mean": weighted, "COD": cod, "PRD": prd, "PRB": prb}
+
+
+'''
+studyGroup() - statistics plus bootstrap confidence intervals for one set of sales
+'''
+def studyGroup(df, rng, resamples=1000, confidence=0.95):
+    df = df.sort_values("Ratio", kind="stable")
+    ratios = df["Ratio"].to_numpy(dtype=float)
+    prices = df["Price"].to_numpy(dtype=float)
+    n = len(ratios)
+    counts = np.ones((1, n))
+    if n >= 2 and resamples > 0:
+        counts = np.vstack([counts, bootstrapCounts(rng, n, resamples)])
+    stats = ratioStatistics(counts, ratios, prices, np.log2(prices))
+    result = {"N": n}
+    for k, v in stats.items():
+        result[k] = v[0]
+    if len(counts) == 1:
+        return result
+    tail = 100 * (1 - confidence) / 2
+    for k in ["Median", "COD", "PRD", "PRB"]:
+        lo, hi = np.nanpercentile(stats[k][1:], [tail, 100 - tail])
+        result[k + " Lo"] = lo
+        result[k + " Hi"] = hi
+    return result
+
+
+'''
+salesRatioStudy() - the whole study: the town, then each breakdown
+Returns a DataFrame with the resultColumns
+'''
+def salesRatioStudy(study, resamples=1000, confidence=0.95, seed=None, deciles=10):
+    rng = np.random.default_rng(seed)
+    rows = []
+    if len(study) == 0:
+        return pd.DataFrame(columns=resultColumns)
+    rows.append(dict(Group="Town", Value="All", **studyGroup(study, rng, resamples, confidence)))
+    for column in groupColumns:
+        for value, df in study.groupby(column, sort=True):
+            rows.append(dict(Group=column, Value=value, **studyGroup(df, rng, resamples, confidence)))
+    if len(study) >= deciles:
+        bins = pd.qcut(study["Price"], deciles, labels=False, duplicates="drop")
+        for decile, df in study.groupby(bins, sort=True):
+            label = "%d: $%d-%d" % (decile + 1, df["Price"].min(), df["Price"].max())
+            rows.append(dict(Group="Price Decile", Value=label,
+                             **studyGroup(df, rng, resamples, confidence)))
+    return pd.DataFrame(rows).reindex(columns=resultColumns)
+
+
+'''
+Main Function
+
+Parse arguments
+Read the scraped files, find the qualified sales, and print the study
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-s", '--scrape', default="ScrapeDataXX.tsv",
+                            help="ScrapeDataXX.tsv (for Zoning, Neighborhood, Land Use Code)")
+        parser.add_argument('--owners', default="OwnerHistory.tsv", help="OwnerHistory.tsv (the sales)")
+        parser.add_argument('--assessments', default="AssmtHistory.tsv", help="AssmtHistory.tsv")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--since', type=int, metavar="YEAR", help="Only sales in or after this year")
+        parser.add_argument('--min-price', type=float, default=1000,
+                            help="Smallest price for a qualified sale")
+        parser.add_argument('--instruments', help="Only sales with these Instrument codes (comma-separated)")
+        parser.add_argument('--nearest', action="store_true",
+                            help="Use the latest assessment year up to the sale year if the exact year is missing")
+        parser.add_argument('--resamples', type=int, default=1000, help="Bootstrap resamples (0 for none)")
+        parser.add_argument('--confidence', type=float, default=0.95)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--sales', metavar="TSV", help="Also write the matched sales to this file")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    instruments = [i.strip() for i in theArgs.instruments.split(",")] if theArgs.instruments else None
+    sales = qualifiedSales(readTable(theArgs.owners), theArgs.min_price, instruments, theArgs.since)
+    study = studySales(sales, assessmentsByYear(readTable(theArgs.assessments)),
+                       readTable(theArgs.scrape), theArgs.nearest)
+    print("%d qualified sales, %d matched to an assessment" % (len(sales), len(study)), file=fe)
+    if theArgs.sales:
+        study.to_csv(theArgs.sales, sep="\t", index=False, date_format="%Y-%m-%d")
+
+    result = salesRatioStudy(study, theArgs.resamples, theArgs.confidence, theArgs.seed)
+    result.to_csv(theArgs.outfile, sep="\t", index=False, float_format="%.4f")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+'''
+Saved Pages
+
+Read parcel pages that were saved earlier, so scrapevgsi.py can "replay"
+a run without touching the network. A saved run can be:
+
+- a directory of .html files (searched recursively)
+- a .tar (.tar.gz, .tgz, ...) or .zip archive of .html files
+- a single HTML file - possibly many pages concatenated together,
+  as GetData.sh does with "curl ... >> property.html"
+- a page archive directory (see pageArchive.py) - its latest run,
+  or "ArchiveDir/RunName" for a particular run
+
+Each page's PID comes from the page itself (the form's "Parcel.aspx?pid=..."
+action or the PID label), falling back to a "pid123" in the file name.
+'''
+
+import os
+import re
+import tarfile
+import zipfile
+
+pageStartPattern = re.compile(rb"(?:<!DOCTYPE[^>]*>\s*)?<html\b", re.IGNORECASE)
+pidPatterns = [
+    re.compile(rb"Parcel\.aspx\?pid=(\d+)", re.IGNORECASE),
+    re.compile(rb'id="MainContent_lblPid"[^>]*>\s*(\d+)\s*<'),
+]
+fileNamePattern = re.compile(r"pid[-_=]?(\d+)", re.IGNORECASE)
+htmlSuffixes = (".html", ".htm", ".aspx")
+
+'''
+splitPages() - split a blob holding one or more concatenated pages
+Return a list of the separate pages (bytes)
+'''
+def splitPages(data):
+    starts = [m.start() for m in pageStartPattern.finditer(data)]
+    if len(starts) <= 1:
+        return [data]
+    starts[0] = 0                       # keep anything before the first page with it
+    starts.append(len(data))
+    return [data[starts[i]:starts[i + 1]] for i in range(len(starts) - 1)]
+
+
+'''
+pidOfPage() - the PID of a saved page, or "" if it can't be found
+'''
+def pidOfPage(page, fileName=""):
+    for pattern in pidPatterns:
+        m = pattern.search(page)
+        if m:
+            return m.group(1).decode("ascii")
+    m = fileNamePattern.search(os.path.basename(fileName))
+    if m:
+        return m.group(1)
+    return ""
+
+
+def pagesFromBlob(data, fileName):
+    pages = splitPages(data)
+    for page in pages:
+        pid = pidOfPage(page, fileName if len(pages) == 1 else "")
+        yield pid, page
+
+
+'''
+pageArchiveRun() - if "path" names a page archive (or one run in it)
+return [archive directory, run name (None for the latest)], else None
+'''
+def pageArchiveRun(path):
+    path = path.rstrip("/")
+    if os.path.isfile(os.path.join(path, "runs.tsv")):
+        return [path, None]
+    parent, runName = os.path.split(path)
+    if not os.path.exists(path) and os.path.isfile(os.path.join(parent or ".", "runs.tsv")):
+        return [parent or ".", runName]
+    return None
+
+
+'''
+savedPages() - yield (PID, page) for every page found at "path"
+Pages are produced one at a time, so only one file's worth is in memory
+'''
+def savedPages(path):
+    archiveRun = pageArchiveRun(path)
+    if archiveRun is not None:
+        from pageArchive import PageArchive
+        archiveDir, runName = archiveRun
+        yield from PageArchive(archiveDir).pages(runName)
+    elif os.path.isdir(path):
+        for dirPath, dirNames, fileNames in os.walk(path):
+            dirNames.sort()
+            for name in sorted(fileNames):
+                if not name.lower().endswith(htmlSuffixes):
+                    continue
+                fullName = os.path.join(dirPath, name)
+                with open(fullName, "rb") as f:
+                    data = f.read()
+                yield from pagesFromBlob(data, fullName)
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for name in sorted(zf.namelist()):
+                if not name.lower().endswith(htmlSuffixes):
+                    continue
+                yield from pagesFromBlob(zf.read(name), name)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as tf:
+            for member in tf:           # stream through - don't load the member list first
+                if not member.isfile() or not member.name.lower().endswith(htmlSuffixes):
+                    continue
+                data = tf.extractfile(member).read()
+                yield from pagesFromBlob(data, member.name)
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+        yield from pagesFromBlob(data, path)
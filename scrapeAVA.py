@@ -12,9 +12,9 @@ from the HTML file. Those IDs are contained in an array of text strings.
 import sys
 import argparse
 
-import bs4.element
+# bs4 is imported where it's used, so --help (and vgsi.py) start quickly
+from labelGrid import labelSections
 # import requests
-from bs4 import BeautifulSoup
 
 # import time
 from datetime import datetime
@@ -28,6 +28,17 @@ fi = None
 fo = None
 fe = None
 
+# The header line
+# NB: GCRoD does not display Transfer Tax as a scrapable value.
+# Print a blank column and search GCRoD manually for "DEEED"
+# Enter the Transfer Tax recorded or use "-" where there is none
+# Ignore LCHIP tax - it's the same on virtually all properties
+headings = ["ID", "Date&Time", "Date", "Time", "Type", "Don't_Keep",
+			"Book&Page",
+			"Book", "Page", "Pages", "Party1",
+			"Party2", "Legal", "Notes", "Return to", "Consideration",
+			"Assoc. Docs", "Transfer Tax", "CollectedOn"]
+
 
 def main(argv=None):
 	try:
@@ -40,7 +51,14 @@ def main(argv=None):
 							type=argparse.FileType('w'), default=sys.stderr)
 		parser.add_argument('-d', '--debug', action="store_true",
 							help="Enable the debug mode.")
-		theArgs = parser.parse_args()
+		parser.add_argument('--profile', metavar="FILE",
+							help="Report the time in each stage and the slowest records, "
+								 "and write sampled stacks (flamegraph format) to FILE")
+		parser.add_argument('--xlsx', metavar="FILE",
+							help="Also write the records into this .xlsx workbook")
+		parser.add_argument('--canary', type=int, default=5, metavar="N",
+							help="Check the first N records' layout before writing the output (0 to skip)")
+		theArgs = parser.parse_args(argv)
 	except:
 		return "Error parsing arguments"
 	
@@ -49,25 +67,21 @@ def main(argv=None):
 	global fi
 	fi = theArgs.infile  # the argument parsing returns open file objects
 	global fo
-	# fo = theArgs.outfile
-	fo = open("AVA_Records_%s.tsv" % output_date, "wt")
 	global fe
 	fe = theArgs.errfile
 	
-	# Print the header line
-	# NB: GCRoD does not display Transfer Tax as a scrapable value.
-	# Print a blank column and search GCRoD manually for "DEEED"
-	# Enter the Transfer Tax recorded or use "-" where there is none
-	# Ignore LCHIP tax - it's the same on virtually all properties
-	headings = ["ID", "Date&Time", "Date", "Time", "Type", "Don't_Keep",
-				"Book&Page",
-				"Book", "Page", "Pages", "Party1",
-				"Party2", "Legal", "Notes", "Return to", "Consideration",
-				"Assoc. Docs", "Transfer Tax", "CollectedOn"]
-	header = "\t".join(headings)
-	print(header, file=fo)
+	profiler = None
+	if theArgs.profile:
+		from scrapeProfiler import StageProfiler
+		profiler = StageProfiler(theArgs.profile, fe, unit="records")
+		profiler.instrument(sys.modules[__name__], ["print_transaction", "print_firstcol", "print_partycol",
+													"print_legalcol", "print_finalcol"])
+		profiler.start()
 
 	# Parse the HTML
+	from bs4 import BeautifulSoup
+	if profiler:
+		BeautifulSoup = profiler.timed("BeautifulSoup", BeautifulSoup)
 	soup = BeautifulSoup(fi, 'html.parser')
 	# print the "prettified" file to stderr
 	#print(soup.prettify(), file=fe)
@@ -81,11 +95,32 @@ def main(argv=None):
 
 	# Post Jan2024, Vision created new CSS classes, easier to find
 	transactions = soup.find_all("div", class_="resultRowDetailContainer")
+	if profiler:
+		profiler.tick("(page)")		# parsing the whole page, separately from the records
+	
+	# Check the first few records line up before writing anything (see layoutCanary.py)
+	if theArgs.canary > 0:
+		from layoutCanary import checkAvaTransactions, canaryReport
+		problems = checkAvaTransactions(transactions, headings, theArgs.canary)
+		if problems:
+			return canaryReport(problems, "AVA")
+	
+	# fo = theArgs.outfile
+	fo = open("AVA_Records_%s.tsv" % output_date, "wt")
+	print("\t".join(headings), file=fo)
 	
-	for transaction in transactions:
+	for recordNum, transaction in enumerate(transactions, 1):
 		# foo = transaction.prettify()
 		# print(transaction.prettify(), file=fe)
 		print_transaction(transaction)
+		if profiler:
+			profiler.tick(recordNum)
+	if profiler:
+		profiler.finish()
+	fo.close()
+	if theArgs.xlsx:
+		from xlsxExport import writeWorkbook
+		writeWorkbook(theArgs.xlsx, [fo.name], fe=fe)
 
 '''
 print_transaction() outputs each transaction.
@@ -136,6 +171,7 @@ from day to day - or run to run? The "3" and "5" below are just magic for this r
 
 
 def print_firstcol(col):
+	import bs4.element
 	firstcolcontents = col.contents  # return a list of the contents
 	# print(len(something), " items in something")
 	# summary=firstcol[0].contents
@@ -164,33 +200,9 @@ def print_firstcol(col):
 
 
 def print_partycol(col):
-	# Print Parties
-	# print("==========")
-	# print(repr(cols[1]))
-	
-	partycol = col  # return a list of the contents
-	# print("Parties: ",partycol)
-	parties = partycol.find_all("label")
-	# print(len(partycol))
-	partynames = ["", "", ""]
-	inparty = 0
-	line = ""
-	for party in parties:
-		if party.text == "Party 1:":
-			inparty = 1
-		elif party.text == "Party 2:":
-			inparty = 2
-		elif party.text == "Parties":
-			continue
-		else:
-			if partynames[inparty] != "":
-				partynames[inparty] = partynames[inparty] + ", "
-			partynames[inparty] = partynames[inparty] + party.text.strip()
-	# .replace(" ETA "," ")
-	# print(partynames)
-	line += partynames[1] + "\t" + partynames[2]
-	# print(line)
-	return line
+	# Print Parties: the labels after "Party 1:", then those after "Party 2:"
+	parties = labelSections(col.find_all("label"), ["Party 1", "Party 2"], skip=["Parties"])
+	return ", ".join(parties.get("Party 1", [])) + "\t" + ", ".join(parties.get("Party 2", []))
 
 
 # Print the "legal stuff"
@@ -209,45 +221,14 @@ def print_legalcol(col):
 #   - Associated Documents
 
 def print_finalcol(col):
-	# print("Final Column")
-	# print(repr(col))
-	final = col.find_all("label")
-	# print(len(final))
-	finalnames = ["-", "-", "-", "-", "-"]
-	whichname = 0
-	for item in final:
-		# print(item.text)
-		if item.text == "Notes:":
-			whichname = 1
-		elif item.text == "Return To:":
-			whichname = 2
-		elif item.text == "Consideration:":
-			whichname = 3
-		elif item.text == "Associated Documents":
-			whichname = 4
-		elif item.text == "Additional":
-			continue
-		else:
-			update_names(finalnames, whichname, item)
-	final = col.find_all("a")
-	for item in final:
-		# print(item.text)
-		update_names(finalnames, 4, item)
-	# print(finalnames)
-	line = finalnames[1] + "\t" + finalnames[2] + "\t" + finalnames[3] + "\t" + \
-		   finalnames[4]
-	return line
-
-
-def update_names(finalnames, whichname, item):
-	if finalnames[whichname] == "-":
-		finalnames[whichname] = ""
-	if whichname == 2 and finalnames[
-		2] != "":  # Just add lawyer's name, not address
-		return
-	if finalnames[whichname] != "":  # add ", " if something's there
-		finalnames[whichname] = finalnames[whichname] + ", "
-	finalnames[whichname] = finalnames[whichname] + item.text.strip()
+	final = labelSections(col.find_all("label"),
+						  ["Notes", "Return To", "Consideration", "Associated Documents"], skip=["Additional"])
+	final["Return To"] = final.get("Return To", [])[:1]  # Just the lawyer's name, not address
+	final.setdefault("Associated Documents", []).extend(a.text.strip() for a in col.find_all("a"))
+	names = []
+	for heading in ["Notes", "Return To", "Consideration", "Associated Documents"]:
+		names.append(", ".join(final[heading]) if final.get(heading) else "-")
+	return "\t".join(names)
 
 if __name__ == "__main__":
 	sys.exit(main())
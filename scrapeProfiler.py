@@ -0,0 +1,236 @@
+'''
+Profiling helpers for the scrapers
+
+MemoryProfiler - uses tracemalloc to take a snapshot every N pages
+and report the top allocation sites, plus how much each site grew
+since the previous snapshot. A long run that holds its memory ceiling
+shows (near) zero growth from one snapshot to the next.
+
+StageProfiler - where the time goes: the time spent in each stage
+(fetching, parsing, each handler, writing), the slowest pages with
+their own breakdown, and a sampled profile of the whole run written as
+collapsed stacks ("a;b;c 17" lines - flamegraph.pl or speedscope draw them).
+'''
+
+import sys
+import heapq
+import os
+import threading
+import time
+import tracemalloc
+import linecache
+
+'''
+MemoryProfiler
+
+- every - take a snapshot every "every" pages
+- fe - where to write the report (stderr by default)
+- top - how many allocation sites to list in each report
+'''
+
+
+class MemoryProfiler:
+    def __init__(self, every=100, fe=sys.stderr, top=10):
+        self.every = max(1, every)
+        self.fe = fe
+        self.top = top
+        self.previous = None
+        self.first = None
+        self.pages = 0
+
+    def start(self):
+        tracemalloc.start(5)        # keep a few frames so we see who called
+        self.previous = self.takeSnapshot()
+        self.first = self.previous
+
+    '''
+    takeSnapshot() - snapshot, but ignore memory used by tracemalloc itself
+    and by the import machinery
+    '''
+    def takeSnapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    '''
+    tick() - call once per page; reports every "every" pages
+    '''
+    def tick(self, pid=None):
+        self.pages += 1
+        if self.pages % self.every == 0:
+            self.report()
+
+    def report(self, final=False):
+        snapshot = self.takeSnapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        fe = self.fe
+        label = "final" if final else "after %d pages" % self.pages
+        print("==== Memory %s: current %.1f MB, peak %.1f MB ====" % (
+            label, current / 1e6, peak / 1e6), file=fe)
+        print("Top allocation sites:", file=fe)
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            print("  %8.1f KB %7d blocks  %s" % (
+                stat.size / 1024, stat.count, stat.traceback), file=fe)
+        print("Growth since previous snapshot:", file=fe)
+        for stat in snapshot.compare_to(self.previous, "lineno")[:self.top]:
+            if stat.size_diff == 0:
+                continue
+            print("  %+8.1f KB %+7d blocks  %s" % (
+                stat.size_diff / 1024, stat.count_diff, stat.traceback), file=fe)
+        if final:
+            total = sum(stat.size_diff for stat in snapshot.compare_to(self.first, "filename"))
+            print("Net growth over the whole run: %+.1f KB" % (total / 1024), file=fe)
+        fe.flush()
+        self.previous = snapshot
+        tracemalloc.reset_peak()
+
+    def finish(self):
+        self.report(final=True)
+        tracemalloc.stop()
+
+
+'''
+StageProfiler
+
+- stacksFile - where to write the collapsed stacks (None: don't sample)
+- fe - where to write the report (stderr by default)
+- top - how many of the slowest pages to list
+- interval - seconds between samples of the main thread's stack
+- unit - what tick() counts, for the report ("pages", "records")
+
+Stages are the functions handed to timed() (or instrument()). A stage's
+time is its own: time spent in a stage called from it (plainValue() from
+a handler) is counted in the inner stage only. Everything timed since
+the previous tick() is charged to the page passed to tick().
+The cost is a couple of clock readings per call, plus one stack walk per
+sample, so it can stay on for a full sweep.
+'''
+
+
+class StageProfiler:
+    def __init__(self, stacksFile=None, fe=sys.stderr, top=10, interval=0.01, unit="pages"):
+        self.stacksFile = stacksFile
+        self.unit = unit
+        self.fe = fe
+        self.top = top
+        self.interval = interval
+        self.totals = {}            # stage -> [seconds, calls]
+        self.pending = {}           # stage -> seconds, for the page in progress
+        self.slowest = []           # heap of [seconds, pid, breakdown]
+        self.running = []           # [stage, start, time in inner stages]
+        self.stacks = {}
+        self.samples = 0
+        self.pages = 0
+        self.sampler = None
+        self.stopping = threading.Event()
+
+    '''
+    timed() - fn, but with its time charged to "stage"
+    '''
+    def timed(self, stage, fn):
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            entry = [stage, clock(), 0.0]
+            self.running.append(entry)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.running.pop()
+                elapsed = clock() - entry[1]
+                own = elapsed - entry[2]
+                if self.running:
+                    self.running[-1][2] += elapsed
+                total = self.totals.get(stage)
+                if total is None:
+                    total = self.totals[stage] = [0.0, 0]
+                total[0] += own
+                total[1] += 1
+                self.pending[stage] = self.pending.get(stage, 0.0) + own
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    '''
+    instrument() - replace the named functions (or methods) of "owner" with timed ones
+    '''
+    def instrument(self, owner, names, prefix=""):
+        for name in names:
+            setattr(owner, name, self.timed(prefix + name, getattr(owner, name)))
+
+    '''
+    tick() - call once per page, after it has been written
+    '''
+    def tick(self, pid=None):
+        self.pages += 1
+        seconds = sum(self.pending.values())
+        entry = [seconds, str(pid), self.pending]
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+        self.pending = {}
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.stacksFile:
+            self.mainThread = threading.get_ident()
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    '''
+    sample() - every "interval", count the main thread's current stack
+    '''
+    def sample(self):
+        names = {}
+        wrapperCode = self.timed("", None).__code__
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.mainThread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                    name = names[code] = "%s:%s" % (module, code.co_name)
+                    name = names[code] = name.replace(" ", "_").replace(";", ":")
+                if code is not wrapperCode:     # the timing wrappers would just be noise
+                    stack.append(name)
+                frame = frame.f_back
+            frame = None
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        if self.sampler:
+            self.stopping.set()
+            self.sampler.join()
+            with open(self.stacksFile, "wt") as f:
+                for stack, count in sorted(self.stacks.items()):
+                    print("%s %d" % (stack, count), file=f)
+        self.report(elapsed)
+
+    def report(self, elapsed):
+        fe = self.fe
+        timed = sum(seconds for seconds, calls in self.totals.values())
+        print("==== Time: %.1f s for %d %s (%.1f s in the stages below) ====" % (
+            elapsed, self.pages, self.unit, timed), file=fe)
+        print("  %9s %6s %9s %10s  %s" % ("seconds", "%", "calls", "ms/call", "stage"), file=fe)
+        for stage, [seconds, calls] in sorted(self.totals.items(), key=lambda t: -t[1][0]):
+            print("  %9.3f %5.1f%% %9d %10.3f  %s" % (
+                seconds, 100 * seconds / elapsed if elapsed else 0, calls,
+                1000 * seconds / calls, stage), file=fe)
+        print("Slowest %s:" % self.unit, file=fe)
+        for seconds, pid, breakdown in sorted(self.slowest, reverse=True):
+            parts = sorted(breakdown.items(), key=lambda b: -b[1])
+            print("  %8.1f ms  %-8s %s" % (1000 * seconds, pid, ", ".join(
+                "%s %.2f" % (stage, 1000 * t) for stage, t in parts if t >= 0.00001)), file=fe)
+        if self.sampler:
+            print("%d samples written to %s" % (self.samples, self.stacksFile), file=fe)
+        fe.flush()
@@ -14,26 +14,35 @@ Output is several tab-delimited files written to the current directory:
 - ApprlHistory.tsv # Appraisal History
 - AssmtHistory.tsv # Assessment History
 - Buildings___.tsv # Buildings
+- Photos.tsv       # Building photos (with --photos, see photoMirror.py)
 '''
 
 import sys
 import argparse
-import requests
-from bs4 import BeautifulSoup, element
 import time
-from datetime import datetime
-from playsound3 import playsound
+from datetime import datetime, date
+# requests, bs4 and playsound3 are imported where they're used, so that
+# --help, replays and the vgsi.py front end don't pay for them (or need them)
+from labelGrid import labelValues
+from vgsiRecords import OwnerSale, Appraisal, Assessment, Building, Outbuilding, \
+    ExtraFeature, SpecialLand, ParcelSchema, ParcelRecord, ParsedPage, TsvSink, SqliteSink
 # import ssl
 
 # import random
 
 import re
-# import os
+import os
 from http.client import HTTPConnection
 # from requests.exceptions import HTTPError, ConnectionError
 
 # from collections import OrderedDict
 
+defaultBaseURL = "https://gis.vgsi.com/lymeNH/"
+baseURL = defaultBaseURL        # -u/--baseurl points this elsewhere (e.g. mockVGSI.py)
+defaultRetries = 5
+retries = defaultRetries        # tries for a page before it's a "problem" line (--retries)
+retryWait = 20                  # seconds between them
+
 """
 readNextVisionID(f)
 
@@ -67,6 +76,31 @@ class VisionIDFile:
             self.nextPID = 100000
         return [ str(self.nextPID) ]    # Must be an array with a string
 
+
+'''
+PIDListFile - the same interface as VisionIDFile, but returns just the PIDs
+listed in a file (e.g. from deedPriority.py or the PIDs folder):
+the first field of each line (comma or tab separated).
+Lines that begin with # (and anything after a #) are comments.
+'''
+
+
+class PIDListFile:
+    def __init__(self, file):
+        self.pids = []
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            pid = re.split(r"[,\t ]", line, maxsplit=1)[0]
+            if pid:
+                self.pids.append(pid)
+        self.next = 0
+
+    def readNextVisionID(self):
+        if self.next >= len(self.pids):
+            return []
+        self.next += 1
+        return [self.pids[self.next - 1]]
+
 # IDs of DOM elements whose values should be plucked up and displayed
 domIDs = [
     ["MainContent_lblPid", "PID"],
@@ -125,24 +159,59 @@ valuationHistoryIDs = [
 ]
 # ownershipHistoryID = "MainContent_grdSales"
 
+'''
+extractionProfiles - which parts of the page to extract on a run
+
+Each profile lists:
+- the labels of the domIDs to include in ScrapeDataXX (None means all of them)
+- the output files to write (named by their ParsedPage attribute)
+
+Handlers (and DOM lookups) that aren't needed by the profile never run,
+and the page is only parsed for the elements the profile needs.
+"core" replaces the old scrapevgsiFAST.py
+'''
+coreDomLabels = ["PID", "Owner", "Street Address", "MBLU", "Book&Page",
+                 "Assessment", "Appraisal", "Lot Size (acres)", "Land Use Code",
+                 "Description", "Zoning District", "# Buildings"]
+allOutputs = ["parcel", "owners", "appraisals", "assessments", "buildings",
+              "outbuildings", "extraFeatures", "specialLand"]
+extractionProfiles = {
+    "core":      [coreDomLabels, ["parcel", "appraisals", "assessments"]],
+    "ownership": [coreDomLabels + ["Owner of Record", "Co-owner", "LabelAddress"],
+                  ["parcel", "owners"]],
+    "buildings": [coreDomLabels, ["parcel", "buildings", "outbuildings",
+                                  "extraFeatures", "specialLand"]],
+    "full":      [None, allOutputs],
+}
+
+'''
+profileDomIDs() - the domIDs entries used by the named profile
+'''
+def profileDomIDs(profile):
+    labels = extractionProfiles[profile][0]
+    if labels is None:
+        return domIDs
+    return [d for d in domIDs if d[1] in labels]
+
 '''
 displayHeading
 
 Return a string containing all the headings for the output file
+(ids - the domIDs being extracted, all of them by default)
 '''
 
 
-def displayHeading():
+def displayHeading(ids=domIDs):
     # Print the heading row, with all the column names
     output_string = ""
-    for x in range(len(domIDs)):
-        if domIDs[x][1] == "Street Address": # pre-process Street Address
+    for x in range(len(ids)):
+        if ids[x][1] == "Street Address": # pre-process Street Address
             output_string += "StreetNum\tStreetName\t"
             continue
-        output_string += "%s\t" % domIDs[x][1]
-        if domIDs[x][1] == "MBLU":  # add column headings for expanded MBLU
+        output_string += "%s\t" % ids[x][1]
+        if ids[x][1] == "MBLU":  # add column headings for expanded MBLU
             output_string += "Map\tLot\tUnit\tSub\t"
-        if domIDs[x][1] == "Book&Page":  # add column headings for Book & Page
+        if ids[x][1] == "Book&Page":  # add column headings for Book & Page
             output_string += "Book\tPage\t"
     # for x in range(len(tableIDs)):
     #     output_string += tableIDs[x] + "\t"
@@ -157,18 +226,17 @@ def displayHeading():
 '''
 handleOwnerHistory
 
-Return a string containing a set of lines that represent the Ownership History.
+Return a list of OwnerSale records that represent the Ownership History.
 Includes: Owner, Sale Price, Certificate, Book&Page, Instrument, Sale Date
 '''
 
 
 def handleOwnerHistory(theSoup, theID, pid):
-    now = datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
+    current_date = date.today()
     
     historyTable = theSoup.find(id=theID)
     htRows = historyTable.find_all('tr')
-    outputStr = ""
+    records = []
     for row in htRows:                          # for each row of the history table
         cells = row.find_all('td')          # get the cells into an array
         cellCols = []
@@ -184,30 +252,29 @@ def handleOwnerHistory(theSoup, theID, pid):
         if len(cellCols) != 0:
             cellCols.insert(0, pid)     # put pid at the front
             cellCols.append(current_date)
-            outputStr += "\t".join(cellCols)    # output all the columns
-            outputStr += "\n"                   # and a newline
-    return outputStr
+            records.append(OwnerSale.fromCells(cellCols))
+    return records
 
 '''
 handleAppAssHistory
 
-Return a string containing a set of lines that represent the Appraised or Assessed History.
-Each line has a \n, when it's output, don't add another one.
+Return a list of Appraisal (or Assessment) records that represent the Appraised or Assessed History.
 
 Parameters:
 - theSoup - the entire page
 - theID - the table ID to parse
 - pid - the PID associated with this property
 
+- recordType - Appraisal or Assessment
+
 Each table includes: Year, Improvements, Land, Total, PID, CollectedOn
 '''
-def handleAppAssHistory(theSoup, theID, pid):
-    now = datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
+def handleAppAssHistory(theSoup, theID, pid, recordType=Appraisal):
+    current_date = date.today()
     
     historyTable = theSoup.find(id=theID)
     htRows = historyTable.find_all('tr')
-    outputStr = ""
+    records = []
     for row in htRows:                          # for each row of the history table
         cells = row.find_all('td')          # get the cells into an array
         cellCols = []
@@ -222,14 +289,13 @@ def handleAppAssHistory(theSoup, theID, pid):
         if len(cellCols) != 0:
             cellCols.insert(0, pid)    # put pid at the front
             cellCols.append(current_date)
-            outputStr += "\t".join(cellCols)    # output all the columns
-            outputStr += "\n"                   # and a newline
-    return outputStr
+            records.append(recordType.fromCells(cellCols))
+    return records
     
 '''
 handleBuildings
 
-Return a string that represents the buildings on the parcel, one line per building
+Return a list of Building records for the buildings on the parcel, one per building
 Parameters:
 - theSoup - the entire page
 - theID - Should be "" - this code knows which tables to parse
@@ -254,6 +320,7 @@ buildingIDs = [
     ["MainContent_ctl**_lblPctGood","Percent Good"],
     ["MainContent_ctl**_lblRcnld","Value after Depreciation"]
 ]
+buildingElementPattern = re.compile(r"^MainContent_ctl\d\d_")
 buildingAttributeTable = "MainContent_ctl**_grdCns"
 buildingAreaTable = "MainContent_ctl**_grdSub"
 buildingAttrs = [
@@ -326,44 +393,36 @@ def printBuildingHeader():
 handleBuildings - parse the Buildings table
 '''
 def handleBuildings(theSoup, theID, pid):
-    now = datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
+    current_date = date.today()
+    
+    # One pass over the page for all the buildings' elements, rather than a search per item
+    elements = {}
+    for tag in theSoup.find_all(id=buildingElementPattern):
+        elements.setdefault(tag["id"], tag)
     
-    retstr = ""
+    records = []
     buildingNumber = 1
     while True:
-        anID = subsBuilding(buildingIDs[0][0], buildingNumber)
-        if theSoup.find(id=anID) == None:
+        fields = [elements.get(subsBuilding(domID, buildingNumber)) for domID, name in buildingIDs]
+        if fields[0] == None:
             break
             
-        # First output the PID
-        retstr += "%s\t%d\t" % (pid, buildingNumber)
+        # First the PID
+        cellCols = [pid, str(buildingNumber)]
         
-        # Print the list of DOM items from buildingIDs
-        for x in range(len(buildingIDs)):
-            result = theSoup.find(id=subsBuilding(buildingIDs[x][0],buildingNumber))
-            retstr += "%s\t" % plainValue(result.text)
+        # The list of DOM items from buildingIDs
+        for result in fields:
+            cellCols.append(plainValue(result.text))
         
-        # Print the list of items from Building Attribute Table
-        for x in range(len(buildingAttrs)):
-            tableID = subsBuilding(buildingAttributeTable,buildingNumber)
-            table = theSoup.find('table',{'id': tableID})
-            theAttr = buildingAttrs[x]
-            label_cell = table.find('td', string=theAttr)
-            if label_cell == None:  # does the label need a ":"?
-                theAttr += ":"
-                label_cell = table.find('td', string=theAttr)
-            if label_cell != None: #
-                value_cell = label_cell.find_next_sibling('td')
-                theValue = value_cell.text
-            else:
-                theValue = "MISSING-"+theAttr # if it's still None, then insert "MISSING"
-            retstr += "%s\t" % plainValue(theValue)
+        # The items from the Building Attribute Table, read once into {label: value}
+        attrs = labelValues(elements.get(subsBuilding(buildingAttributeTable, buildingNumber)))
+        for theAttr in buildingAttrs:
+            theValue = attrs.get(theAttr, "MISSING-%s:" % theAttr)   # "MISSING" if it's not there
+            cellCols.append(plainValue(theValue))
         
         # Find the last row of the right-hand table
         # display the Gross Floor Area and the Living Area
-        tableID = subsBuilding(buildingAreaTable, buildingNumber)
-        table = theSoup.find('table', {'id': tableID})
+        table = elements.get(subsBuilding(buildingAreaTable, buildingNumber))
         last_row = table.find_all('tr')[-1]
         values = []
         for cell in last_row.find_all('td'):
@@ -374,25 +433,26 @@ def handleBuildings(theSoup, theID, pid):
         else:
             gross = "MISSING-Gross"
             living = "Missing-Living"
-        retstr += "%s\t%s\t" % (plainValue(gross), plainValue(living))
+        cellCols.append(plainValue(gross))
+        cellCols.append(plainValue(living))
         
-        retstr += "%s\n" % current_date
+        cellCols.append(current_date)
+        records.append(Building.fromCells(cellCols))
 
         # And on to the next one
         buildingNumber += 1
 
-    return retstr
+    return records
 
 '''
 handle Outbuildings
 '''
 def handleOutbuildings(theSoup, theID, pid):
-    now = datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
+    current_date = date.today()
     
     outbuildingTable = theSoup.find(id=theID)
     htRows = outbuildingTable.find_all('tr')
-    outputStr = ""
+    records = []
     for row in htRows:  # for each row of the outbuilding table
         cells = row.find_all('td')  # get the cells into an array
         cellCols = []
@@ -402,29 +462,27 @@ def handleOutbuildings(theSoup, theID, pid):
         if len(cellCols) == 0:
             continue
         if len(cellCols) == 1:  # "No Data for PID"
-            return ""
+            return []
         if len(cellCols) != 0:
             cellCols.insert(0, pid)  # put pid at the front
             sizeElems = cellCols[5].split(" ")  # Split the size from its units
             cellCols[5] = sizeElems[0]          # e.g. "576.00 S.F."
             cellCols.insert(6,sizeElems[1])     # into "576.00" and "S.F"
             cellCols.append(current_date)
-            outputStr += "\t".join(cellCols)  # output all the columns
-            outputStr += "\n"  # and a newline
-    return outputStr
+            records.append(Outbuilding.fromCells(cellCols))
+    return records
     
 '''
 handle Special Land
 '''
 def handleSpecialLand(theSoup, theID, pid):
-    now = datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
+    current_date = date.today()
     
     specialLandTable = theSoup.find(id=theID)
     if specialLandTable == None:
-        return "" # "%s\tNo Special Land\n" % (pid)
+        return [] # "%s\tNo Special Land\n" % (pid)
     htRows = specialLandTable.find_all('tr')
-    outputStr = ""
+    records = []
     for row in htRows:  # for each row of the special land table
         cells = row.find_all('td')  # get the cells into an array
         cellCols = []
@@ -434,26 +492,24 @@ def handleSpecialLand(theSoup, theID, pid):
         if len(cellCols) == 0:
             continue
         if len(cellCols) == 1:  # "No Data for PID"
-            return ""
+            return []
         if len(cellCols) != 0:
             cellCols.insert(0, pid)  # put pid at the front
             cellCols.append(current_date)
-            outputStr += "\t".join(cellCols)  # output all the columns
-            outputStr += "\n"  # and a newline
-    return outputStr
+            records.append(SpecialLand.fromCells(cellCols))
+    return records
 
 '''
 handle Extra features
 '''
 def handleExtraFeatures(theSoup, theID, pid):
-    now = datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
+    current_date = date.today()
     
     extraFeatureTable = theSoup.find(id=theID)
     if extraFeatureTable == None:
-        return "" # "%s\tNo Feature Table\n" % (pid)
+        return [] # "%s\tNo Feature Table\n" % (pid)
     htRows = extraFeatureTable.find_all('tr')
-    outputStr = ""
+    records = []
     for row in htRows:  # for each row of the Extra Features table
         cells = row.find_all('td')  # get the cells into an array
         cellCols = []
@@ -463,16 +519,15 @@ def handleExtraFeatures(theSoup, theID, pid):
         if len(cellCols) == 0:
             continue
         if len(cellCols) == 1 & cellCols[0].find("No Data") != -1:  # "No Data ..."
-            return ""
+            return []
         if len(cellCols) != 0:
             cellCols.insert(0, pid)  # put pid at the front
             sizeElems = cellCols[3].split(" ")  # Split the size from its units
             cellCols[3] = sizeElems[0]          # e.g. "576.00 S.F."
             cellCols.insert(4,sizeElems[1])     # into "576.00" and "S.F"
             cellCols.append(current_date)
-            outputStr += "\t".join(cellCols)  # output all the columns
-            outputStr += "\n"  # and a newline
-    return outputStr
+            records.append(ExtraFeature.fromCells(cellCols))
+    return records
 
 
 '''
@@ -503,56 +558,496 @@ beep - play a short beep sound
 Beep .mp3 file from https://www.soundjay.com/beep-sounds-1.html
 '''
 def beep():
-    playsound('TestData/beep-02.mp3')
+    try:
+        from playsound3 import playsound
+        playsound('TestData/beep-02.mp3')
+    except Exception:                           # no audio library/backend: ring the terminal bell
+        print("\a", end="", file=sys.stderr, flush=True)
 
 
 '''
 getNewPage() - request next PID from the infile, return the page and the PID
-Delay for a while if the Vision server gives an error/refusing to return result
+Delay for a while if the Vision server gives an error/refusing to return result,
+and after "retries" tries give up on the PID: return "problem" for the page
+- site - the town's Vision URL (default: baseURL, from -u)
+- throttle - called before each request to pace them (default: sleep 0.5 second)
+- quiet - don't beep when Vision gives an error
 '''
 
 
-def getNextPage(infile, fe):
+def getNextPage(infile, fe, site=None, throttle=None, quiet=False):
+    import requests
     ids = infile.readNextVisionID()
     if not ids:  # EOF
         return [None, 0]
     
     # if not theArgs.debug:
-    time.sleep(0.5)
+    if throttle:
+        throttle()
+    else:
+        time.sleep(0.5)
         # time.sleep(10 + 5 * random.random())  # wait a few seconds before next query
     
     thePID = ids[0]
-    url = "https://gis.vgsi.com/lymeNH/Parcel.aspx?pid=%s" % thePID
+    url = (site or baseURL) + "Parcel.aspx?pid=%s" % thePID
     
     # if theArgs.debug:
     #     print(url, file=fe)
     
-    page = None
-    while page is None:
+    for attempt in range(1, retries + 1):
     
         try:
             HTTPConnection.debuglevel = 0
             requests.packages.urllib3.disable_warnings()
             page = requests.get(url, verify=False)
+            if page.status_code >= 500:     # Vision is overloaded/restarting - same as an exception
+                page.close()
+                raise requests.exceptions.HTTPError("HTTP %d" % page.status_code)
             return [page, thePID]
         # See https://stackoverflow.com/questions/9054820/python-requests-exception-handling/57239688#57239688
         except requests.exceptions.RequestException as e:  # might catch all exceptions?
-            beep()
+            if not quiet:
+                beep()
+            if attempt == retries:
+                print("Exception retrieving PID %s (%s): giving up after %d tries" % (
+                    ids[0], e, retries), file=fe)
+                return ["problem", thePID]
             output_string = "Exception retrieving PID %s: Waiting to retry..." % (
                 ids[0])
             # print(e)
             print(output_string, file=fe)
-            page = None
-            time.sleep(20)
+            time.sleep(retryWait)
+
+
+'''
+outputHeadings() - the heading line for each of the output files in the profile,
+keyed by the ParsedPage attribute that holds that file's records
+'''
+
+
+def outputHeadings(profile="full"):
+    outputs = extractionProfiles[profile][1]
+    headings = {
+        "parcel": displayHeading(profileDomIDs(profile)),
+        "owners": OwnerSale.heading,
+        "appraisals": Appraisal.heading,
+        "assessments": Assessment.heading,
+        "buildings": printBuildingHeader(),
+        "outbuildings": Outbuilding.heading,
+        "extraFeatures": ExtraFeature.heading,
+        "specialLand": SpecialLand.heading,
+    }
+    headings = {k: v for k, v in headings.items() if k in outputs}
+    headings["suppressed"] = "Protected Parcel PIDs"
+    return headings
+
+
+'''
+pageHandlers - the handler (and its table ID, plus any extra argument)
+that fills in each of the ParsedPage attributes
+'''
+pageHandlers = {
+    "owners":        [handleOwnerHistory, "MainContent_grdSales"],
+    "appraisals":    [handleAppAssHistory, "MainContent_grdHistoryValuesAppr", Appraisal],
+    "assessments":   [handleAppAssHistory, "MainContent_grdHistoryValuesAsmt", Assessment],
+    "buildings":     [handleBuildings, ""],
+    "outbuildings":  [handleOutbuildings, "MainContent_grdOb"],
+    "specialLand":   [handleSpecialLand, "MainContent_grdSpclLand"],
+    "extraFeatures": [handleExtraFeatures, "MainContent_grdXf"],
+}
+
+
+'''
+profileStrainer() - a SoupStrainer that keeps only the elements the profile reads,
+so BeautifulSoup doesn't build a tree for the rest of the page.
+(Returns None - parse everything - for the "full" profile)
+'''
+def profileStrainer(profile):
+    if profile == "full":
+        return None
+    outputs = extractionProfiles[profile][1]
+    needed = set(d[0] for d in profileDomIDs(profile))
+    needed.add(domIDs[0][0])                    # always needed to spot suppressed parcels
+    needed.update(d[0] for d in saleDomIDs)
+    needed.update(["MainContent_grdSales", "MainContent_grdHistoryValuesAsmt",
+                   "MainContent_grdHistoryValuesAppr"])     # used by the ScrapeDataXX line
+    for attr in outputs:
+        if attr in pageHandlers and pageHandlers[attr][1]:
+            needed.add(pageHandlers[attr][1])
+    wantBuildings = "buildings" in outputs
+
+    def keep(tagID):
+        if tagID is None:
+            return False
+        if tagID in needed:
+            return True
+        return wantBuildings and tagID.startswith("MainContent_ctl")
+    from bs4 import SoupStrainer
+    return SoupStrainer(id=keep)
+
+
+'''
+historyValues() - return the Improvements/Land/Total of one row of a
+Valuation History table. If the row isn't there, return the "previous"
+values unchanged (so a parcel with one year of history repeats it)
+'''
+
+
+def historyValues(rows, rowNum, previous):
+    try:
+        vals = rows[rowNum].contents
+        return [plainValue(vals[2].text), plainValue(vals[3].text), plainValue(vals[4].text)]
+    except:
+        return previous
+
+
+'''
+recentValues() - the current and previous Improvements/Land/Total of a Valuation History table
+'''
+def recentValues(table):
+    rows = table.find_all('tr')
+    current = historyValues(rows, 1, ["", "", ""])
+    return current + historyValues(rows, 2, current)
+
+
+'''
+saleRows() - [price as shown, price, date] for each sale in the Ownership History table
+'''
+def saleRows(table):
+    sales = []
+    for row in table.find_all('tr')[1:]:
+        vals = row.contents
+        if len(vals) < 4:
+            continue
+        dateIx = len(vals) - 2  # sometimes five columns, sometimes 6 :-(
+        sales.append([vals[2].text, plainValue(vals[2].text), plainValue(vals[dateIx].text)])
+    return sales
+
+
+'''
+parseParcel() - build the one-line summary of the parcel (ScrapeDataXX)
+Return a ParcelRecord whose values line up with displayHeading()
+What it takes from the sales and valuation history tables goes into
+"results" (or comes from there, when the section cache already has it)
+'''
+
+
+def parseParcel(soup, pid, recordCount, schema, ids=domIDs, results=None):
+    from bs4 import element
+    results = {} if results is None else results
+    current_time = datetime.now().replace(microsecond=0)
+    
+    # First the random fields from the page
+    cells = []
+    for x in range(len(ids)):
+        result = soup.find(id=ids[x][0])
+        
+        # Pre-processing
+        if ids[x][0] == "MainContent_lblAddr1":  # patch up label address to remove <br> tag
+            ary = list(result.contents)
+            for i in range(len(ary)):
+                if isinstance(ary[i], element.Tag):
+                    ary[i] = ""
+            cells.append(" ".join(ary).strip())
+            continue
+        if ids[x][0] == "MainContent_lblLocation":  # Split street number and name
+            digits, remainder = parse_street_name(result.text)
+            cells.append(digits.strip())
+            cells.append(remainder.strip())
+            continue
+        
+        # standard processing for ordinary value
+        cells.append(plainValue(result.text))
+        
+        # Post-processing - append to the retrieved value
+        if ids[x][0] == "MainContent_lblBp": # split Book&Page
+            ary = splitBookAndPage(result)
+            cells.append(ary[0])
+            cells.append(ary[1])
+        if ids[x][0] == "MainContent_lblMblu":  # also split MBLU
+            ary = result.text.split("/")
+            cells.extend([ary[0].strip(), ary[1].strip(), ary[2].strip(), ary[3].strip()])
+    
+    # The recent sale price and date
+    for x in range(len(saleDomIDs)):
+        result = soup.find(id=saleDomIDs[x][0])
+        cells.append(plainValue(result.text))
+    
+    # The most recent non-zero sale price and date
+    # handle case where there isn't a value for either - just insert ""
+    recentSale = soup.find(id=saleDomIDs[0][0]).text
+    if "saleRows" not in results:
+        results["saleRows"] = saleRows(soup.find('table', id="MainContent_grdSales"))
+    prevSale = ["", ""]
+    for priceText, price, saleDate in results["saleRows"]:
+        if priceText == "$0" or priceText == recentSale:  # no new info
+            continue
+        prevSale = [price, saleDate]
+        break
+    cells.extend(prevSale)
+
+    # The most recent Assessments, then Appraisals (Current, then Previous) from the Valuation History
+    for name, tableID in [["assessedValues", "MainContent_grdHistoryValuesAsmt"],
+                          ["appraisedValues", "MainContent_grdHistoryValuesAppr"]]:
+        if name not in results:
+            results[name] = recentValues(soup.find('table', id=tableID))
+        cells.extend(results[name])
+
+    # Tack on (empty/fake) version number, time stamp, row counter
+    cells.extend(["Version?", current_time, recordCount])
+    return ParcelRecord(schema, cells)
+
+
+'''
+parsePage() - run the profile's handlers over one (already parsed) page
+Return a ParsedPage holding the records for each of the profile's output files
+'''
+
+
+def parsePage(soup, pid, recordCount, schema, profile="full", results=None):
+    results = {} if results is None else results
+    parsed = ParsedPage(pid)
+    outputs = extractionProfiles[profile][1]
+    if "parcel" in outputs:
+        parsed.parcel = parseParcel(soup, pid, recordCount, schema, profileDomIDs(profile), results)
+    for attr in outputs:
+        if attr in pageHandlers:
+            if attr not in results:
+                handler = pageHandlers[attr]
+                results[attr] = handler[0](soup, handler[1], pid, *handler[2:])
+            setattr(parsed, attr, results[attr])
+    return parsed
+
+
+'''
+Section cache (--section-cache) - the results that come from each section
+of the page, so that an unchanged section can be cut out of the page and
+its results reused (see sectionCache.py).
+Bump parserVersion when parsing changes in a way the source hash can't see.
+'''
+parserVersion = 1
+pageSectionResults = {
+    "MainContent_grdSales":             ["owners", "saleRows"],
+    "MainContent_grdHistoryValuesAsmt": ["assessments", "assessedValues"],
+    "MainContent_grdHistoryValuesAppr": ["appraisals", "appraisedValues"],
+    "MainContent_panBldg":              ["buildings"],
+    "MainContent_grdOb":                ["outbuildings"],
+    "MainContent_grdXf":                ["extraFeatures"],
+    "MainContent_grdSpclLand":          ["specialLand"],
+}
+parcelResults = ["saleRows", "assessedValues", "appraisedValues"]    # used by the ScrapeDataXX line
+
+
+def sectionParserKey():
+    import bs4
+    import labelGrid
+    import vgsiRecords
+    from sectionCache import parserKey
+    return parserKey(parserVersion, [sys.modules[__name__], labelGrid, vgsiRecords, bs4])
+
+
+'''
+profileResults() - {section ID: [the results the profile needs from it]}
+'''
+def profileResults(profile):
+    outputs = extractionProfiles[profile][1]
+    needed = {}
+    for sectionID, names in pageSectionResults.items():
+        names = [n for n in names if n in outputs or ("parcel" in outputs and n in parcelResults)]
+        if names:
+            needed[sectionID] = names
+    return needed
+
+
+'''
+reuseSections() - cut the sections that haven't changed since "previous"
+out of the page. Return [the page, {section ID: [fingerprint, results]}
+for the sections found, {result name: value} reused]
+'''
+def reuseSections(content, profile, previous):
+    from sectionCache import pageSections, cutSections
+    needed = profileResults(profile)
+    sections = pageSections(content, needed)
+    reused = {}
+    unchanged = []
+    for sectionID, [start, end, fp] in sections.items():
+        fingerprint, results = previous.get(sectionID, [None, {}])
+        if fingerprint == fp and all(n in results for n in needed[sectionID]):
+            unchanged.append(sectionID)
+            reused.update(results)
+    today = date.today()
+    for value in reused.values():
+        for rec in value:
+            if hasattr(rec, "collectedOn"):
+                rec.collectedOn = today         # the records say when they were (re)collected
+    if unchanged:
+        content = cutSections(content, sections, unchanged)
+    return [content, {s: [fp, {}] for s, [start, end, fp] in sections.items()}, reused]
+
+
+'''
+processPage() - everything that happens to one page once it has been retrieved
+Return "problem" (Vision couldn't load the parcel), "suppressed"
+(information suppressed at the request of the taxpayer), or a ParsedPage
+'''
+profileCache = {}
+
+
+def profileParts(profile):
+    if profile not in profileCache:     # build the schema/strainer once per process
+        schema = ParcelSchema(displayHeading(profileDomIDs(profile)).split("\t"))
+        profileCache[profile] = [schema, profileStrainer(profile)]
+    return profileCache[profile]
+
+
+def processPage(content, thePID, recordCount, profile="full", previous=None):
+    if content is None or content.find(
+            b'There was an error loading the parcel') >= 0:  # Vision gave up, or we did
+        return "problem"
+    
+    sections = None
+    results = {}
+    if previous is not None:                # the section cache's entry for this PID
+        content, sections, results = reuseSections(content, profile, previous)
+    
+    from bs4 import BeautifulSoup
+    schema, strainer = profileParts(profile)
+    soup = BeautifulSoup(content, "html.parser", parse_only=strainer)
+    
+    result = soup.find(id=domIDs[0][0])     # Look for an element ID (any one would do - this uses PID)
+    if result is None:                      # If not present, presumably it's "suppresed"
+        soup.decompose()
+        return "suppressed"
+    
+    parsed = parsePage(soup, thePID, recordCount, schema, profile, results)
+    if sections is not None:
+        for sectionID, section in sections.items():
+            section[1] = {n: results[n] for n in pageSectionResults[sectionID] if n in results}
+        parsed.sections = sections
+    
+    # Release this page's tree now. BeautifulSoup trees are full of
+    # parent/child reference cycles, so without decompose() they linger
+    # until the cycle collector gets around to them (and the RSS creeps).
+    soup.decompose()
+    return parsed
+
+
+'''
+livePages() - yield (PID, page content) for each PID, retrieved from Vision
+(content is None for a PID that couldn't be retrieved)
+'''
+def livePages(infile, fe, site=None, throttle=None, quiet=False):
+    while True:
+        [page, thePID] = getNextPage(infile, fe, site, throttle, quiet)  # Get the next record from Vision
+        if page is None:    # None signals end of data
+            return
+        if page == "problem":
+            yield thePID, None
+            continue
+        content = page.content
+        page.close()
+        yield thePID, content
+
+
+'''
+processPages() - processPage() each of the (PID, content) pages
+With workers > 1, pages are parsed in a pool of processes.
+Either way, results come back in the original order, and at most a few
+pages per worker are in flight at once (so memory stays bounded).
+With a SectionCache, each page's cached sections go along with it, and
+its new sections are stored when it comes back.
+Yields (PID, result)
+'''
+def processPages(pages, profile="full", workers=1, cache=None):
+    def cached(thePID, previous, parsed):
+        if cache and isinstance(parsed, ParsedPage):
+            cache.put(thePID, parsed.sections, previous)
+        return thePID, parsed
+
+    recordCount = 0
+    if workers <= 1:
+        for thePID, content in pages:
+            recordCount += 1
+            previous = cache.get(thePID) if cache else None
+            yield cached(thePID, previous, processPage(content, thePID, recordCount, profile, previous))
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor
+    from collections import deque
+    window = workers * 4
+    inFlight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for thePID, content in pages:
+            recordCount += 1
+            previous = cache.get(thePID) if cache else None
+            inFlight.append([thePID, previous,
+                             pool.submit(processPage, content, thePID, recordCount, profile, previous)])
+            content = None
+            if len(inFlight) >= window:
+                thePID, previous, future = inFlight.popleft()
+                yield cached(thePID, previous, future.result())
+        while inFlight:
+            thePID, previous, future = inFlight.popleft()
+            yield cached(thePID, previous, future.result())
+
+
+'''
+writeResults() - hand each (PID, result) from processPages() to the sinks,
+showing progress on "fo" (None for no progress), and tick() the profilers
+after each page
+'''
+def writeResults(results, sinks, profilers=(), fo=sys.stdout):
+    skipped_pid = False
+    for thePID, parsed in results:
+        if parsed == "problem":
+            skipped_pid = True
+            for sink in sinks:
+                sink.writeProblem(thePID)
+            if fo:
+                print(".", end="", file=fo)     # print a "." (no newline) to show we're making progress]
+        else:
+            if skipped_pid:
+                skipped_pid = False
+                if fo:
+                    print("", file=fo)          # print a newline to end line of dots
+            
+            if parsed == "suppressed":
+                for sink in sinks:
+                    sink.writeSuppressed(thePID)
+            else:
+                # Serialize once, at the edge
+                for sink in sinks:
+                    sink.write(parsed)
+                
+                # Print to console/stdout so the person can track progress
+                if parsed.parcel and fo:
+                    print("%s..." % parsed.parcel.tsvRow()[:100], file=fo)
+        parsed = None
+        
+        for profiler in profilers:
+            profiler.tick(thePID)
+
+
+'''
+instrumentStages() - time the stages of the pipeline for --profile
+(processPage's own time is mostly html.parser building the tree)
+'''
+def instrumentStages(profiler, sinks):
+    module = sys.modules[__name__]
+    profiler.instrument(module, ["getNextPage", "processPage", "parseParcel", "plainValue"])
+    for attr, handler in pageHandlers.items():
+        handler[0] = profiler.timed("%s(%s)" % (handler[0].__name__, attr), handler[0])
+    for sink in sinks:
+        profiler.instrument(sink, ["write", "writeProblem", "writeSuppressed"], type(sink).__name__ + ".")
 
 
 '''
 Main Function
 
 Parse arguments
-Scan through file
-Build up dictionary for each IP address
-
+Iterate through all the PIDs (or the saved pages, with --replay),
+parse each page, and hand the records to the sinks
+(the .tsv files, and optionally an SQLite database)
 '''
 
 
@@ -567,10 +1062,52 @@ def main(argv=None):
                             type=argparse.FileType('w'), default=sys.stderr)
         parser.add_argument('-d', '--debug', action="store_true",
                             help="Enable the debug mode.")
-        theArgs = parser.parse_args()
+        parser.add_argument('-q', '--quiet', action="store_true",
+                            help="Don't beep at the end of the run")
+        parser.add_argument('--memory-profile', type=int, default=0, metavar="N",
+                            help="Report tracemalloc statistics every N pages")
+        parser.add_argument('--profile', metavar="FILE",
+                            help="Report the time in each stage and the slowest PIDs, "
+                                 "and write sampled stacks (flamegraph format) to FILE")
+        parser.add_argument('--sqlite', metavar="FILE",
+                            help="Also write the (typed) results into this SQLite database")
+        parser.add_argument('--xlsx', metavar="FILE",
+                            help="Also write the results into this .xlsx workbook (a tab per file)")
+        parser.add_argument('--xlsx-master', nargs='*', default=[], metavar="TSV",
+                            help="Older snapshots (Output/*.tsv) to put ahead of this run in the All-Scraped-Data tab")
+        parser.add_argument("-x", '--extract', choices=sorted(extractionProfiles.keys()),
+                            default="full", help="Extraction profile: which files to produce")
+        parser.add_argument("-r", '--replay', metavar="PATH",
+                            help="Parse saved pages (directory, .tar/.zip, or concatenated .html) instead of Vision")
+        parser.add_argument("-j", '--jobs', type=int, default=os.cpu_count() or 1,
+                            help="Number of processes parsing pages during --replay")
+        parser.add_argument('--outdir', default=".",
+                            help="Directory for the output files")
+        parser.add_argument("-p", '--pids', type=argparse.FileType('rt', encoding='utf-8-sig'),
+                            help="Only scrape the PIDs listed in this file (in that order)")
+        parser.add_argument("-u", '--baseurl', default=defaultBaseURL,
+                            help="Vision site for the town (e.g. a local mockVGSI.py server)")
+        parser.add_argument('--archive', metavar="DIR",
+                            help="Also keep the raw pages of this run in a page archive")
+        parser.add_argument('--photos', metavar="DIR",
+                            help="Mirror the building photos into this directory (and write Photos.tsv)")
+        parser.add_argument('--photo-workers', type=int, default=4, metavar="N",
+                            help="Number of photo downloads at once")
+        parser.add_argument('--photo-host', metavar="URL",
+                            help="Fetch the photos from here instead (e.g. http://localhost:8080 for mockVGSI.py)")
+        parser.add_argument('--canary', type=int, default=3, metavar="N",
+                            help="Check the layout of the first N parcel pages before the run (0 to skip)")
+        parser.add_argument('--retries', type=int, default=defaultRetries, metavar="N",
+                            help="Tries for each page (%d seconds apart) before it's a problem line" % retryWait)
+        parser.add_argument('--section-cache', metavar="FILE",
+                            help="Reuse the results of page sections that haven't changed since they were cached here")
+        theArgs = parser.parse_args(argv)
     except:
         return "Error parsing arguments"
 
+    global baseURL, retries
+    baseURL = theArgs.baseurl if theArgs.baseurl.endswith("/") else theArgs.baseurl + "/"
+    retries = max(1, theArgs.retries)
     output_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     
     # beep()
@@ -578,213 +1115,83 @@ def main(argv=None):
     # print(output_date)
     fi = theArgs.infile  # the argument parsing returns open file objects
     fe = theArgs.errfile
-    # fo = theArgs.outfile
-    fo     = open("ScrapeDataXX.tsv", "wt")  # ScrapeDataXX
-    fowner = open("OwnerHistory.tsv", "wt")  # Ownership History
-    fapprl = open("ApprlHistory.tsv", "wt")  # Appraisal History
-    fassmt = open("AssmtHistory.tsv", "wt")  # Assessment History
-    fbldgs = open("Buildings___.tsv", "wt")  # Buildings
-    fobldg = open("Outbuildings.tsv", "wt")  # Outbuildings
-    fxfeat = open("ExtraFeature.tsv", "wt")  # Extra features
-    fsplnd = open("SpecialLand_.tsv", "wt")  # Special Land
-    fssupp = open("Suppressed__.tsv", "wt")  # Information Suppressed
-
-    infile = VisionIDFile(fi)
+
+    # Print the heading rows, with all the column names
+    profile = theArgs.extract
+    headings = outputHeadings(profile)
+
+    if theArgs.replay:
+        from savedPages import savedPages
+        pages = savedPages(theArgs.replay)
+        workers = theArgs.jobs
     
-    # Print the heading row, with all the column names
-    output_string = displayHeading()
-    print(output_string, file=fo)
-    print("PID\tOwner\tSale Price\tCertificate\tBook&Page\tBook\tPage\tInstrument\tSale Date\tCollectedOn", file=fowner)
-    print("PID\tApp. Year\tImprovements\tLand\tTotal\tCollectedOn", file=fapprl)
-    print("PID\tAss. Year\tImprovements\tLand\tTotal\tCollectedOn", file=fassmt)
-    print("PID\tCode\tDescription\tSubCode\tSubDescr\tSize\tUnits\tValue\tBldg#\tCollectedOn", file=fobldg)
-    print("PID\tCode\tDescription\tSize\tUnits\tValue\tBldg#\tCollectedOn", file=fxfeat)
-    print("PID\tCode\tDescription\tUnits\tUnitType\tCollectedOn", file=fsplnd)
-    print("Protected Parcel PIDs", file=fssupp)
-    print(printBuildingHeader(), file=fbldgs)
+    profilers = []
+    stageProfiler = None
+    if theArgs.profile:
+        from scrapeProfiler import StageProfiler
+        stageProfiler = StageProfiler(theArgs.profile, fe)
+        workers = 1                     # so the handlers are timed in this process
+    if not theArgs.replay:
+        infile = PIDListFile(theArgs.pids) if theArgs.pids else VisionIDFile(fi)
+        throttle = stageProfiler.timed("throttle", lambda: time.sleep(0.5)) if stageProfiler else None
+        pages = livePages(infile, fe, throttle=throttle)
+        workers = 1                     # Vision is the bottleneck, not parsing
+    if theArgs.canary > 0:              # check the first pages' layout before writing anything
+        from layoutCanary import canaryPages, canaryReport
+        problems, pages = canaryPages(pages, theArgs.canary, fe)
+        if problems:
+            return canaryReport(problems, "Vision")
+    archived = None
+    if theArgs.archive:
+        from pageArchive import PageArchive, archivePages
+        pages = archived = archivePages(pages, PageArchive(theArgs.archive).startRun(output_date))
+    photoMirror = None
+    if theArgs.photos:
+        from photoMirror import PhotoMirror, photoPages
+        photoMirror = PhotoMirror(theArgs.photos, theArgs.photo_workers, theArgs.photo_host, fe=fe)
+        pages = photoPages(pages, photoMirror)
     
-    '''
-    Start of Main Loop - iterate across all the entries in the VGSI database
-    '''
-    recordCount = 0
-    skipped_pid = False
-    while True:
-        recordCount += 1
-        [page, thePID] = getNextPage(infile, fe)  # Get the next record from Vision
-        
-        if page is None:    # None signals end of data
-            break           # break to exit the program
-        
-        inStr = page.text   # Check for non-existent PID
-        if inStr.find(
-                'There was an error loading the parcel') >= 0:  # if this error present
-            skipped_pid = True
-            output_string = "%s\tProblem loading parcel PID\t" % (thePID)
-            print(output_string, file=fo)
-            print(".", end="")      # print a "." (no newline) to show we're making progress]
-            continue
-        elif skipped_pid:
-            skipped_pid = False
-            print("")               # print a newline to end line of dots
-        
-        soup = BeautifulSoup(page.content, "html.parser")
-        
-        result = soup.find(id=domIDs[0][0])     # Look for an element ID (any one would do - this uses PID)
-        if result is None:                      # If not present, log it, presumably it's "suppresed"
-            print("%s\tInformation suppressed due to the request of the taxpayer" % thePID, file=fssupp)
-            continue                            # continue with the next PID
-        
-        now = datetime.now()
-        current_time = now.strftime("%Y-%m-%d %H:%M:%S")
-        
-        # First print the random fields from the page
-        output_string = ""
-        for x in range(len(domIDs)):
-            result = soup.find(id=domIDs[x][0])
-            
-            # Pre-output_string processing
-            if domIDs[x][0] == "MainContent_lblAddr1":  # patch up label address to remove <br> tag
-                ary = result.contents
-                for i in range(len(ary)):
-                    if isinstance(ary[i], element.Tag):
-                        ary[i] = ""
-                output_string += "%s\t" % " ".join(ary).strip()
-                continue
-            if domIDs[x][0] == "MainContent_lblLocation":  # Split street number and name
-                # pattern = r"^\s*(\d)\s*(.*)" # groups are leading blanks, number, street name
-                # match = re.match(pattern, result.text)
-                digits, remainder = parse_street_name(result.text)
-                output_string += "%s\t%s\t" % (digits.strip(), remainder.strip())
-                continue
-            
-            # standard processing for ordinary value
-            output_string += "%s\t" % plainValue(result.text)
-            
-            # Post-output_string processing - append to the retrieved value
-            if domIDs[x][0] == "MainContent_lblBp": # split Book&Page
-                ary = splitBookAndPage(result)
-                output_string += "%s\t%s\t" % (ary[0], ary[1])
-            if domIDs[x][0] == "MainContent_lblMblu":  # also split MBLU
-                ary = result.text.split("/")
-                output_string += "%s\t%s\t%s\t%s\t" % (ary[0].strip(), ary[1].strip(), ary[2].strip(), ary[3].strip())
-
-        # # Print the most recent appraisal date, Improvements, Land, and Total
-        # table = soup.find(
-        #     lambda tag: tag.name == 'table' and tag.has_attr('id') and tag['id'] == "MainContent_grdCurrentValueAppr")
-        # rows = table.findAll(lambda tag: tag.name == 'tr')
-        # vals = rows[1].contents # contents of the row
-        # for x in range(1,5):
-        #     output_string += vals[x].text + "\t"
-        
-        # Print the recent sale price and date
-        for x in range(len(saleDomIDs)):
-            result = soup.find(id=saleDomIDs[x][0])
-            output_string += "%s\t" % plainValue(result.text)
-        
-        # Print the most recent non-zero sale price and date
-        # handle case where there isn't a value for either - just insert ""
-        recentSale = soup.find(id=saleDomIDs[0][0]).text
-        table = soup.find(
-            lambda tag: tag.name == 'table' and tag.has_attr('id') and tag[
-                'id'] == "MainContent_grdSales")
-        rows = table.find_all(lambda tag: tag.name == 'tr')
-        prevSalesStr = ""
-        for x in range(1, len(rows)):
-            vals = rows[x].contents
-            if vals[2].text == "$0" or vals[2].text == recentSale:  # no new info
-                continue
-            dateIx = len(vals) - 2  # sometimes five columns, sometimes 6 :-(
-            prevSalesStr += "%s\t%s\t" % (plainValue(vals[2].text), plainValue(vals[dateIx].text))
-            break
-        if prevSalesStr == "":
-            prevSalesStr = "\t\t"
-        output_string += prevSalesStr
-        
-        # Grab the most recent Assessment from the Valuation History
-        table = soup.find(
-            lambda tag: tag.name == 'table' and tag.has_attr('id') and tag[
-                'id'] == "MainContent_grdHistoryValuesAsmt")
-        rows = table.find_all(lambda tag: tag.name == 'tr')
-        ass_imp = ""
-        ass_land = ""
-        ass_tot = ""
-        # First get Current Assessed Improvements/Land/Total
-        try:
-            vals = rows[1].contents
-            ass_imp = plainValue(vals[2].text)
-            ass_land = plainValue(vals[3].text)
-            ass_tot = plainValue(vals[4].text)
-        except:
-            appr = ""
-        output_string += "%s\t%s\t%s\t" % (ass_imp, ass_land, ass_tot)
-        # Then get Previous Assessed Improvements/Land/Total
-        try:
-            vals = rows[2].contents
-            ass_imp = plainValue(vals[2].text)
-            ass_land = plainValue(vals[3].text)
-            ass_tot = plainValue(vals[4].text)
-        except:
-            appr = ""
-        output_string += "%s\t%s\t%s\t" % (ass_imp, ass_land, ass_tot)
-        
-        # Grab the most recent Appraisal from the Valuation History
-        table = soup.find(
-            lambda tag: tag.name == 'table' and tag.has_attr('id') and tag[
-                'id'] == "MainContent_grdHistoryValuesAppr")
-        rows = table.find_all(lambda tag: tag.name == 'tr')
-        # First get Current Appraised Improvements/Land/Total
-        appr_imp = ""
-        appr_land = ""
-        appr_tot = ""
-        try:
-            vals = rows[1].contents
-            appr_imp = plainValue(vals[2].text)
-            appr_land = plainValue(vals[3].text)
-            appr_tot = plainValue(vals[4].text)
-        except:
-            appr = ""
-        output_string += "%s\t%s\t%s\t" % (appr_imp, appr_land, appr_tot)
-        
-        # Then get Previous Appraised Improvements/Land/Total
-        try:
-            vals = rows[2].contents
-            appr_imp = plainValue(vals[2].text)
-            appr_land = plainValue(vals[3].text)
-            appr_tot = plainValue(vals[4].text)
-        except:
-            appr = ""
-        output_string += "%s\t%s\t%s\t" % (appr_imp, appr_land, appr_tot)
-        
-        # Tack on (empty/fake) version number, time stamp, row counter
-        output_string += "Version?\t%s\t%d" % (current_time, recordCount)
-        print(output_string, file=fo)
-        
-        # Print to console/stdout so the person can track progress
-        print("%s..." % output_string[:100])
-
-        # Append the sub-tables to their own files
-        histStr = handleOwnerHistory(soup, "MainContent_grdSales", thePID)
-        print(histStr, file=fowner, end="")
-        # Output the history of the Appraisals
-        histStr = handleAppAssHistory(soup, "MainContent_grdHistoryValuesAppr", thePID)
-        print(histStr, file=fapprl, end="")
-        # Output the history of the Assessments
-        histStr = handleAppAssHistory(soup, "MainContent_grdHistoryValuesAsmt", thePID)
-        print(histStr, file=fassmt, end="")
-        # Output information about each building
-        histStr = handleBuildings(soup, "", thePID)
-        print(histStr, file=fbldgs, end="")
-        # Output information about the outbuildings
-        histStr = handleOutbuildings(soup, "MainContent_grdOb", thePID)
-        print(histStr, file=fobldg, end="")
-        # Output information about the Special Land table
-        histStr = handleSpecialLand(soup, "MainContent_grdSpclLand", thePID)
-        print(histStr, file=fsplnd, end="")
-        # Output information about the Extra features
-        histStr = handleExtraFeatures(soup, "MainContent_grdXf", thePID)
-        print(histStr, file=fxfeat, end="")
+    sinks = [TsvSink(headings, theArgs.outdir)]
+    if theArgs.sqlite:
+        sinks.append(SqliteSink(headings, theArgs.sqlite))
+    if theArgs.xlsx:
+        from xlsxExport import XlsxSink
+        sinks.append(XlsxSink(headings, theArgs.xlsx, theArgs.xlsx_master, "scrapevgsi %s" % output_date, fe))
+    if stageProfiler:
+        instrumentStages(stageProfiler, sinks)
+    
+    if theArgs.memory_profile > 0:
+        from scrapeProfiler import MemoryProfiler
+        profilers.append(MemoryProfiler(theArgs.memory_profile, fe))
+    if stageProfiler:
+        profilers.append(stageProfiler)
+    for profiler in profilers:
+        profiler.start()
+    
+    sectionCache = None
+    if theArgs.section_cache:
+        from sectionCache import SectionCache
+        sectionCache = SectionCache(theArgs.section_cache, sectionParserKey())
+
+    try:
+        writeResults(processPages(pages, profile, workers, sectionCache), sinks, profilers)
+    finally:
+        if archived:
+            archived.close()            # save the run's pages so far, even on ^C
+
+    for sink in sinks:
+        sink.close()
+    if sectionCache:
+        sectionCache.report(fe)
+        sectionCache.close()
+    if photoMirror:
+        photoMirror.report(photoMirror.finish(os.path.join(theArgs.outdir, "Photos.tsv")))
+    for profiler in profilers:
+        profiler.finish()
 
     # And we're done
+    if theArgs.replay or theArgs.quiet:
+        return
     beep()
     time.sleep(0.5)
     beep()
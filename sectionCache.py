@@ -0,0 +1,196 @@
+'''
+Section Cache
+
+When a parcel page changes, usually only one section of it has changed
+(a new year in MainContent_grdHistoryValuesAsmt, say); the sales grid,
+buildings, outbuildings, extra features and special land are the same
+as last run. scrapevgsi.py --section-cache FILE keeps, for each PID and
+section, a fingerprint of the section's raw markup and what was parsed
+from it (the records, plus the bits the ScrapeDataXX line takes from it).
+
+Before a page is parsed, each section's markup is found with a byte scan
+(no parsing) and fingerprinted. A section whose fingerprint matches the
+cache is cut out of the page, so html.parser never sees it, and its
+cached results are used instead. Only the changed sections (and the
+small top of the page) are parsed.
+
+The cache is an SQLite database:
+- sections - PID, section ID, fingerprint, the pickled results
+- meta - the parser key it was made with: scrapevgsi.parserVersion plus
+  a hash of the source of the parsing modules, so any change to the
+  parsing (or to bs4) throws the whole cache away
+
+Usage:
+    python scrapevgsi.py --section-cache SectionCache.db ...
+    python sectionCache.py -c SectionCache.db           # what's in it
+'''
+
+import sys
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+
+commitEvery = 200           # pages between commits
+
+
+'''
+sectionSpan() - [start, end] of the element with this id in the raw page, or None
+Finds the element's start tag, then its matching end tag by counting
+the nested tags of the same name.
+'''
+def sectionSpan(content, sectionID):
+    at = content.find(b'id="%s"' % sectionID.encode())
+    if at < 0:
+        return None
+    start = content.rfind(b"<", 0, at)
+    name = re.match(rb"<([A-Za-z0-9]+)", content[start:start + 20])
+    if start < 0 or not name:
+        return None
+    depth = 0
+    for m in re.compile(rb"<(/?)%s\b" % name.group(1), re.I).finditer(content, start):
+        if m.group(1):
+            depth -= 1
+            if depth == 0:
+                end = content.find(b">", m.end())
+                return None if end < 0 else [start, end + 1]
+        else:
+            depth += 1
+    return None
+
+
+def fingerprint(markup):
+    return hashlib.blake2b(markup, digest_size=16).hexdigest()
+
+
+'''
+pageSections() - {section ID: [start, end, fingerprint]} for the sections found in the page
+'''
+def pageSections(content, sectionIDs):
+    sections = {}
+    for sectionID in sectionIDs:
+        span = sectionSpan(content, sectionID)
+        if span:
+            sections[sectionID] = span + [fingerprint(content[span[0]:span[1]])]
+    return sections
+
+
+'''
+cutSections() - the page without the given sections
+'''
+def cutSections(content, sections, sectionIDs):
+    spans = sorted(sections[s][:2] for s in sectionIDs)
+    pieces = []
+    at = 0
+    for start, end in spans:
+        pieces.append(content[at:start])
+        at = end
+    pieces.append(content[at:])
+    return b"".join(pieces)
+
+
+'''
+parserKey() - the version plus a hash of the files the parser is made of
+'''
+def parserKey(version, modules):
+    h = hashlib.blake2b(digest_size=8)
+    for module in modules:
+        fileName = getattr(module, "__file__", None)
+        if fileName and os.path.exists(fileName):
+            with open(fileName, "rb") as f:
+                h.update(f.read())
+        h.update(str(getattr(module, "__version__", "")).encode())
+    return "%s:%s" % (version, h.hexdigest())
+
+
+'''
+SectionCache - the cache database
+get() returns {section ID: [fingerprint, {result name: value}]} for a PID
+'''
+
+
+class SectionCache:
+    def __init__(self, fileName, key=""):
+        self.db = sqlite3.connect(fileName)
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS sections (pid TEXT, section TEXT, fingerprint TEXT, '
+                        'results BLOB, PRIMARY KEY (pid, section))')
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'key'").fetchone()
+        self.stale = bool(key) and (row is None or row[0] != key)
+        if self.stale:                  # another parser made these results
+            self.db.execute("DELETE FROM sections")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('key', ?)", (key,))
+            self.db.commit()
+        self.pages = 0
+        self.reused = 0
+        self.parsed = 0
+
+    def get(self, pid):
+        return {section: [fp, pickle.loads(results)] for section, fp, results in self.db.execute(
+            "SELECT section, fingerprint, results FROM sections WHERE pid = ?", (str(pid),))}
+
+    '''
+    put() - store a page's sections (those that were reused are only counted)
+    An unchanged section that was parsed anyway, for results its entry didn't
+    have (a fuller profile than last time), gets those results added.
+    '''
+    def put(self, pid, sections, previous):
+        rows = []
+        for sectionID, [fp, results] in sections.items():
+            cachedFP, cached = previous.get(sectionID, [None, {}])
+            if cachedFP == fp:
+                if all(n in cached for n in results):
+                    self.reused += 1
+                    continue
+                results = dict(cached, **results)
+            self.parsed += 1
+            rows.append([str(pid), sectionID, fp, pickle.dumps(results, pickle.HIGHEST_PROTOCOL)])
+        self.db.executemany("INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?)", rows)
+        self.pages += 1
+        if self.pages % commitEvery == 0:
+            self.db.commit()
+
+    def report(self, fe=sys.stderr):
+        print("Section cache: %d pages, %d sections reused, %d parsed%s" % (
+            self.pages, self.reused, self.parsed, " (parser changed, cache cleared)" if self.stale else ""),
+            file=fe)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-c", '--cache', default="SectionCache.db", help="The cache database")
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    if not os.path.exists(theArgs.cache):
+        return "No section cache %s" % theArgs.cache
+    cache = SectionCache(theArgs.cache)
+    fo = theArgs.outfile
+    key = cache.db.execute("SELECT value FROM meta WHERE name = 'key'").fetchone()
+    print("Parser key: %s" % (key[0] if key else "-"), file=fo)
+    for section, pids, size in cache.db.execute(
+            "SELECT section, COUNT(*), SUM(LENGTH(results)) FROM sections GROUP BY section ORDER BY section"):
+        print("%-36s %6d PIDs %10d bytes" % (section, pids, size), file=fo)
+    cache.db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
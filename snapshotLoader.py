@@ -0,0 +1,335 @@
+'''
+Snapshot Loader
+
+Load any of the historical parcel snapshots (the Output/*.tsv runs,
+HistoryRecords.tsv, ScrapeDataXX.tsv, the odd .csv) into one table
+with the current ScrapeDataXX.tsv columns - displayHeading() in scrapevgsi.py.
+
+The headings have drifted over the years:
+- basic          - Sep 2021: Year/Improvements/Land/Total, no Book&Page
+- appraisal      - Oct 2021 - Jan 2022: Appr. Year/Improvements/Land/Total (the current appraisal)
+- prev. totals   - adds Prev. Assess./Prev. Apprais (the previous totals)
+- prev. values   - Prev. Ass./Prev. App. Imp/Land/Tot
+- valuation      - Curr. and Prev. Ass./App. Imp/Land/Tot
+- current        - StreetNum/StreetName, Map/Lot/Unit/Sub, Book/Page, Neighborhood, ...
+
+Each file's version comes from its heading line. Its columns are mapped
+onto the current ones (Improvements -> Curr. App. Imp, Prev. Assess. ->
+Prev. Ass. Tot, ...), and the split columns (StreetNum/StreetName, Map/Lot/Unit/Sub,
+Book/Page) are filled in from Street Address, MBLU and Book&Page when
+the file doesn't have them. Columns with nowhere to go are listed by
+the "versions" command. (The mapping lives in parcelStore.py, which
+uses it too.)
+
+"Problem loading parcel", "Can't reach the server" and "Information suppressed"
+lines are dropped (or kept, with --filler, flagged in a Filler column).
+
+Values are typed a column at a time: money ("$284,100" or "284100"),
+counts and sizes become numbers (float, NaN if missing), sale dates
+("06/29/2018", "6/29/18" or "2018-06-29") become dates. Text columns are
+kept as pandas categories. A value in a number or date column that won't
+convert is reported (on -e) when the file is parsed, not silently lost.
+
+Parsing the text is slow compared to reading numbers, so each loaded
+file is cached in --cache (default SnapshotCache/) as an uncompressed .npz
+of its columns (text as category codes plus the categories). The cache
+entry is used as long as the source file's size and modification time
+(and loaderVersion) are unchanged, so reloading the whole archive takes
+milliseconds.
+
+It needs numpy and pandas.
+
+Usage:
+    python snapshotLoader.py versions Output/*.tsv Output/*.csv
+    python snapshotLoader.py load Output/*.tsv Output/*.csv -o AllSnapshots.tsv
+'''
+
+import sys
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from parcelStore import (runDate, fillerPattern, currentColumns, mapHeading, readText,
+                         derivedColumns)
+from vgsiRecords import ParcelSchema, toDate
+
+loaderVersion = 2
+defaultCache = "SnapshotCache"
+
+# [version, a column only found in that version or later], newest first
+schemaVersions = [
+    ["current", "StreetNum"],
+    ["valuation", "Curr. Ass. Tot"],
+    ["prev. values", "Prev. Ass. Tot"],
+    ["prev. totals", "Prev. Assess."],
+    ["appraisal", "Appr. Year"],
+    ["basic", "PID"],
+]
+
+extraColumns = ["RunDate", "Source", "Schema"]
+
+
+def schemaVersion(heading):
+    for version, marker in schemaVersions:
+        if marker in heading:
+            return version
+    return "unknown"
+
+
+'''
+columnTypes() - "number", "date" or "text" for each current column
+(the typed columns of vgsiRecords.ParcelSchema)
+'''
+def columnTypes(columns):
+    schema = ParcelSchema(columns)
+    return {c: "date" if conv is toDate else "text" if conv.__name__ == "toStr" else "number"
+            for c, conv in zip(schema.columns, schema.converters)}
+
+
+def toNumbers(series):
+    return pd.to_numeric(series.str.replace(r"[$,\s\"]", "", regex=True), errors="coerce")
+
+
+def toDates(series):
+    dates = pd.to_datetime(series, format="%Y-%m-%d", errors="coerce")
+    for format in ["%m/%d/%Y", "%m/%d/%y"]:
+        dates = dates.fillna(pd.to_datetime(series, format=format, errors="coerce"))
+    return dates.values.astype("datetime64[D]")
+
+
+'''
+reportUnconverted() - say how many of a column's values didn't convert (and show a few)
+'''
+def reportUnconverted(fileName, column, kind, values, typed, keep, fe):
+    failed = keep & (values.str.strip('" ').to_numpy() != "") & pd.isna(typed)
+    if failed.any():
+        examples = values[failed].unique()[:3]
+        print("%s: %d %s values aren't %ss (e.g. %s)" % (
+            fileName, failed.sum(), column, kind, ", ".join(repr(v) for v in examples)), file=fe)
+
+
+'''
+parseSnapshot() - a file as a DataFrame with the current columns, typed
+'''
+def parseSnapshot(fileName, columns, keepFiller=False, fe=sys.stderr):
+    heading, rows = readText(fileName)
+    mapping, unmapped = mapHeading(heading, columns)
+    text = {}
+    for i, target in mapping.items():
+        text[target] = [row[i].strip() if i < len(row) else "" for row in rows]
+    n = len(rows)
+    filler = np.array([any(fillerPattern.search(cell) for cell in row[1:3]) for row in rows], dtype=bool)
+    for targets, source, split in derivedColumns:
+        if source in heading and not all(t in text for t in targets):
+            i = heading.index(source)
+            parts = [split(row[i] if i < len(row) else "") for row in rows]
+            for k, t in enumerate(targets):
+                if t not in text:
+                    text[t] = [p[k] for p in parts]
+
+    types = columnTypes(columns)
+    df = pd.DataFrame(index=range(n))
+    for c in columns:
+        values = pd.Series(text.get(c, [""] * n), dtype=str)
+        if c == "PID":
+            df[c] = toNumbers(values.str.replace("﻿", "")).fillna(-1).astype(np.int64)
+        elif types[c] == "number":
+            df[c] = toNumbers(values).astype(float)
+        elif types[c] == "date":
+            df[c] = toDates(values)
+        else:
+            df[c] = values.str.strip('"').astype("category")
+        if c != "PID" and types[c] != "text":
+            reportUnconverted(fileName, c, types[c], values, df[c].to_numpy(), ~filler, fe)
+    df["RunDate"] = np.full(n, np.datetime64(runDate(fileName) or "NaT", "D"))
+    df["Source"] = pd.Categorical([os.path.basename(fileName)] * n)
+    df["Schema"] = pd.Categorical([schemaVersion(heading)] * n)
+    df["Filler"] = filler
+    keep = df["PID"].to_numpy() >= 0
+    if not keepFiller:
+        keep &= ~filler
+        df = df.drop(columns="Filler")
+    df = df.loc[keep]
+    return df.reset_index(drop=True)
+
+
+'''
+Cache - an uncompressed .npz per source file (and one for the whole set
+loaded by loadSnapshots), packed into a few big arrays so that loading
+is a handful of reads rather than one per column:
+- numbers - every float column, side by side (rows x columns)
+- days    - every date column as days since 1970 (NaT as daysMissing)
+- codes   - every category column's codes
+- text    - all the categories, NUL-separated UTF-8, with "ranges"
+            saying which of them belong to which column
+- stamp   - loaderVersion plus the size and modification time of each source
+'''
+
+daysMissing = np.iinfo(np.int64).min
+
+
+def cacheName(cacheDir, fileName):
+    return os.path.join(cacheDir, os.path.basename(fileName) + ".npz")
+
+
+def sourceStamp(fileNames):
+    stamp = [loaderVersion]
+    for fileName in fileNames:
+        st = os.stat(fileName)
+        stamp.extend([st.st_size, st.st_mtime_ns])
+    return np.array(stamp, dtype=np.int64)
+
+
+def saveFrame(df, path, stamp, sources):
+    kinds = []
+    numbers, days, codes, categories, ranges = [], [], [], [], []
+    for c in df.columns:
+        col = df[c]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            kinds.append("c")
+            codes.append(col.cat.codes.to_numpy(np.int32))
+            ranges.append([len(categories), len(categories) + len(col.cat.categories)])
+            categories.extend(str(k) for k in col.cat.categories)
+        elif col.dtype.kind == "M":
+            kinds.append("d")
+            days.append(col.to_numpy().astype("datetime64[D]").astype(np.int64))
+        elif col.dtype.kind == "i":
+            kinds.append("i")
+            numbers.append(col.to_numpy(np.float64))
+        else:
+            kinds.append("f")
+            numbers.append(col.to_numpy(np.float64))
+    rows = len(df)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, stamp=stamp, sources=np.array(sources, dtype=str),
+             columns=np.array(list(df.columns), dtype=str), kinds=np.array(kinds, dtype=str),
+             numbers=np.array(numbers, dtype=np.float64).reshape(len(numbers), rows),
+             days=np.array(days, dtype=np.int64).reshape(len(days), rows),
+             codes=np.array(codes, dtype=np.int32).reshape(len(codes), rows),
+             text=np.frombuffer("\0".join(categories).encode("utf-8"), dtype=np.uint8),
+             ranges=np.array(ranges, dtype=np.int64).reshape(len(ranges), 2))
+
+
+def loadFrame(path, stamp, sources):
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        if not np.array_equal(z["stamp"], stamp) or list(z["sources"]) != list(sources):
+            return None
+        numbers, days, codes, ranges = z["numbers"], z["days"], z["codes"], z["ranges"]
+        text = z["text"].tobytes().decode("utf-8")
+        categories = np.array(text.split("\0") if text or len(ranges) else [], dtype=object)
+        data = {}
+        counters = {"f": 0, "d": 0, "c": 0}
+        for c, kind in zip(z["columns"], z["kinds"]):
+            store = "f" if kind == "i" else kind      # ints are kept with the floats
+            n = counters[store]
+            counters[store] += 1
+            if kind == "c":
+                lo, hi = ranges[n]
+                dtype = pd.CategoricalDtype(pd.Index(categories[lo:hi], dtype=object))
+                data[str(c)] = pd.Categorical.from_codes(codes[n], dtype=dtype)
+            elif kind == "d":
+                data[str(c)] = np.where(days[n] == daysMissing, np.datetime64("NaT"),
+                                        days[n].astype("datetime64[D]"))
+            elif kind == "i":
+                data[str(c)] = numbers[n].astype(np.int64)
+            else:
+                data[str(c)] = numbers[n]
+    return pd.DataFrame(data)
+
+
+'''
+loadSnapshot() - one file, from the cache if it's up to date
+'''
+def loadSnapshot(fileName, columns=None, cacheDir=defaultCache, keepFiller=False, fe=sys.stderr):
+    columns = columns or currentColumns()
+    stamp = sourceStamp([fileName])
+    path = cacheName(cacheDir, fileName) if cacheDir and not keepFiller else None
+    if path:
+        df = loadFrame(path, stamp, columns)
+        if df is not None:
+            return df
+    df = parseSnapshot(fileName, columns, keepFiller, fe)
+    if path:
+        saveFrame(df, path, stamp, columns)
+    return df
+
+
+'''
+loadSnapshots() - all the files, one after another, in run date order
+'''
+def loadSnapshots(fileNames, cacheDir=defaultCache, keepFiller=False, fe=sys.stderr):
+    columns = currentColumns()
+    stamp = sourceStamp(fileNames)
+    sources = columns + [os.path.abspath(f) for f in fileNames]
+    path = os.path.join(cacheDir, "Snapshots.npz") if cacheDir and not keepFiller else None
+    if path:
+        df = loadFrame(path, stamp, sources)
+        if df is not None:
+            return df
+    frames = [loadSnapshot(f, columns, cacheDir, keepFiller, fe) for f in fileNames]
+    if not frames:
+        return pd.DataFrame(columns=columns + extraColumns)
+    df = pd.concat(frames, ignore_index=True)
+    for c in df.columns:
+        if df[c].dtype.kind in "OT":            # categories that differed between files
+            df[c] = df[c].astype("category")
+    df = df.sort_values("RunDate", kind="stable").reset_index(drop=True)
+    if path:
+        saveFrame(df, path, stamp, sources)
+    return df
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('command', choices=["versions", "load"])
+        parser.add_argument('files', nargs='+')
+        parser.add_argument("-o", '--outfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stdout)
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--cache', default=defaultCache,
+                            help="Cache directory (\"\" for none)")
+        parser.add_argument('--filler', action='store_true',
+                            help="Keep the filler lines, flagged in a Filler column")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fo = theArgs.outfile
+    fe = theArgs.errfile
+    if theArgs.command == "versions":
+        columns = currentColumns()
+        print("File\tRun Date\tSchema\tRows\tNot mapped", file=fo)
+        for fileName in theArgs.files:
+            heading, rows = readText(fileName)
+            mapping, unmapped = mapHeading(heading, columns)
+            print("%s\t%s\t%s\t%d\t%s" % (fileName, runDate(fileName) or "", schemaVersion(heading),
+                                          len(rows), ", ".join(unmapped)), file=fo)
+        return
+
+    start = time.perf_counter()
+    df = loadSnapshots(theArgs.files, theArgs.cache, theArgs.filler, fe)
+    print("%d rows from %d files in %.3f seconds" % (len(df), len(theArgs.files),
+                                                     time.perf_counter() - start), file=fe)
+    for c in df.columns:
+        if df[c].dtype.kind == "M":
+            df[c] = df[c].dt.strftime("%Y-%m-%d")
+    df.to_csv(fo, sep="\t", index=False, quoting=csv.QUOTE_NONE, escapechar="\\",
+              float_format="%.15g", lineterminator="\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,410 @@
+'''
+Sweep Scheduler
+
+Spread a full scrapevgsi.py sweep across the hours we're allowed to
+scrape Vision (e.g. nights), finishing by a deadline, with no babysitting.
+
+"plan" splits the PIDs into small slices and saves the plan (sweep.json)
+in a sweep directory. "run" (from cron, or left running) scrapes slices
+only inside the allowed windows: before starting a slice it checks that
+the slice will finish before the window closes, using the cost per page
+measured on the slices already done. A slice that is interrupted is simply
+scraped again in the next window. A slice that fails is marked "failed"
+and the sweep moves on; it's tried again after the other slices, up to
+maxRetries times. When every slice is done (or has failed for good), the
+slices' files are assembled into one snapshot (the usual .tsv files),
+each PID once.
+
+Each slice is scraped by its own scrapevgsi.py process, so nothing
+(--profile's instrumented handlers, say) carries over from one slice to
+the next. scrapevgsi.py's layout check (--canary) runs until a slice has
+gone through in this "run"; the later slices skip it.
+
+Usage:
+    python sweepScheduler.py plan -s Sweep-2024-10 --windows 22:00-06:00 \\
+        --deadline 2024-10-21T06:00 [--pids PIDs/PIDs-Sorted-15jul2024.csv]
+    python sweepScheduler.py run -s Sweep-2024-10 [--once]
+    python sweepScheduler.py status -s Sweep-2024-10
+    python sweepScheduler.py assemble -s Sweep-2024-10 --outdir ScrapedData-Oct2024
+
+Windows are local times, comma-separated, optionally with days:
+"22:00-06:00" (every night), "Sat,Sun 08:00-20:00", "Mon-Fri 19:00-23:30"
+'''
+
+import sys
+import argparse
+import json
+import os
+import re
+import subprocess
+import time
+from datetime import datetime, timedelta
+from statistics import median
+
+import scrapevgsi
+from vgsiRecords import outputFiles, runMarker, markRunComplete
+
+dayNames = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+windowPattern = re.compile(r"^(?:([A-Za-z,\-]+)\s+)?(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$")
+stateFile = "sweep.json"
+defaultCost = 1.5           # seconds per page before we've measured any (0.5s pause + request)
+safetyFactor = 1.25         # only start a slice if it should finish with 25% to spare
+recentSlices = 10           # estimate the cost from this many of the latest slices
+maxRetries = 3              # times a failed slice is tried before the sweep gives up on it
+
+'''
+parseDays() - "Mon-Fri" or "Sat,Sun" -> set of weekday numbers (Monday = 0)
+'''
+def parseDays(text):
+    days = set()
+    for part in text.split(","):
+        ends = [dayNames.index(d[:3].capitalize()) for d in part.split("-")]
+        if len(ends) == 1:
+            days.add(ends[0])
+        else:
+            d = ends[0]
+            while True:
+                days.add(d)
+                if d == ends[1]:
+                    break
+                d = (d + 1) % 7
+    return days
+
+
+'''
+parseWindows() - "Sat,Sun 08:00-20:00, 22:00-06:00" ->
+list of [days (None for every day), start minute, end minute]
+A window whose end is before its start runs past midnight.
+'''
+def parseWindows(text):
+    windows = []
+    for part in re.split(r"(?<=\d),\s*", text.strip()):
+        m = windowPattern.match(part.strip())
+        if not m:
+            raise ValueError("Can't understand the window '%s'" % part)
+        days = parseDays(m.group(1)) if m.group(1) else None
+        windows.append([days, int(m.group(2)) * 60 + int(m.group(3)),
+                        int(m.group(4)) * 60 + int(m.group(5))])
+    return windows
+
+
+'''
+windowIntervals() - the actual [start, end) datetimes of the windows
+that overlap the time between "begin" and "end"
+'''
+def windowIntervals(windows, begin, end):
+    result = []
+    day = (begin - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        for days, startMinute, endMinute in windows:
+            if days is not None and day.weekday() not in days:
+                continue
+            start = day + timedelta(minutes=startMinute)
+            stop = day + timedelta(minutes=endMinute)
+            if stop <= start:
+                stop += timedelta(days=1)
+            if stop > begin and start < end:
+                result.append([max(start, begin), min(stop, end)])
+        day += timedelta(days=1)
+    result.sort()
+    return result
+
+
+'''
+currentWindow() - the [start, end] of the window "now" is in, or None
+'''
+def currentWindow(windows, now):
+    for start, stop in windowIntervals(windows, now - timedelta(days=1), now + timedelta(days=2)):
+        if start <= now < stop:
+            return [start, stop]
+    return None
+
+
+def nextWindowStart(windows, now):
+    intervals = windowIntervals(windows, now, now + timedelta(days=8))
+    return intervals[0][0] if intervals else None
+
+
+def windowSeconds(windows, begin, end):
+    return sum((stop - start).total_seconds() for start, stop in windowIntervals(windows, begin, end))
+
+
+'''
+Sweep - the plan and progress of one sweep, kept in <directory>/sweep.json
+'''
+
+
+class Sweep:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, stateFile), "rt") as f:
+            self.state = json.load(f)
+        self.windows = parseWindows(self.state["windows"])
+        self.deadline = datetime.fromisoformat(self.state["deadline"])
+
+    @staticmethod
+    def create(directory, pids, windows, deadline, sliceSize, scrapeArgs, costs=()):
+        parseWindows(windows)               # complain now, not at midnight
+        os.makedirs(directory, exist_ok=True)
+        slices = []
+        for i in range(0, len(pids), sliceSize):
+            slices.append({"slice": len(slices) + 1, "pids": pids[i:i + sliceSize],
+                           "status": "pending"})
+        state = {"created": datetime.now().isoformat(timespec="seconds"),
+                 "deadline": deadline.isoformat(timespec="minutes"),
+                 "windows": windows, "scrapeArgs": scrapeArgs,
+                 "costs": list(costs)[-recentSlices:], "slices": slices}
+        saveState(directory, state)
+        return Sweep(directory)
+
+    def save(self):
+        saveState(self.directory, self.state)
+
+    def sliceDir(self, s):
+        return os.path.join(self.directory, "slice-%04d" % s["slice"])
+
+    '''
+    pending() - the slices still to scrape: new or interrupted ones first,
+    then the failed ones that have retries left
+    '''
+    def pending(self):
+        slices = [s for s in self.state["slices"] if s["status"] != "done"
+                  and not (s["status"] == "failed" and s.get("retries", 0) >= maxRetries)]
+        return sorted(slices, key=lambda s: s["status"] == "failed")
+
+    def failed(self):
+        return [s for s in self.state["slices"]
+                if s["status"] == "failed" and s.get("retries", 0) >= maxRetries]
+
+    '''
+    costPerPage() - seconds per page, the median of the most recent slices
+    '''
+    def costPerPage(self):
+        costs = self.state["costs"][-recentSlices:]
+        return median(costs) if costs else defaultCost
+
+    def pendingPages(self):
+        return sum(len(s["pids"]) for s in self.pending())
+
+    '''
+    forecast() - [seconds of scraping needed, seconds of window left before the deadline]
+    '''
+    def forecast(self, now=None):
+        now = now or datetime.now()
+        return [self.pendingPages() * self.costPerPage(),
+                windowSeconds(self.windows, now, self.deadline)]
+
+    '''
+    runSlice() - scrape one slice into its own directory (in a scrapevgsi.py
+    process of its own), and measure it
+    Return None, or scrapevgsi.py's error message
+    '''
+    def runSlice(self, s, fe, canary=True):
+        outdir = self.sliceDir(s)
+        os.makedirs(outdir, exist_ok=True)
+        pidFile = os.path.join(outdir, "pids.txt")
+        with open(pidFile, "wt") as f:
+            print("\n".join(s["pids"]), file=f)
+        s["status"] = "running"
+        s["started"] = datetime.now().isoformat(timespec="seconds")
+        self.save()
+        begin = time.monotonic()
+        argv = self.state["scrapeArgs"] + ["--pids", pidFile, "--outdir", outdir, "--quiet",
+                                           "-e", os.path.join(outdir, "errors.txt")]
+        if not canary:
+            argv += ["--canary", "0"]
+        process = subprocess.run([sys.executable, scrapevgsi.__file__] + argv,
+                                 stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:         # main()'s error message, or a traceback
+            result = process.stderr.strip() or "exit status %d" % process.returncode
+            print("Slice %d failed: %s" % (s["slice"], result), file=fe)
+            s["status"] = "failed"
+            s["retries"] = s.get("retries", 0) + 1
+            s["error"] = result.splitlines()[-1]
+            self.save()
+            return result
+        seconds = time.monotonic() - begin
+        s["status"] = "done"
+        s["finished"] = datetime.now().isoformat(timespec="seconds")
+        s["seconds"] = round(seconds, 1)
+        self.state["costs"].append(round(seconds / max(1, len(s["pids"])), 3))
+        self.state["costs"] = self.state["costs"][-recentSlices:]
+        self.save()
+        return None
+
+    '''
+    run() - scrape slices whenever we're inside a window and the next slice fits
+    With "once", stop at the end of the current window (e.g. when started by cron)
+    A failed slice doesn't hold up the others, but a failed layout check
+    would fail every slice, so it ends the run
+    Return True when every slice is done (or has failed maxRetries times)
+    '''
+    def run(self, once=False, fe=sys.stderr):
+        checked = False                     # has a slice passed the layout check yet?
+        while self.pending():
+            now = datetime.now()
+            s = self.pending()[0]
+            needed = len(s["pids"]) * self.costPerPage() * safetyFactor
+            window = currentWindow(self.windows, now)
+            if window is not None:
+                left = (window[1] - now).total_seconds()
+                # A slice too big for any window starts at the top of one anyway
+                if left >= min(needed, (window[1] - window[0]).total_seconds() * 0.9):
+                    result = self.runSlice(s, fe, canary=not checked)
+                    if result is None:
+                        checked = True
+                    elif result.startswith("Layout check failed"):
+                        return False
+                    continue
+            if once:
+                if window is None:
+                    print("Not inside a scraping window", file=fe)
+                return False
+            start = nextWindowStart(self.windows, (window[1] if window else now) + timedelta(seconds=1))
+            if start is None:
+                print("No scraping windows ahead - giving up", file=fe)
+                return False
+            self.report(fe)
+            print("Waiting until %s" % start.isoformat(timespec="minutes"), file=fe)
+            fe.flush()
+            time.sleep(max(1.0, (start - datetime.now()).total_seconds()))
+        return True
+
+    def report(self, fe):
+        needed, available = self.forecast()
+        done = len([s for s in self.state["slices"] if s["status"] == "done"])
+        failed = [s for s in self.state["slices"] if s["status"] == "failed"]
+        print("%d of %d slices done%s; %.1f s/page; %.1f h of scraping left, %.1f h of windows before %s%s" % (
+            done, len(self.state["slices"]), ", %d failed" % len(failed) if failed else "", self.costPerPage(), needed / 3600, available / 3600,
+            self.deadline.isoformat(timespec="minutes"),
+            "" if needed <= available else " - WON'T FINISH IN TIME"), file=fe)
+
+    '''
+    assemble() - join the slices' files into one snapshot in "outdir"
+    Each PID appears once (a PID listed in two slices keeps its first result)
+    The slices that failed for good are left out (and listed)
+    '''
+    def assemble(self, outdir, fe=sys.stderr):
+        if self.pending():
+            return "%d slices aren't done yet" % len(self.pending())
+        for s in self.failed():
+            print("Slice %d failed %d times (%s) - its %d PIDs are missing" % (
+                s["slice"], s["retries"], s.get("error", ""), len(s["pids"])), file=fe)
+        done = [s for s in self.state["slices"] if s["status"] == "done"]
+        os.makedirs(outdir, exist_ok=True)
+        if os.path.exists(os.path.join(outdir, runMarker)):
+            os.remove(os.path.join(outdir, runMarker))
+        for attr, fileName in outputFiles:
+            heading = None
+            seen = set()
+            out = None
+            for s in done:
+                path = os.path.join(self.sliceDir(s), fileName)
+                if not os.path.exists(path):
+                    continue
+                with open(path, "rt") as f:
+                    lines = f.read().splitlines()
+                if not lines:
+                    continue
+                if heading is None:
+                    heading = lines[0]
+                    out = open(os.path.join(outdir, fileName), "wt")
+                    print(heading, file=out)
+                elif lines[0] != heading:
+                    out.close()
+                    return "Slice %d's %s has different columns" % (s["slice"], fileName)
+                slicePIDs = set()
+                for line in lines[1:]:
+                    pid = line.split("\t", 1)[0]
+                    if pid in seen:
+                        continue
+                    slicePIDs.add(pid)
+                    print(line, file=out)
+                seen |= slicePIDs
+            if out:
+                out.close()
+        markRunComplete(outdir, "sweepScheduler")
+        first = min((s.get("started", "") for s in done), default="")
+        last = max((s.get("finished", "") for s in done), default="")
+        print("Assembled %d slices (collected %s .. %s) into %s" % (
+            len(done), first, last, outdir), file=fe)
+
+
+def saveState(directory, state):
+    tmpName = os.path.join(directory, stateFile + ".tmp")
+    with open(tmpName, "wt") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmpName, os.path.join(directory, stateFile))
+
+
+'''
+allPIDs() - the PIDs from a --pids file, or the whole range scrapevgsi.py sweeps
+'''
+def allPIDs(pidFile):
+    ids = scrapevgsi.PIDListFile(pidFile) if pidFile else scrapevgsi.VisionIDFile(None)
+    result = []
+    while True:
+        pid = ids.readNextVisionID()
+        if not pid:
+            return result
+        result.append(pid[0])
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('command', choices=["plan", "run", "status", "assemble"])
+        parser.add_argument("-s", '--sweep', required=True, metavar="DIR", help="Sweep directory")
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        # plan
+        parser.add_argument('--windows', default="22:00-06:00", help="When scraping is allowed")
+        parser.add_argument('--deadline', type=datetime.fromisoformat, metavar="YYYY-MM-DDTHH:MM")
+        parser.add_argument("-p", '--pids', type=argparse.FileType('rt', encoding='utf-8-sig'),
+                            help="PIDs to sweep (default: the whole range scrapevgsi.py uses)")
+        parser.add_argument('--slice', type=int, default=50, metavar="N", help="PIDs per slice")
+        parser.add_argument('--previous', metavar="DIR",
+                            help="Start with the cost per page measured by an earlier sweep")
+        parser.add_argument('--scrape-args', default="", metavar="ARGS",
+                            help="Extra scrapevgsi.py arguments, e.g. \"-x core -u http://localhost:8080/lymeNH/\"")
+        # run
+        parser.add_argument('--once', action="store_true",
+                            help="Scrape during the current window only, then exit (for cron)")
+        # assemble
+        parser.add_argument('--outdir', help="Where to put the assembled snapshot (default: DIR/snapshot)")
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    if theArgs.command == "plan":
+        if theArgs.deadline is None:
+            return "plan needs a --deadline"
+        costs = []
+        if theArgs.previous:
+            costs = Sweep(theArgs.previous).state["costs"]
+        sweep = Sweep.create(theArgs.sweep, allPIDs(theArgs.pids), theArgs.windows,
+                             theArgs.deadline, max(1, theArgs.slice), theArgs.scrape_args.split(), costs)
+        sweep.report(fe)
+        return
+
+    sweep = Sweep(theArgs.sweep)
+    if theArgs.command == "status":
+        sweep.report(fe)
+        return
+    if theArgs.command == "run":
+        finished = sweep.run(theArgs.once, fe)
+        sweep.report(fe)
+        if not finished:
+            return
+    return sweep.assemble(theArgs.outdir or os.path.join(theArgs.sweep, "snapshot"), fe)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
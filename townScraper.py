@@ -0,0 +1,250 @@
+'''
+Town Scraper
+
+Scrape several towns' Vision sites in one job. Each town has a profile
+in a towns file (Towns.json):
+
+    {
+      "lymeNH": {
+        "baseURL": "https://gis.vgsi.com/lymeNH/",
+        "pids": [[1, 1499], [100000, 103400]],
+        "rate": 2.0
+      },
+      "hanoverNH": {
+        "baseURL": "https://gis.vgsi.com/hanoverNH/",
+        "pids": "PIDs/hanoverNH.csv",
+        "rate": 1.0,
+        "outdir": "Hanover"
+      }
+    }
+
+- baseURL - the town's Vision site
+- pids - how to find the town's PIDs: a list of [first, last] ranges,
+  or a file of PIDs (as for scrapevgsi.py --pids). Required: every town
+  numbers its parcels differently
+- rate - the most requests per second to send that town (default 2, the
+  0.5 second pause scrapevgsi.py uses)
+- outdir - where the town's .tsv files go (default: OUTROOT/TOWN)
+
+The towns are scraped at the same time, one thread each, so a slow or
+struggling site doesn't hold up the others. Every request waits for
+both its town's budget and the global budget (--rate, requests per second
+across all towns), so adding towns never means hitting any one site
+(or our own connection) harder.
+
+Usage:
+    python townScraper.py list [-t Towns.json]
+    python townScraper.py scrape [-t Towns.json] [--towns lymeNH,hanoverNH] [--rate 4] [-x core]
+'''
+
+import sys
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import scrapevgsi
+from vgsiRecords import TsvSink
+
+defaultRate = 2.0               # requests per second: scrapevgsi.py's 0.5 second pause
+
+
+'''
+RateLimit - at most "rate" calls per second, shared by any number of threads
+wait() blocks until the caller's turn. Turns are handed out in order,
+spaced 1/rate seconds apart; a turn that's already past isn't saved up,
+so an idle site doesn't earn a burst later.
+'''
+
+
+class RateLimit:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.nextTurn = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            turn = max(now, self.nextTurn)
+            self.nextTurn = turn + self.interval
+        if turn > now:
+            time.sleep(turn - now)
+
+
+'''
+PIDRanges - the same interface as VisionIDFile, for a town's [first, last] ranges
+'''
+
+
+class PIDRanges:
+    def __init__(self, ranges):
+        self.ranges = [[int(first), int(last)] for first, last in ranges]
+        self.range = 0
+        self.nextPID = self.ranges[0][0] if self.ranges else 0
+
+    def readNextVisionID(self):
+        while self.range < len(self.ranges) and self.nextPID > self.ranges[self.range][1]:
+            self.range += 1
+            if self.range < len(self.ranges):
+                self.nextPID = self.ranges[self.range][0]
+        if self.range >= len(self.ranges):
+            return []
+        self.nextPID += 1
+        return [str(self.nextPID - 1)]
+
+
+'''
+readTowns() - {town: profile} from the towns file, with the defaults filled in
+Raises ValueError for a town without a baseURL or pids
+'''
+def readTowns(fileName, outroot="Towns"):
+    with open(fileName, "rt") as f:
+        towns = json.load(f)
+    for name, town in towns.items():
+        if "baseURL" not in town:
+            raise ValueError("Town %s has no baseURL" % name)
+        if not town["baseURL"].endswith("/"):
+            town["baseURL"] += "/"
+        if "pids" not in town:
+            raise ValueError("Town %s has no pids (a list of [first, last] ranges, or a file of PIDs)" % name)
+        town.setdefault("rate", defaultRate)
+        town.setdefault("outdir", os.path.join(outroot, name))
+    return towns
+
+
+'''
+townPIDs() - a reader for the town's PIDs (ranges, or a file of PIDs)
+'''
+def townPIDs(town):
+    if isinstance(town["pids"], str):
+        with open(town["pids"], "rt", encoding="utf-8-sig") as f:
+            return scrapevgsi.PIDListFile(f)
+    return PIDRanges(town["pids"])
+
+
+'''
+scrapeTown() - scrape one town into its outdir; runs in the town's thread
+Progress and errors go to "fe", each line tagged with the town's name
+'''
+def scrapeTown(name, town, globalLimit, profile, fe, counts):
+    townLimit = RateLimit(town["rate"])
+
+    def throttle():
+        townLimit.wait()
+        globalLimit.wait()
+
+    os.makedirs(town["outdir"], exist_ok=True)
+    sink = TsvSink(scrapevgsi.outputHeadings(profile), town["outdir"])
+    pages = scrapevgsi.livePages(townPIDs(town), TaggedLines(name, fe),
+                                 town["baseURL"], throttle, quiet=True)
+
+    def counted(results):
+        for thePID, parsed in results:
+            counts[name][0] += 1
+            if parsed == "problem":
+                counts[name][1] += 1
+            yield thePID, parsed
+
+    try:
+        scrapevgsi.writeResults(counted(scrapevgsi.processPages(pages, profile)), [sink], fo=None)
+    except BaseException:
+        sink.close(complete=False)          # no end-of-run marker for a broken run
+        raise
+    sink.close()
+
+
+'''
+TaggedLines - a file-like object that starts each line with "[town] "
+'''
+
+
+class TaggedLines:
+    lock = threading.Lock()
+
+    def __init__(self, name, f):
+        self.name = name
+        self.f = f
+
+    def write(self, text):
+        if text.strip():
+            with self.lock:
+                print("[%s] %s" % (self.name, text.strip()), file=self.f, flush=True)
+
+    def flush(self):
+        pass
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-t", '--towns-file', default="Towns.json", help="Town profiles")
+        parser.add_argument('--towns', help="Comma-separated towns to scrape (default: all of them)")
+        parser.add_argument('--rate', type=float, default=4.0,
+                            help="Global budget: requests per second across all towns")
+        parser.add_argument('--outroot', default="Towns",
+                            help="Each town's output goes in OUTROOT/TOWN unless it has an outdir")
+        parser.add_argument("-x", '--extract', choices=sorted(scrapevgsi.extractionProfiles.keys()),
+                            default="full", help="Which parts of each page to extract")
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('command', choices=["list", "scrape"])
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    try:
+        towns = readTowns(theArgs.towns_file, theArgs.outroot)
+    except (OSError, ValueError) as e:
+        return "Can't read %s: %s" % (theArgs.towns_file, e)
+    if theArgs.towns:
+        wanted = [t.strip() for t in theArgs.towns.split(",") if t.strip()]
+        unknown = [t for t in wanted if t not in towns]
+        if unknown:
+            return "Unknown town(s): %s" % ", ".join(unknown)
+        towns = {t: towns[t] for t in wanted}
+
+    if theArgs.command == "list":
+        for name, town in towns.items():
+            pids = town["pids"] if isinstance(town["pids"], str) else \
+                ", ".join("%s-%s" % (first, last) for first, last in town["pids"])
+            print("%s\t%s\t%s/s\t%s\t%s" % (name, town["baseURL"], town["rate"], pids, town["outdir"]))
+        return
+
+    globalLimit = RateLimit(theArgs.rate)
+    counts = {name: [0, 0] for name in towns}
+    errors = {}
+
+    def run(name, town):
+        try:
+            scrapeTown(name, town, globalLimit, theArgs.extract, fe, counts)
+        except Exception as e:
+            errors[name] = e
+            TaggedLines(name, fe).write("Stopped: %s" % e)
+
+    start = datetime.now()
+    threads = [threading.Thread(target=run, args=[name, town], name=name, daemon=True)
+               for name, town in towns.items()]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        next(thread for thread in threads if thread.is_alive()).join(timeout=60)
+        print("%s: %s" % (datetime.now().strftime("%H:%M:%S"),
+                          ", ".join("%s %d pages (%d problems)" % (name, done, problems)
+                                    for name, (done, problems) in counts.items())), file=fe)
+    print("Done in %s" % str(datetime.now() - start).split(".")[0], file=fe)
+    if errors:
+        return "Failed: %s" % ", ".join(sorted(errors))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
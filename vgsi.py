@@ -0,0 +1,75 @@
+'''
+VGSI - one command for all the scrapers and tools
+
+    python vgsi.py COMMAND [options]
+    python vgsi.py COMMAND --help
+
+Each command runs the main() of one of the scripts with the rest of
+the command line, so "python vgsi.py scrape --pids pids.txt" is the same as
+"python scrapevgsi.py --pids pids.txt", and "python vgsi.py replay Archive"
+is "python scrapevgsi.py -r Archive".
+
+Nothing is imported until a command is chosen, and the scripts themselves
+import requests, bs4, playsound3, numpy and pandas only where they're used,
+so listing the commands or asking for --help takes a few tens of milliseconds
+(handy from cron, Make, or a shell loop), and offline work (replay, store,
+snapshots) doesn't need the network or audio libraries installed at all.
+'''
+
+import sys
+import importlib
+
+# [command, module, arguments put in front of the command line, description]
+commands = [
+    ["scrape",    "scrapevgsi",     [],     "Scrape parcel pages from Vision into the .tsv files"],
+    ["replay",    "scrapevgsi",     ["-r"], "Parse saved pages (PATH) instead of Vision"],
+    ["ava",       "scrapeAVA",      [],     "Turn a saved AVA (Registry of Deeds) search into AVA_Records_*.tsv"],
+    ["towns",     "townScraper",    [],     "Scrape several towns at once, within per-town and global rate budgets"],
+    ["pids",      "lookupPIDs",     [],     "Look up PIDs by address"],
+    ["deeds",     "deedPriority",   [],     "List the PIDs touched by recent deeds, for scrape --pids"],
+    ["sweep",     "sweepScheduler", [],     "Spread a full scrape across off-peak windows"],
+    ["archive",   "pageArchive",    [],     "List, get or import raw pages in a page archive"],
+    ["equity",    "equityAnalysis", [],     "Assessed $/sqft and land $/acre outliers among comparable parcels"],
+    ["buildout",  "buildoutData",   [],     "Turn the Lyme buildout text into a table keyed by Map/Lot (and PID)"],
+    ["canary",    "layoutCanary",   [],     "Check sample Vision (or AVA) pages still have the layout the scrapers expect"],
+    ["photos",    "photoMirror",    [],     "Check a run's Photos.tsv against the photo mirror"],
+    ["sections",  "sectionCache",   [],     "Show what the --section-cache of unchanged page sections holds"],
+    ["store",     "parcelStore",    [],     "Change-only history of the Output/ runs"],
+    ["serve",     "parcelServer",   [],     "Answer parcel questions (PID, map/lot, address, owner, book/page) over HTTP"],
+    ["names",     "nameIndex",      [],     "Fuzzy and prefix search of owner and party names in every run"],
+    ["entities",  "ownerEntities",  [],     "Group owner name spellings into entities; list multi-parcel owners"],
+    ["xlsx",      "xlsxExport",     [],     "Write scrape output (and older snapshots) into an .xlsx workbook"],
+    ["snapshots", "snapshotLoader", [],     "Load the historical snapshots in the current columns"],
+    ["ratio",     "salesRatio",     [],     "Sales-ratio study (median ratio, COD, PRD, PRB)"],
+    ["mock",      "mockVGSI",       [],     "Run a local mock Vision server"],
+]
+
+
+def usage(fe=sys.stderr):
+    print(__doc__.strip(), file=fe)
+    print("\nCommands:", file=fe)
+    for name, module, prefix, description in commands:
+        print("    %-10s %s (%s.py)" % (name, description, module), file=fe)
+
+
+'''
+Main Function
+
+Find the command, import its module, and hand it the rest of the arguments
+'''
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ["-h", "--help", "help"]:
+        usage(sys.stdout if argv else sys.stderr)
+        return None if argv else "No command given"
+    for name, module, prefix, description in commands:
+        if argv[0] == name:
+            return importlib.import_module(module).main(prefix + argv[1:])
+    usage()
+    return "Unknown command: %s" % argv[0]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
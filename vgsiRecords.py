@@ -0,0 +1,413 @@
+'''
+VGSI Records
+
+Compact, typed records for the data parsed from a Vision parcel page.
+The handlers in scrapevgsi.py fill these in; nothing is turned back
+into text until a "sink" writes it out (TSV files, SQLite, ...).
+
+Each record class uses __slots__ (no per-instance dictionary) and lists
+its columns in "fields" with a matching converter for each one:
+- money, years, counts become int
+- decimal sizes (e.g. "720.00") become Decimal
+- yyyy-mm-dd dates become datetime.date
+- everything else stays a str, interned so the thousands of repeated
+  "S.F.", "UNITS", "Residential", ... share a single copy
+
+Conversions are loss-free: a value is only converted when converting
+it back gives exactly the original text (so "0498", "-0" and "1.0E-7"
+stay strings). A row with more or fewer cells than its record has fields
+(a page laid out differently) keeps exactly the cells it had.
+That keeps the TSV files byte-for-byte the same as they have always been.
+'''
+
+import os
+import re
+import sys
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+intPattern = re.compile(r"(0|-?[1-9]\d*)$")
+decimalPattern = re.compile(r"-?\d+\.\d+$")
+datePattern = re.compile(r"(\d{4})-(\d{2})-(\d{2})$")
+
+'''
+Converters - each takes the "plain value" string from the page
+and returns the typed value (or the interned string if it won't convert)
+'''
+
+
+def toStr(val):
+    if not isinstance(val, str):        # None, or already typed
+        return val
+    return sys.intern(val)
+
+
+def toInt(val):
+    if isinstance(val, str) and intPattern.match(val):
+        return int(val)
+    return toStr(val)
+
+
+def toNumber(val):
+    if isinstance(val, str):
+        if intPattern.match(val):
+            return int(val)
+        if decimalPattern.match(val) and str(Decimal(val)) == val:
+            return Decimal(val)
+    return toStr(val)
+
+
+def toDate(val):
+    if isinstance(val, str):
+        m = datePattern.match(val)
+        if m:
+            try:
+                return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+            except ValueError:
+                pass
+    return toStr(val)
+
+
+'''
+formatValue() - the one place a typed value is turned back into TSV text
+'''
+def formatValue(val):
+    if val is None:
+        return ""
+    if isinstance(val, str):
+        return val
+    if isinstance(val, datetime):
+        return val.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(val, date):
+        return val.isoformat()
+    return str(val)
+
+
+'''
+Record - base class for all the per-row records
+
+Subclasses set:
+- __slots__ / fields - the attribute names, in output order
+- converters - one converter per field
+- heading - the TSV heading line for the file
+
+A record made by fromCells() also remembers how many cells the row had:
+"extra" holds any cells past the last field, and "width" how many of the
+fields the row filled, so values() and tsvRow() give back the row as it was.
+'''
+
+
+class Record:
+    __slots__ = ("extra", "width")
+    fields = ()
+    converters = ()
+    heading = ""
+
+    def __init__(self, *values):
+        for name, value in zip(self.fields, values):
+            setattr(self, name, value)
+        for name in self.fields[len(values):]:
+            setattr(self, name, None)
+        self.extra = ()
+        self.width = len(self.fields)
+
+    '''
+    fromCells() - build a record from the list of strings a handler collected,
+    converting each one to its proper type (cells past the last field are kept as they are)
+    '''
+    @classmethod
+    def fromCells(cls, cells):
+        rec = cls(*[conv(cell) for conv, cell in zip(cls.converters, cells)])
+        rec.extra = tuple(cells[len(cls.fields):])
+        rec.width = min(len(cells), len(cls.fields))
+        return rec
+
+    def values(self):
+        return [getattr(self, name) for name in self.fields[:self.width]] + list(self.extra)
+
+    def tsvRow(self):
+        return "\t".join([formatValue(v) for v in self.values()])
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__,
+                           ", ".join("%s=%r" % (n, getattr(self, n)) for n in self.fields))
+
+
+class OwnerSale(Record):
+    __slots__ = fields = ("pid", "owner", "salePrice", "certificate", "bookAndPage",
+                          "book", "page", "instrument", "saleDate", "collectedOn")
+    converters = (toInt, toStr, toInt, toStr, toStr,
+                  toStr, toStr, toStr, toDate, toDate)
+    heading = "PID\tOwner\tSale Price\tCertificate\tBook&Page\tBook\tPage\tInstrument\tSale Date\tCollectedOn"
+
+
+class Valuation(Record):
+    __slots__ = fields = ("pid", "year", "improvements", "land", "total", "collectedOn")
+    converters = (toInt, toInt, toInt, toInt, toInt, toDate)
+    heading = "PID\tYear\tImprovements\tLand\tTotal\tCollectedOn"
+
+
+class Appraisal(Valuation):
+    __slots__ = ()
+    heading = "PID\tApp. Year\tImprovements\tLand\tTotal\tCollectedOn"
+
+
+class Assessment(Valuation):
+    __slots__ = ()
+    heading = "PID\tAss. Year\tImprovements\tLand\tTotal\tCollectedOn"
+
+
+class Building(Record):
+    __slots__ = fields = ("pid", "buildingNumber", "yearBuilt", "livingArea", "replacementCost",
+                          "percentGood", "valueAfterDepreciation", "style", "model", "grade",
+                          "stories", "totalBedrooms", "totalBthrms", "totalHalfBaths",
+                          "totalRooms", "numKitchens", "grossFloorArea", "subLivingArea",
+                          "collectedOn")
+    converters = (toInt, toInt, toInt, toInt, toInt,
+                  toInt, toInt, toStr, toStr, toStr,
+                  toNumber, toNumber, toNumber, toNumber,
+                  toNumber, toStr, toInt, toInt,
+                  toDate)
+    heading = ""        # built from buildingIDs/buildingAttrs by printBuildingHeader()
+
+
+class Outbuilding(Record):
+    __slots__ = fields = ("pid", "code", "description", "subCode", "subDescr",
+                          "size", "units", "value", "bldgNumber", "collectedOn")
+    converters = (toInt, toStr, toStr, toStr, toStr,
+                  toNumber, toStr, toInt, toInt, toDate)
+    heading = "PID\tCode\tDescription\tSubCode\tSubDescr\tSize\tUnits\tValue\tBldg#\tCollectedOn"
+
+
+class ExtraFeature(Record):
+    __slots__ = fields = ("pid", "code", "description", "size", "units",
+                          "value", "bldgNumber", "collectedOn")
+    converters = (toInt, toStr, toStr, toNumber, toStr,
+                  toInt, toInt, toDate)
+    heading = "PID\tCode\tDescription\tSize\tUnits\tValue\tBldg#\tCollectedOn"
+
+
+class SpecialLand(Record):
+    __slots__ = fields = ("pid", "code", "description", "units", "unitType", "collectedOn")
+    converters = (toInt, toStr, toStr, toNumber, toStr, toDate)
+    heading = "PID\tCode\tDescription\tUnits\tUnitType\tCollectedOn"
+
+
+'''
+ParcelRecord - the one-line-per-parcel summary (ScrapeDataXX.tsv)
+
+Its columns depend on the domIDs list in scrapevgsi.py, so instead of
+fixed slots it holds a list of values that lines up with a shared
+ParcelSchema (the column names plus a converter for each).
+'''
+
+
+class ParcelSchema:
+    __slots__ = ("columns", "converters", "index")
+
+    # Columns whose values are typed; all others are kept as strings
+    typedColumns = {
+        "PID": toInt,
+        "Assessment": toInt,
+        "Appraisal": toInt,
+        "Lot Size (acres)": toNumber,
+        "LandAsmt": toInt,
+        "LandAppr": toInt,
+        "# Buildings": toInt,
+        "Recent Sale Price": toInt,
+        "Recent Sale Date": toDate,
+        "Prev Sale Price": toInt,
+        "Prev Sale Date": toDate,
+        "Record#": toInt,
+    }
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.converters = tuple(self.converterFor(c) for c in self.columns)
+        self.index = {c: i for i, c in enumerate(self.columns)}
+
+    def converterFor(self, column):
+        if column in self.typedColumns:
+            return self.typedColumns[column]
+        if column.startswith("Curr. ") or column.startswith("Prev. "):
+            return toInt                # valuation history columns
+        return toStr
+
+
+class ParcelRecord:
+    __slots__ = ("schema", "vals")
+
+    def __init__(self, schema, cells):
+        self.schema = schema
+        self.vals = [conv(cell) for conv, cell in zip(schema.converters, cells)]
+        self.vals.extend(cells[len(schema.converters):])
+
+    def __getitem__(self, column):
+        return self.vals[self.schema.index[column]]
+
+    def values(self):
+        return self.vals
+
+    def tsvRow(self):
+        return "\t".join([formatValue(v) for v in self.vals])
+
+
+'''
+ParsedPage - everything pulled from one parcel page
+'''
+
+
+class ParsedPage:
+    __slots__ = ("pid", "parcel", "owners", "appraisals", "assessments",
+                 "buildings", "outbuildings", "specialLand", "extraFeatures", "sections")
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.parcel = None
+        self.owners = []
+        self.appraisals = []
+        self.assessments = []
+        self.buildings = []
+        self.outbuildings = []
+        self.specialLand = []
+        self.extraFeatures = []
+        self.sections = None        # {section ID: [fingerprint, results]}, with --section-cache
+
+
+'''
+TsvSink - write ParsedPages into the traditional set of .tsv files
+(The Problem loading/Suppressed lines are written here too so that
+all the file handling lives in one place.)
+
+outputFiles lists: [ParsedPage attribute, file name]
+'''
+
+outputFiles = [
+    ["parcel",        "ScrapeDataXX.tsv"],  # ScrapeDataXX
+    ["owners",        "OwnerHistory.tsv"],  # Ownership History
+    ["appraisals",    "ApprlHistory.tsv"],  # Appraisal History
+    ["assessments",   "AssmtHistory.tsv"],  # Assessment History
+    ["buildings",     "Buildings___.tsv"],  # Buildings
+    ["outbuildings",  "Outbuildings.tsv"],  # Outbuildings
+    ["extraFeatures", "ExtraFeature.tsv"],  # Extra features
+    ["specialLand",   "SpecialLand_.tsv"],  # Special Land
+    ["suppressed",    "Suppressed__.tsv"],  # Information Suppressed
+]
+# Written once a run's files are complete (and removed when a new run starts),
+# so readers like parcelServer.py never load a half-written run
+runMarker = "RunComplete.txt"
+
+
+'''
+markRunComplete() - write the end-of-run marker (the time it was finished) into a directory
+'''
+def markRunComplete(directory, source=""):
+    tmpName = os.path.join(directory, runMarker + ".tmp")
+    with open(tmpName, "wt") as f:
+        print("%s\t%s" % (datetime.now().isoformat(timespec="seconds"), source), file=f)
+    os.replace(tmpName, os.path.join(directory, runMarker))
+
+
+class TsvSink:
+    def __init__(self, headings, directory="."):
+        self.directory = directory
+        if os.path.exists(os.path.join(directory, runMarker)):
+            os.remove(os.path.join(directory, runMarker))     # this run isn't complete yet
+        self.files = {}
+        for attr, fileName in outputFiles:
+            if attr not in headings:
+                continue
+            f = open("%s/%s" % (directory, fileName), "wt")
+            print(headings[attr], file=f)
+            self.files[attr] = f
+
+    def write(self, parsed):
+        for attr, f in self.files.items():
+            if attr == "suppressed":
+                continue
+            data = getattr(parsed, attr)
+            if attr == "parcel":
+                print(data.tsvRow(), file=f)
+                continue
+            for rec in data:
+                print(rec.tsvRow(), file=f)
+
+    def writeProblem(self, pid):
+        if "parcel" in self.files:
+            print("%s\tProblem loading parcel PID\t" % pid, file=self.files["parcel"])
+
+    def writeSuppressed(self, pid):
+        if "suppressed" in self.files:
+            print("%s\tInformation suppressed due to the request of the taxpayer" % pid,
+                  file=self.files["suppressed"])
+
+    def close(self, complete=True):
+        for f in self.files.values():
+            f.close()
+        if complete:
+            markRunComplete(self.directory, "scrapevgsi")
+
+
+'''
+SqliteSink - write ParsedPages into an SQLite database, one table per
+output file, keeping ints as INTEGER and dates as ISO text.
+Column names are the TSV headings.
+'''
+
+
+class SqliteSink:
+    def __init__(self, headings, fileName):
+        self.db = sqlite3.connect(fileName)
+        self.tables = {}
+        for attr, tsvName in outputFiles:
+            if attr not in headings or attr == "suppressed":
+                continue
+            table = tsvName.replace(".tsv", "").strip("_")
+            cols = uniqueColumns(headings[attr].split("\t"))
+            self.db.execute('DROP TABLE IF EXISTS "%s"' % table)
+            self.db.execute('CREATE TABLE "%s" (%s)' % (table, ", ".join('"%s"' % c for c in cols)))
+            insert = 'INSERT INTO "%s" VALUES (%s)' % (table, ", ".join("?" * len(cols)))
+            self.tables[attr] = [insert, len(cols)]
+        if "suppressed" in headings:
+            self.db.execute('DROP TABLE IF EXISTS "Suppressed"')
+            self.db.execute('CREATE TABLE "Suppressed" ("PID")')
+
+    def row(self, values, width):
+        vals = [sqlValue(v) for v in values[:width]]
+        vals.extend([None] * (width - len(vals)))
+        return vals
+
+    def write(self, parsed):
+        for attr, [insert, width] in self.tables.items():
+            data = getattr(parsed, attr)
+            if attr == "parcel":
+                data = [data]
+            self.db.executemany(insert, [self.row(rec.values(), width) for rec in data])
+
+    def writeProblem(self, pid):
+        pass
+
+    def writeSuppressed(self, pid):
+        self.db.execute('INSERT INTO "Suppressed" VALUES (?)', (pid,))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def uniqueColumns(cols):
+    seen = {}
+    result = []
+    for c in cols:              # e.g. Buildings has two "Living Area" columns
+        seen[c] = seen.get(c, 0) + 1
+        result.append(c if seen[c] == 1 else "%s_%d" % (c, seen[c]))
+    return result
+
+
+def sqlValue(val):
+    if val is None or isinstance(val, (int, str)):
+        return val
+    if isinstance(val, Decimal):
+        return float(val)
+    return formatValue(val)
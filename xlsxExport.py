@@ -0,0 +1,470 @@
+'''
+XLSX Export
+
+Write scrape results straight into an .xlsx workbook, instead of pasting
+ScrapeDataXX.tsv into a new tab of ScrapedData.xlsx, appending it to
+"All-Scraped-Data" and fixing the date and dollar formats by hand.
+
+The workbook has
+- a tab for each output stream (ScrapeDataXX, OwnerHistory, ApprlHistory, ...,
+  or an AVA_Records_*.tsv), named after its file
+- an "All-Scraped-Data" tab: the rows of the older snapshots given
+  with --master (mapped onto the current columns, as snapshotLoader.py does),
+  then the rows of this run's ScrapeDataXX, each with its RunDate and Source
+
+Cells are typed: PIDs, counts and sizes are numbers, dates and CollectedOn
+are Excel dates (yyyy-mm-dd), and money columns (prices, assessments,
+appraisals, values, Curr./Prev. columns, Consideration) are numbers
+formatted $#,##0. "Problem loading parcel" lines are left out.
+
+The .xlsx is written by hand (it's a zip of XML files), so nothing
+beyond the standard library is needed. Each tab's rows go to a temporary
+file as they arrive, and are copied into the zip at the end, so memory
+stays flat however many runs the master tab holds. The master tab isn't
+edited in place: it is rebuilt from the snapshot .tsv files (which stay
+the record) every time, so "appending" a run is adding its file to --master.
+
+scrapevgsi.py --xlsx FILE writes the workbook during the scrape (XlsxSink);
+scrapeAVA.py --xlsx FILE converts its AVA_Records_*.tsv when it's done.
+
+Usage:
+    python xlsxExport.py -o ScrapedData.xlsx ScrapedData-Oct2024/ --master Output/*.tsv
+    python xlsxExport.py -o AVA.xlsx AVA-GCRoD/AVA_Records_2024-*.tsv
+    python scrapevgsi.py --pids pids.txt --xlsx ScrapedData.xlsx --xlsx-master Output/*.tsv
+'''
+
+import sys
+import argparse
+import csv
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from parcelStore import runDate, fillerPattern, parseDate
+from vgsiRecords import outputFiles, toStr, toInt, toNumber, toDate, ParcelSchema, \
+    OwnerSale, Appraisal, Assessment, Building, Outbuilding, ExtraFeature, SpecialLand
+
+masterTab = "All-Scraped-Data"
+masterExtras = ["RunDate", "Source"]
+moneyPattern = re.compile(r"Price|Assessment|Appraisal|^(Improvements|Land|Total|Value|Consideration|Transfer Tax)$"
+                          r"|^Land(Asmt|Appr)$|^(Curr|Prev)\. A|Replacement Cost|Value after")
+dateColumnPattern = re.compile(r"Date|CollectedOn")
+numberCleanup = re.compile(r"[$,\s\"]")
+badXml = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+badTabName = re.compile(r"[\[\]:*?/\\]")
+epoch = date(1899, 12, 30)              # Excel's day 0 (allowing for its 1900 leap year)
+
+# The record class whose converters type each stream's columns
+streamRecords = {
+    "owners": OwnerSale,
+    "appraisals": Appraisal,
+    "assessments": Assessment,
+    "buildings": Building,
+    "outbuildings": Outbuilding,
+    "extraFeatures": ExtraFeature,
+    "specialLand": SpecialLand,
+}
+streamFiles = {fileName: attr for attr, fileName in outputFiles}
+
+# Cell styles (the cellXfs of styles.xml)
+headingStyle = 1
+dateStyle = 2
+dateTimeStyle = 3
+moneyStyle = 4
+
+stylesXml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="3"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/><numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm:ss"/><numFmt numFmtId="166" formatCode="$#,##0"/></numFmts>
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="5"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/><xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/><xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/><xf numFmtId="166" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>
+</styleSheet>
+'''
+sheetStart = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+              '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/>'
+              '</sheetView></sheetViews><sheetData>')
+sheetEnd = '</sheetData></worksheet>'
+
+
+'''
+Converters - like those of vgsiRecords.py, but for text that has been
+through a person or a spreadsheet: "$284,100", "5,135", "06/29/2018", "6/29/18"
+'''
+
+
+def toDateTime(val):
+    if not isinstance(val, str):
+        return val
+    text = val.strip()
+    for format in ["%Y-%m-%d %H:%M:%S", "%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %H:%M:%S"]:
+        try:
+            return datetime.strptime(text, format)
+        except ValueError:
+            pass
+    day = parseDate(text)               # "2018-06-29", "06/29/2018", "6/29/18"
+    return day if day is not None else toDate(text)
+
+
+def toMoney(val):
+    return toNumber(numberCleanup.sub("", val)) if isinstance(val, str) else val
+
+
+'''
+columnConverter() - the converter for a column, from its record's converter (if known) or its name
+'''
+def columnConverter(column, known=None):
+    if known is toDate or (known in [None, toStr] and dateColumnPattern.search(column)):
+        return toDateTime
+    if known not in [None, toStr]:
+        return known
+    if moneyPattern.search(column):
+        return toMoney
+    if column in ["PID", "ID", "Record#"]:
+        return toInt
+    return toStr
+
+
+'''
+streamConverters() - a converter for each column of an output stream
+attr is its ParsedPage attribute (None for other files, e.g. AVA_Records_*.tsv)
+'''
+def streamConverters(attr, columns):
+    if attr == "parcel":
+        known = list(ParcelSchema(columns).converters)
+    elif attr in streamRecords:
+        known = list(streamRecords[attr].converters)
+    else:
+        known = []
+    known.extend([None] * (len(columns) - len(known)))
+    return [columnConverter(c, k) for c, k in zip(columns, known)]
+
+
+def typedValue(val, conv):
+    if not isinstance(val, str):
+        return val
+    typed = conv(val)
+    if isinstance(typed, str) and conv is not toStr and conv is not toDateTime and typed.strip():
+        cleaned = conv(numberCleanup.sub("", val))
+        if not isinstance(cleaned, str):
+            return cleaned
+    return typed
+
+
+def columnName(n):
+    name = ""
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        name = chr(65 + r) + name
+    return name
+
+
+def textCell(ref, text, style=0):
+    text = escape(badXml.sub("", text))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    s = ' s="%d"' % style if style else ""
+    return '<c r="%s"%s t="inlineStr"><is><t%s>%s</t></is></c>' % (ref, s, space, text)
+
+
+'''
+Sheet - one tab, streamed to a temporary file a row at a time
+Values may be typed (from the parser's records) or text (from a .tsv);
+text is typed with the column's converter.
+'''
+
+
+class Sheet:
+    def __init__(self, name, columns, converters):
+        self.name = name
+        self.columns = columns
+        self.converters = converters
+        self.money = [bool(moneyPattern.search(c)) for c in columns]
+        self.refs = [columnName(i) for i in range(len(columns))]
+        self.file = tempfile.TemporaryFile()
+        self.rows = 0
+        self.writeCells([textCell("%s1" % ref, c, headingStyle) for ref, c in zip(self.refs, columns)])
+
+    def writeCells(self, cells):
+        self.rows += 1
+        self.file.write(('<row r="%d">%s</row>' % (self.rows, "".join(cells))).encode("utf-8"))
+
+    def write(self, values):
+        while len(self.refs) < len(values):
+            self.refs.append(columnName(len(self.refs)))
+        row = self.rows + 1
+        cells = []
+        for i, val in enumerate(values):
+            if i < len(self.converters):
+                val = typedValue(val, self.converters[i])
+            if val is None or val == "":
+                continue
+            ref = "%s%d" % (self.refs[i], row)
+            if isinstance(val, str):
+                cells.append(textCell(ref, val))
+            elif isinstance(val, datetime):
+                serial = (val - datetime(1899, 12, 30)).total_seconds() / 86400
+                cells.append('<c r="%s" s="%d"><v>%r</v></c>' % (ref, dateTimeStyle, serial))
+            elif isinstance(val, date):
+                cells.append('<c r="%s" s="%d"><v>%d</v></c>' % (ref, dateStyle, (val - epoch).days))
+            elif i < len(self.money) and self.money[i]:
+                cells.append('<c r="%s" s="%d"><v>%s</v></c>' % (ref, moneyStyle, val))
+            else:
+                cells.append('<c r="%s"><v>%s</v></c>' % (ref, val))
+        self.writeCells(cells)
+
+    def copyTo(self, f):
+        f.write(sheetStart.encode("utf-8"))
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, f, 1 << 20)
+        f.write(sheetEnd.encode("utf-8"))
+        self.file.close()
+
+
+'''
+XlsxWriter - a write-only workbook
+sheet() adds a tab; close() writes the .xlsx (via FILE.new, so a
+failed run leaves the previous workbook alone)
+'''
+
+
+class XlsxWriter:
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.sheets = []
+
+    def sheet(self, name, columns, converters=None):
+        name = badTabName.sub("-", name).strip("'")[:31] or "Sheet"
+        taken = set(s.name.lower() for s in self.sheets)
+        base, n = name, 1
+        while name.lower() in taken:
+            n += 1
+            name = "%s (%d)" % (base[:31 - len(" (%d)" % n)], n)
+        if converters is None:
+            converters = [columnConverter(c) for c in columns]
+        sheet = Sheet(name, columns, converters)
+        self.sheets.append(sheet)
+        return sheet
+
+    def close(self):
+        tabs = list(enumerate(self.sheets, 1))
+        with zipfile.ZipFile(self.fileName + ".new", "w", zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+            z.writestr("[Content_Types].xml",
+                       '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                       '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                       '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                       '<Default Extension="xml" ContentType="application/xml"/>'
+                       '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                       '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                       + "".join('<Override PartName="/xl/worksheets/sheet%d.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' % n
+                                 for n, sheet in tabs)
+                       + '</Types>')
+            z.writestr("_rels/.rels",
+                       '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                       '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                       '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+                       '</Relationships>')
+            z.writestr("xl/workbook.xml",
+                       '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                       '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                       'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+                       + "".join('<sheet name="%s" sheetId="%d" r:id="rId%d"/>' % (escape(sheet.name, {'"': "&quot;"}), n, n)
+                                 for n, sheet in tabs)
+                       + '</sheets></workbook>')
+            z.writestr("xl/_rels/workbook.xml.rels",
+                       '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                       '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                       + "".join('<Relationship Id="rId%d" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet%d.xml"/>' % (n, n)
+                                 for n, sheet in tabs)
+                       + '<Relationship Id="rId%d" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>' % (len(tabs) + 1)
+                       + '</Relationships>')
+            z.writestr("xl/styles.xml", stylesXml)
+            for n, sheet in tabs:
+                with z.open("xl/worksheets/sheet%d.xml" % n, "w", force_zip64=True) as f:
+                    sheet.copyTo(f)
+        os.replace(self.fileName + ".new", self.fileName)
+
+
+def tabName(fileName):
+    return os.path.splitext(os.path.basename(fileName))[0].strip("_")
+
+
+def readRows(fileName):
+    with open(fileName, "rt", encoding="utf-8-sig", errors="replace", newline="") as f:
+        reader = csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        heading = [c.strip() for c in next(reader, [])]
+        for row in reader:
+            if row:
+                yield heading, row
+
+
+'''
+snapshotRows() - the rows of an older snapshot (.tsv or .csv) in the given columns,
+without the filler lines (as snapshotLoader.parseSnapshot() maps them)
+'''
+def snapshotRows(fileName, columns):
+    from parcelStore import readText, mapHeading, derivedColumns
+    heading, rows = readText(fileName)
+    mapping, unmapped = mapHeading(heading, columns)
+    derived = [[targets, heading.index(source), split] for targets, source, split in derivedColumns
+               if source in heading and not all(t in mapping.values() for t in targets)]
+    positions = {c: i for i, c in enumerate(columns)}
+    for row in rows:
+        if not row[0].strip().lstrip("﻿").isdigit() or any(fillerPattern.search(c) for c in row[1:3]):
+            continue
+        values = [""] * len(columns)
+        for targets, i, split in derived:
+            for target, part in zip(targets, split(row[i] if i < len(row) else "")):
+                if target in positions:
+                    values[positions[target]] = part
+        for i, target in mapping.items():
+            if i < len(row):
+                values[positions[target]] = row[i].strip().strip('"')
+        values[0] = values[0].lstrip("﻿")
+        yield values
+
+
+'''
+XlsxSink - a sink for scrapevgsi.py (like TsvSink and SqliteSink): a tab
+per output file, and the master tab (the --xlsx-master snapshots first,
+then this run's parcels)
+'''
+
+
+class XlsxSink:
+    def __init__(self, headings, fileName, master=(), source="", fe=sys.stderr):
+        self.workbook = XlsxWriter(fileName)
+        self.sheets = {}
+        self.master = None
+        if "parcel" in headings:
+            self.master = masterSheet(self.workbook, headings["parcel"].split("\t"), master, fe)
+        for attr, tsvName in outputFiles:
+            if attr in headings:
+                columns = headings[attr].split("\t")
+                if attr == "suppressed":
+                    columns = columns + ["Message"]
+                self.sheets[attr] = self.workbook.sheet(tabName(tsvName), columns,
+                                                        streamConverters(attr, columns))
+        self.runValues = [date.today(), source]
+
+    def write(self, parsed):
+        for attr, sheet in self.sheets.items():
+            if attr == "suppressed":
+                continue
+            data = getattr(parsed, attr)
+            if attr == "parcel":
+                sheet.write(data.values())
+                if self.master:
+                    self.master.write(padded(data.values(), len(sheet.columns)) + self.runValues)
+                continue
+            for rec in data:
+                sheet.write(rec.values())
+
+    def writeProblem(self, pid):
+        pass
+
+    def writeSuppressed(self, pid):
+        if "suppressed" in self.sheets:
+            self.sheets["suppressed"].write([pid, "Information suppressed due to the request of the taxpayer"])
+
+    def close(self):
+        self.workbook.close()
+
+
+def padded(values, width):
+    values = list(values[:width])
+    return values + [None] * (width - len(values))
+
+
+'''
+masterSheet() - the master tab, with the rows of the older snapshots already written
+'''
+def masterSheet(workbook, columns, snapshots, fe=sys.stderr):
+    master = workbook.sheet(masterTab, columns + masterExtras,
+                            streamConverters("parcel", columns) + [toDateTime, toStr])
+    for fileName in snapshots:
+        extras = [runDate(fileName), os.path.basename(fileName)]
+        count = 0
+        for values in snapshotRows(fileName, columns):
+            master.write(values + extras)
+            count += 1
+        print("%s: %d rows to %s" % (fileName, count, masterTab), file=fe)
+    return master
+
+
+'''
+writeWorkbook() - a workbook of .tsv files: a tab for each file (a directory
+stands for the output files in it), and the master tab of the --master
+snapshots plus any ScrapeDataXX.tsv
+'''
+def writeWorkbook(fileName, paths, master=(), fe=sys.stderr):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for attr, f in outputFiles
+                         if os.path.exists(os.path.join(path, f)))
+        else:
+            files.append(path)
+    parcelFiles = [f for f in files if streamFiles.get(os.path.basename(f)) == "parcel"]
+    prefix = len(set(os.path.dirname(os.path.abspath(f)) for f in files)) > 1
+
+    workbook = XlsxWriter(fileName)
+    masterRows = None
+    if parcelFiles or master:
+        from parcelStore import currentColumns
+        columns = next(readRows(parcelFiles[0]), [currentColumns()])[0] if parcelFiles else currentColumns()
+        masterRows = masterSheet(workbook, columns, list(master) + parcelFiles, fe)
+    for f in files:
+        name = tabName(f)
+        if prefix:
+            name = "%s %s" % (os.path.basename(os.path.dirname(os.path.abspath(f))), name)
+        sheet = None
+        for heading, row in readRows(f):
+            if sheet is None:
+                sheet = workbook.sheet(name, heading, streamConverters(streamFiles.get(os.path.basename(f)), heading))
+            if len(row) > 1 and fillerPattern.search(row[1]) and "Suppressed" not in f:
+                continue
+            sheet.write(row)
+        print("%s: %d rows to tab %s" % (f, sheet.rows - 1 if sheet else 0, name), file=fe)
+    workbook.close()
+    return len(workbook.sheets), masterRows.rows - 1 if masterRows else 0
+
+
+'''
+Main Function
+'''
+
+
+def main(argv=None):
+    try:
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('paths', nargs='+',
+                            help="Scrape output directories, or .tsv files (one tab each)")
+        parser.add_argument("-o", '--outfile', required=True, help="The .xlsx to write")
+        parser.add_argument("-e", '--errfile', nargs='?',
+                            type=argparse.FileType('w'), default=sys.stderr)
+        parser.add_argument('--master', nargs='*', default=[], metavar="TSV",
+                            help="Older snapshots (Output/*.tsv) for the %s tab" % masterTab)
+        theArgs = parser.parse_args(argv)
+    except:
+        return "Error parsing arguments"
+
+    fe = theArgs.errfile
+    start = datetime.now()
+    try:
+        tabs, masterCount = writeWorkbook(theArgs.outfile, theArgs.paths, theArgs.master, fe)
+    except OSError as e:
+        return "Can't write the workbook: %s" % e
+    print("%s: %d tabs, %d rows in %s (%s)" % (theArgs.outfile, tabs, masterCount, masterTab,
+                                               datetime.now() - start), file=fe)
+
+
+if __name__ == "__main__":
+    sys.exit(main())